@@ -1,18 +1,34 @@
 from flask import Flask, render_template, Response, jsonify, request
-import cv2
-import threading
-import time
+import atexit
 import os
-import numpy as np
+import tempfile
 
 # Generacion de PDFs
 from fpdf import FPDF
 
-# Importar los detectores de pose
-from utils.shoulder_press_flask import ShoulderPressDetector
-from utils.flexiones_prueba_flask import PushupDetector
-from utils.sentadilla_trasera_prueba_analiza_flask import SquatDetector
-from utils.peso_muerto_prueba_analiza_flask import DeadliftDetector
+# Sesiones de detección en vivo: cada estación tiene su cámara, su detector y su stream
+from utils.pipeline_session import SessionRegistry, DEFAULT_SESSION_ID
+
+# Procesos de inferencia de pose (opcional) para atender varias estaciones en paralelo
+from utils.inference_pool import PoseInferencePool
+
+# Detectores disponibles y rutas de sus datasets de landmarks
+from utils.detector_factory import DETECTOR_CLASSES, default_csv_path
+
+# Análisis offline de series grabadas
+from utils.video_analysis import analyze_video
+
+# Escritura por lotes (en segundo plano) de los landmarks exportados por los detectores
+from utils.landmark_writer import flush_landmarks, get_landmark_writer
+
+# Datasets de landmarks segmentados por sesión (solo se añaden filas, nunca se borran)
+from utils.landmark_dataset import get_dataset
+
+# Cola de trabajos de entrenamiento en segundo plano
+from utils.training_jobs import TrainingJobQueue
+
+# Entrenamiento incremental con las filas exportadas por los detectores
+from utils.incremental_trainer import IncrementalTrainer, incremental_model_path
 
 # Importar la función para entrenar y evaluar el modelo
 # Asegurarse de que 'model' exista y tenga la función 'entrenar_y_evaluar_modelo'
@@ -21,31 +37,23 @@ from model_3 import entrenar_y_evaluar_modelo
 app = Flask(__name__)
 
 # CONFIGURACIÓN GLOBAL
-cap = None
-current_detector = None
-output_frame = None
-latest_exercise_data = {}
-processing_active = False
-frame_lock = threading.Lock()
-data_lock = threading.Lock()
-pose_detection_paused = False 
-
-active_detectors = {
-    "shoulder_press": ShoulderPressDetector(csv_file_path=os.path.join(os.getcwd(), 'data', 'coords_press_hombro.csv')),
-    "pushups": PushupDetector(csv_file_path=os.path.join(os.getcwd(), 'data', 'coords_flexiones.csv')),
-    "squats": SquatDetector(csv_file_name=os.path.join(os.getcwd(), 'data', 'coords_sentadilla.csv')),
-    "deadlift": DeadliftDetector(csv_file_name=os.path.join(os.getcwd(), 'data', 'coords_peso_muerto.csv'))
-}
+# Número de procesos de inferencia de pose. Con 0 cada detector ejecuta MediaPipe en el proceso de Flask
+INFERENCE_WORKERS = int(os.environ.get('TFM_INFERENCE_WORKERS', '0'))
+inference_pool = PoseInferencePool(INFERENCE_WORKERS) if INFERENCE_WORKERS > 0 else None
+
+# Frecuencia objetivo (Hz) de la detección de pose. Con 0 se procesa cada fotograma;
+# con un valor > 0 los fotogramas intermedios reutilizan los landmarks interpolados
+INFERENCE_HZ = float(os.environ.get('TFM_INFERENCE_HZ', '0'))
+
+# Detectores reutilizables en reposo por ejercicio y segundos de inactividad tras los que se cierran
+DETECTOR_POOL_SIZE = int(os.environ.get('TFM_DETECTOR_POOL_SIZE', '2'))
+DETECTOR_IDLE_TIMEOUT = float(os.environ.get('TFM_DETECTOR_IDLE_TIMEOUT', '300'))
 
 # Rutas a los archivos CSV de coordenadas para cada ejercicio
-CSV_PATHS = {
-    "squats": os.path.join(os.getcwd(), 'data', 'coords_sentadilla.csv'),
-    "pushups": os.path.join(os.getcwd(), 'data', 'coords_flexiones.csv'),
-    "deadlift": os.path.join(os.getcwd(), 'data', 'coords_peso_muerto.csv'),
-    "shoulder_press": os.path.join(os.getcwd(), 'data', 'coords_press_hombro.csv'),
-}
+# (con TFM_LANDMARK_FORMAT=lmk son los almacenes binarios 'coords_*.lmk')
+CSV_PATHS = {exercise_type: default_csv_path(exercise_type) for exercise_type in DETECTOR_CLASSES}
 
-# Rutas para guardar los modelos entrenados
+# Rutas lógicas de los modelos entrenados (el registro guarda además cada versión como '<nombre>.vNNNN.pkl')
 MODEL_PATHS = {
     "squats": os.path.join(os.getcwd(), 'models', 'sentadilla_model.pkl'),
     "pushups": os.path.join(os.getcwd(), 'models', 'flexiones_model.pkl'),
@@ -53,198 +61,112 @@ MODEL_PATHS = {
     "shoulder_press": os.path.join(os.getcwd(), 'models', 'press_hombro_model.pkl'),
 }
 
+# Procesos para entrenar a la vez los modelos candidatos de '/analyze_exercise' (0: uno por candidato, hasta el número de núcleos)
+TRAIN_WORKERS = int(os.environ.get('TFM_TRAIN_WORKERS', '0'))
 
-# Configuracion para guardar PDFs de Feedback
-PDF_SAVE_DIR = "feedback_pdfs"
-os.makedirs(PDF_SAVE_DIR, exist_ok=True)
-
-
-# FUNCIONES DE PROCESAMIENTO DE VIDEO EN VIVO
-def start_video_processing(detector_key, camera_id=0): 
-    global cap, current_detector, processing_active, output_frame, latest_exercise_data, pose_detection_paused
-
-    # Detener cualquier procesamiento activo antes de iniciar uno nuevo
-    if processing_active:
-        print("Ya hay un procesamiento activo. Deteniéndolo primero.")
-        stop_video_processing()
-        time.sleep(0.5) # Pequeña pausa para asegurar que el hilo anterior se cierre
-
-    # Reiniciar current_detector a None antes de asignarlo para el nuevo ejercicio
-    current_detector = None 
-    
-    # Limpiar el último fotograma y datos de ejercicio al iniciar un nuevo stream
-    with frame_lock:
-
-        output_frame = None 
-
-    with data_lock:
-        
-        latest_exercise_data = {
-            "reps": 0,
-            "incorrect_reps": 0,
-            "stage": "Inicializando..." # Estado inicial mientras la cámara se abre
-        }
-
-
-    if detector_key in active_detectors:
-        current_detector = active_detectors[detector_key]
-        print(f"Iniciando detección para: {detector_key}")
-    else:
-        print(f"Error: Detector '{detector_key}' no encontrado. No se iniciará la detección de pose para este tipo de ejercicio.")
-        processing_active = False 
-        with data_lock:
-
-            latest_exercise_data = {
-                "reps": 0,
-                "incorrect_reps": 0,
-                "stage": "ERROR: Ejercicio no válido"
-            }
-        return
+# Presupuesto de memoria (MB) del dataset al entrenar (0: sin límite) y muestreo si no cabe ('stratified' o 'reservoir')
+TRAIN_MEMORY_MB = float(os.environ.get('TFM_TRAIN_MEMORY_MB', '0'))
+TRAIN_SAMPLING = os.environ.get('TFM_TRAIN_SAMPLING', 'stratified')
 
-    # Reiniciar contadores y datos del detector seleccionado antes de iniciar el procesamiento
-    current_detector.reset_counters() # Asegurarse de que los detectores tienen un método reset_counters()
-    
+# Segundos de búsqueda de hiperparámetros por eliminación sucesiva en cada entrenamiento (0: hiperparámetros por defecto)
+TRAIN_SEARCH_BUDGET_S = float(os.environ.get('TFM_TRAIN_SEARCH_S', '0'))
 
-    cap = cv2.VideoCapture(camera_id) # 0 para la webcam por defecto
-    if not cap.isOpened():
+# Pliegues de la validación cruzada con la que se elige el mejor modelo (0: un único conjunto de prueba;
+# se ignora si TFM_TRAIN_SEARCH_S activa la búsqueda)
+TRAIN_CV_FOLDS = int(os.environ.get('TFM_TRAIN_CV_FOLDS', '0'))
 
-        print("Error: No se pudo abrir la cámara. Asegúrate de que esté conectada y no esté en uso.")
-        processing_active = False
-        with data_lock:
+# Entrenar con ángulos, proporciones y orientación del torso en lugar de las 132 coordenadas (TFM_TRAIN_FEATURES=1)
+TRAIN_FEATURES = os.environ.get('TFM_TRAIN_FEATURES', '0') == '1'
 
-            latest_exercise_data["stage"] = "ERROR: Cámara no disponible"
+# Hilos que atienden la cola de entrenamientos de '/analyze_exercise' (cada uno entrena un ejercicio)
+TRAIN_JOB_WORKERS = int(os.environ.get('TFM_TRAIN_JOB_WORKERS', '1'))
+training_jobs = TrainingJobQueue(workers=TRAIN_JOB_WORKERS)
 
-        return
+# Entrenamiento incremental (TFM_INCREMENTAL_TRAINING=1): cada lote de landmarks exportado actualiza
+# el modelo '<nombre>.incremental.pkl' del ejercicio, que se publica cada TFM_INCREMENTAL_SNAPSHOT_S segundos
+INCREMENTAL_TRAINING = os.environ.get('TFM_INCREMENTAL_TRAINING', '0') == '1'
+incremental_trainers = {}
+if INCREMENTAL_TRAINING:
 
+    for exercise_type, model_path in MODEL_PATHS.items():
 
-    processing_active = True
-    pose_detection_paused = False # Asegurarse de que no esté pausado al iniciar un nuevo feed
-    print("Cámara abierta y procesamiento iniciado.")
+        trainer = IncrementalTrainer(exercise_type, model_path,
+                                     snapshot_interval=float(os.environ.get('TFM_INCREMENTAL_SNAPSHOT_S', '30')))
+        get_landmark_writer().add_listener(trainer.on_rows)
+        incremental_trainers[exercise_type] = trainer
 
-    while processing_active:
+    def close_incremental_trainers():
 
-        ret, frame = cap.read()
+        # Los hooks de atexit se ejecutan en orden inverso: el de 'landmark_writer' iría después
+        # de cerrar los entrenadores. Primero se escriben (y se les entregan) las filas pendientes
+        flush_landmarks()
+        for trainer in incremental_trainers.values():
 
-        if not ret:
+            trainer.close()
 
-            print("Error: No se pudo leer el fotograma. Deteniendo procesamiento.")
-            processing_active = False 
+    atexit.register(close_incremental_trainers)
 
-            with data_lock:
+# Clasificación en vivo de cada fotograma con el modelo entrenado del ejercicio (TFM_LIVE_MODEL=1),
+# o con el modelo incremental (TFM_LIVE_MODEL=incremental) en cuanto se haya publicado una versión
+LIVE_MODEL_SOURCE = os.environ.get('TFM_LIVE_MODEL', '0')
+LIVE_MODEL = LIVE_MODEL_SOURCE in ('1', 'incremental')
+if LIVE_MODEL_SOURCE == 'incremental':
 
-                latest_exercise_data["stage"] = "ERROR: Stream de cámara falló"
+    LIVE_MODEL_PATHS = {exercise_type: incremental_model_path(path) for exercise_type, path in MODEL_PATHS.items()}
+else:
 
-            break
+    LIVE_MODEL_PATHS = MODEL_PATHS
 
-        processed_img = frame.copy() 
-        current_exercise_data = latest_exercise_data # Obtener los últimos datos para mantenerlos si está pausado
+# Registro de sesiones activas (una por estación/cámara)
+sessions = SessionRegistry(inference_pool=inference_pool, inference_hz=INFERENCE_HZ,
+                           detector_pool_size=DETECTOR_POOL_SIZE, detector_idle_timeout=DETECTOR_IDLE_TIMEOUT,
+                           model_paths=LIVE_MODEL_PATHS if LIVE_MODEL else None)
 
-        if not pose_detection_paused and current_detector: # Solo procesar si no está pausado y hay un detector
-            processed_img, current_exercise_data = current_detector.process_frame(frame)
 
-        elif pose_detection_paused:
-            # Si está pausado, puedes mostrar un mensaje en el frame original
-            cv2.putText(processed_img, 'PAUSADO', (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3, cv2.LINE_AA)
-
-        elif not current_detector: # Caso de error si no hay detector (aunque el flujo debería prevenir esto)
-            cv2.putText(processed_img, 'ERROR: Detector no inicializado', (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3, cv2.LINE_AA)
-
-        # Convertir el fotograma procesado a JPEG para el stream
-        ret, jpeg = cv2.imencode('.jpg', processed_img)
-        if ret:
+# Configuracion para guardar PDFs de Feedback
+PDF_SAVE_DIR = "feedback_pdfs"
+os.makedirs(PDF_SAVE_DIR, exist_ok=True)
 
-            with frame_lock:
 
-                output_frame = jpeg.tobytes()
+# FUNCIONES DE PROCESAMIENTO DE VIDEO EN VIVO
+def get_session_id():
 
-            with data_lock:
+    """
+    Obtiene el identificador de sesión de la petición (query '?session_id=' o cuerpo JSON).
+    Si no se indica, se usa la sesión por defecto.
+    """
+    session_id = request.args.get('session_id')
+    if not session_id and request.is_json:
 
-                # Solo actualizar los datos de ejercicio si la detección NO está pausada
-                if not pose_detection_paused:
+        session_id = (request.get_json(silent=True) or {}).get('session_id')
+    return session_id or DEFAULT_SESSION_ID
 
-                    latest_exercise_data = current_exercise_data # Actualizar con los datos más recientes
-        
-        # Pequeña pausa para no saturar la CPU
-        time.sleep(0.01) # ~100 FPS 
+def get_camera_id():
 
-    print("Bucle de procesamiento de video finalizado.")
-    stop_video_processing_resources() # Asegura que los recursos se liberen al salir del bucle
+    """
+    Obtiene la fuente de video de la petición ('?camera='): un índice de cámara o una URL/ruta.
+    """
+    camera = request.args.get('camera', '0')
+    return int(camera) if camera.isdigit() else camera
 
-def stop_video_processing_resources():
-    
-    global cap
-    if cap:
+def stop_video_processing(session_id=None):
 
-        print("Liberando recursos de la cámara...")
-        cap.release()
-    cap = None # Asegurar que cap se resetee a None
-    print("Recursos de video liberados.")
+    # Detiene una sesión concreta o, si no se indica, todas las sesiones
+    if session_id is None:
 
-def stop_video_processing():
+        sessions.stop_all()
+        flush_landmarks()
+        return
 
-    global processing_active, latest_exercise_data, pose_detection_paused
-    if processing_active:
+    if sessions.stop(session_id):
 
-        print("Solicitando detención del procesamiento de video...")
-        processing_active = False
-        pose_detection_paused = False # Asegurarse de resetear el estado de pausa al detener completamente
-        # Dar un pequeño tiempo para que el hilo termine su ejecución
-        time.sleep(0.5) 
-        stop_video_processing_resources() # Llamar a la función que libera recursos
-        print("Procesamiento de video detenido completamente.")
+        print(f"[{session_id}] Procesamiento de video detenido completamente.")
     else:
 
-        print("El procesamiento de video ya está detenido.")
-
-    # Restablecer los datos del ejercicio al detener el procesamiento
-    with data_lock:
-
-        latest_exercise_data = {
-
-            "reps": 0,
-            "incorrect_reps": 0,
-            "stage": "Detenido" # Estado al detener
-        }
-
-
-# Función generadora para el stream de video (MJPEG)
-def generate_frames():
-
-    global output_frame, processing_active, frame_lock
-
-    # Esperar a que el hilo de procesamiento se active y produzca el primer fotograma
-    # Añadir un tiempo de espera para evitar un bucle infinito si el procesamiento nunca comienza
-    timeout_start = time.time()
-    # Espera hasta que el procesamiento esté activo Y haya un fotograma disponible
-    while not processing_active or output_frame is None:
-
-        if time.time() - timeout_start > 15:  # 15 segundos de timeout para dar tiempo a la inicialización
-
-            print("Tiempo de espera agotado: El procesamiento de video no se inició o no produjo un fotograma en 15 segundos.")
-            # Si hay un error, puedes intentar enviar un fotograma de "error"
-            error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(error_frame, 'ERROR: Camara no disponible', (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
-            ret, jpeg = cv2.imencode('.jpg', error_frame)
-
-            if ret:
-
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            break
-        time.sleep(0.1) # Pequeña pausa para evitar el uso excesivo de CPU
-
-    # Ahora, el bucle principal para enviar fotogramas
-    while processing_active:
-
-        with frame_lock:
-
-            if output_frame is not None:
-
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + output_frame + b'\r\n')
-        time.sleep(0.03) # Controla la tasa de fotogramas enviados al navegador (ej. ~30 FPS)
-    print("Generador de frames finalizado.")
+        print(f"[{session_id}] El procesamiento de video ya está detenido.")
 
+    # Dejar en disco los landmarks de la serie antes de que se pueda entrenar con ellos
+    flush_landmarks()
 
 
 def get_next_feedback_filename(): 
@@ -276,52 +198,97 @@ def index():
 @app.route('/video_feed/<exercise_type>')
 def video_feed(exercise_type):
 
-    # Inicia el procesamiento de video en un hilo separado
-    # Esto es crucial para que Flask no bloquee la interfaz de usuario
-
-    # Iniciar el nuevo procesamiento con el detector solicitado
-    # El threading.Thread se inicia en modo daemon para que se cierre con la aplicación Flask
-    thread = threading.Thread(target=start_video_processing, args=(exercise_type,))
-    thread.daemon = True 
-    thread.start()
+    # Inicia (o reinicia) la sesión indicada con el detector solicitado.
+    # El procesamiento corre en un hilo daemon propio de la sesión para no bloquear Flask
+    session = sessions.start(get_session_id(), exercise_type, get_camera_id())
 
     # Retorna la respuesta para el stream MJPEG
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(session.broadcaster.stream(first_frame_timeout=15), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/video_stream')
+def video_stream():
+
+    # Permite que clientes adicionales (TV, tablet del entrenador...) vean el stream de una sesión
+    # sin reiniciar el procesamiento; todos comparten el mismo fotograma codificado
+    session = sessions.get(get_session_id())
+    if session is None:
+
+        return "Sesión no encontrada", 404
+    return Response(session.broadcaster.stream(first_frame_timeout=15), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/stop_feed')
 def stop_feed():
 
-    # Ruta para detener el stream de video de forma explícita
-    stop_video_processing()
+    # Ruta para detener el stream de video de una sesión de forma explícita
+    stop_video_processing(get_session_id())
     return "Video feed stopped", 200
 
 @app.route('/exercise_data')
 def get_exercise_data():
 
-    # Ruta para obtener los últimos datos del ejercicio vía AJAX (polling)
-    global latest_exercise_data
-    with data_lock:
+    # Ruta para obtener los últimos datos del ejercicio de una sesión vía AJAX (polling)
+    session = sessions.get(get_session_id())
+    if session is None:
+
+        return jsonify({"reps": 0, "incorrect_reps": 0, "stage": "Detenido"})
+    return jsonify(session.get_exercise_data())
+
+@app.route('/sessions')
+def list_sessions():
+
+    # Lista las sesiones registradas con su estado y estadísticas de captura/stream
+    return jsonify(sessions.describe())
+
+@app.route('/incremental_training')
+def incremental_training():
 
-        # Aquí se puede añadir cualquier transformación o filtrado si es necesario
-        return jsonify(latest_exercise_data)
+    # Estado del entrenamiento incremental de cada ejercicio (filas vistas, versiones publicadas, exactitud)
+    return jsonify({exercise_type: trainer.stats() for exercise_type, trainer in incremental_trainers.items()})
 
 # Ruta para pausar/reanudar la deteccion 
 @app.route('/toggle_detection_pause', methods=['POST'])
 def toggle_detection_pause():
 
-    global pose_detection_paused, current_detector, processing_active # Asegurarse de incluir processing_active aquí
-    # Solo alternar si hay un detector actualmente activo y el procesamiento está activo
-    if current_detector and processing_active:
+    session_id = get_session_id()
+    session = sessions.get(session_id)
+    # Solo alternar si la sesión existe y su procesamiento está activo
+    if session is not None and session.processing_active:
 
-        pose_detection_paused = not pose_detection_paused
-        status_message = "Pausado" if pose_detection_paused else "Reanudado"
-        print(f"Detección de pose: {status_message}")
+        status_message = "Pausado" if session.toggle_pause() else "Reanudado"
+        print(f"[{session_id}] Detección de pose: {status_message}")
         return jsonify({"status": status_message}), 200
     # Si no hay detector activo o el procesamiento no está en marcha, no se puede pausar/reanudar.
     return jsonify({"status": "No hay detección activa para pausar/reanudación"}), 400
 
 
-# Ruta para analisis de datos del modelo 
+# Entrenamiento de un ejercicio (se ejecuta en un hilo de la cola de trabajos)
+def run_training(exercise_type, progress=None):
+
+    csv_file = CSV_PATHS[exercise_type]
+    model_output_file = MODEL_PATHS[exercise_type]
+    progress = progress or (lambda event, **details: None)
+
+    # Incorporar al dataset de entrenamiento los segmentos de las sesiones terminadas
+    progress("stage", name="compacting")
+    get_dataset(exercise_type).compact()
+
+    # entrenar_y_evaluar_modelo devuelve un diccionario con todas las métricas y datos de
+    # gráficos necesarios, e informa del progreso de cada modelo candidato
+    analysis_results = entrenar_y_evaluar_modelo(csv_file, model_output_file, workers=TRAIN_WORKERS or None, progress=progress,
+                                                 memory_budget_mb=TRAIN_MEMORY_MB or None, sampling=TRAIN_SAMPLING,
+                                                 search_budget_s=TRAIN_SEARCH_BUDGET_S or None, cv_folds=TRAIN_CV_FOLDS or None,
+                                                 features=TRAIN_FEATURES)
+    if not analysis_results:
+
+        print(f"Fallo en el entrenamiento del modelo para {exercise_type}. La función retornó None o un valor vacío.")
+        raise RuntimeError("Fallo en el entrenamiento o evaluación del modelo")
+
+    analysis_results["status"] = "success"
+    print(f"Análisis exitoso para {exercise_type}.")
+    return analysis_results
+
+
+# Ruta para analisis de datos del modelo: encola el entrenamiento y devuelve el id del trabajo
 @app.route('/analyze_exercise', methods=['POST'])
 def analyze_exercise():
 
@@ -332,34 +299,64 @@ def analyze_exercise():
 
         return jsonify({"error": "Tipo de ejercicio no válido o rutas de archivo no configuradas"}), 400
 
-    csv_file = CSV_PATHS[exercise_type]
-    model_output_file = MODEL_PATHS[exercise_type]
+    # Dos peticiones del mismo ejercicio comparten un único trabajo
+    job, coalesced = training_jobs.submit(exercise_type, run_training, exercise_type)
+    return jsonify({
+        "job_id": job.job_id,
+        "status": job.status,
+        "coalesced": coalesced,
+        "status_url": f"/analyze_exercise/{job.job_id}",
+    }), 202
+
+
+# Estado de un trabajo de entrenamiento: progreso por modelo candidato y, al terminar, los resultados
+@app.route('/analyze_exercise/<job_id>')
+def analyze_exercise_status(job_id):
+
+    job = training_jobs.get(job_id)
+    if job is None:
+
+        return jsonify({"error": "Trabajo de entrenamiento no encontrado", "status": "error"}), 404
+    return jsonify(job.snapshot()), 200
+
+
+# Ruta para analizar una serie grabada (subida como archivo de video)
+@app.route('/analyze_video', methods=['POST'])
+def analyze_video_route():
+
+    exercise_type = request.form.get('exercise_type')
+    video_file = request.files.get('video')
+
+    if video_file is None or not video_file.filename:
+
+        return jsonify({"error": "No se recibió ningún archivo de video", "status": "error"}), 400
+
+    # El video se guarda en un archivo temporal porque OpenCV necesita una ruta
+    suffix = os.path.splitext(video_file.filename)[1] or '.mp4'
+    fd, video_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
 
     try:
 
-        # Llama a la función real de entrenamiento y evaluación del modelo
-        # entrenar_y_evaluar_modelo devuelve un diccionario
-        # con todas las métricas y datos de gráficos necesarios.
-        analysis_results = entrenar_y_evaluar_modelo(csv_file, model_output_file)
+        video_file.save(video_path)
+        results = analyze_video(video_path, exercise_type)
+        results["video"] = video_file.filename
+        results["status"] = "success"
+        return jsonify(results), 200
 
-        if analysis_results:
+    except ValueError as e:
 
-            # Asegurarse de que el status sea 'success' si la función devuelve resultados
-            # y los datos existen.
-            analysis_results["status"] = "success"
-            print(f"Análisis exitoso para {exercise_type}. Devolviendo resultados.")
-            return jsonify(analysis_results), 200
-        
-        else:
+        return jsonify({"error": str(e), "status": "error"}), 400
 
-            print(f"Fallo en el entrenamiento del modelo para {exercise_type}. La función retornó None o un valor vacío.")
-            return jsonify({"error": "Fallo en el entrenamiento o evaluación del modelo", "status": "failed"}), 500
-        
     except Exception as e:
 
-        print(f"Error durante el análisis del ejercicio {exercise_type}: {e}")
+        print(f"Error durante el análisis del video: {e}")
         return jsonify({"error": f"Error interno del servidor durante el análisis: {str(e)}", "status": "error"}), 500
 
+    finally:
+
+        os.remove(video_path)
+
 # Ruta para el formulario de feedback
 @app.route('/feedback_form')
 def feedback_form():
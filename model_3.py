@@ -1,7 +1,10 @@
 import csv
 import os
+import time
+from concurrent.futures import as_completed
 import numpy as np
 import pandas as pd
+import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
@@ -18,29 +21,236 @@ from sklearn.metrics import (
     precision_recall_curve,
     classification_report # Para el reporte de clasificacion completo
 )
-import pickle
+
+from utils.analysis_cache import get_analysis_cache
+from utils.compiled_model import check_agreement, compile_pipeline, compiled_model_path
+from utils.cross_validation import CrossValidation
+from utils.hyperparameter_search import DEFAULT_ETA, HyperparameterSearch, describe_space
+from utils.landmark_loader import load_landmark_sample
+from utils.memory_monitor import PeakMemoryMonitor
+from utils.model_registry import remove_model, save_model
+from utils.pose_features import FEATURE_NAMES, PoseFeatures
+from utils.process_pool import spawn_executor
+
+# Division entrenamiento/prueba (parte de la configuracion que identifica un entrenamiento en la cache)
+TEST_SIZE = 0.3
+SPLIT_RANDOM_STATE = 1234
+
+# FUNCION: PIPELINES CANDIDATOS
+def crear_pipelines(rf_jobs=None, features=False):
+    """
+    Pipelines candidatos que se entrenan para cada ejercicio.
+
+    :param rf_jobs: Hilos del RandomForest ('n_jobs'); GradientBoosting no admite paralelismo interno.
+    :param features: Anteponer 'PoseFeatures': los modelos aprenden de angulos articulares,
+                     proporciones y orientacion del torso en lugar de las 132 coordenadas.
+    """
+    pipelines = {
+        'lr': make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, solver='liblinear', random_state=1234)), 
+        'rc': make_pipeline(StandardScaler(), RidgeClassifier(random_state=1234)), # RidgeClassifier no tiene predict_proba
+        'rf': make_pipeline(StandardScaler(), RandomForestClassifier(random_state=1234, n_jobs=rf_jobs)),
+        'gb': make_pipeline(StandardScaler(), GradientBoostingClassifier(random_state=1234)),
+    }
+    if features:
+
+        pipelines = {algo: make_pipeline(PoseFeatures(), *(step for _, step in pipeline.steps)) for algo, pipeline in pipelines.items()}
+    return pipelines
+
+
+# FUNCION: CONFIGURACION DEL ENTRENAMIENTO
+def configuracion_entrenamiento(search_budget_s=None, cv_folds=None, features=False):
+    """
+    Todo lo que, ademas de los datos, determina el resultado de un entrenamiento: si algo
+    de esto cambia, los resultados guardados en la cache de analisis dejan de usarse.
+
+    :param search_budget_s: Presupuesto de la busqueda de hiperparametros (None: sin busqueda).
+    :param cv_folds: Pliegues de la validacion cruzada (None: seleccion por el conjunto de prueba).
+                     No se usa si hay busqueda de hiperparametros.
+    :param features: Entrenar con las caracteristicas de pose en lugar de las coordenadas.
+    """
+    config = {
+        "pipelines": {algo: repr(pipeline.get_params(deep=True)) for algo, pipeline in crear_pipelines(features=features).items()},
+        "test_size": TEST_SIZE,
+        "split_random_state": SPLIT_RANDOM_STATE,
+        "sklearn": sklearn.__version__,
+    }
+    if search_budget_s:
+
+        config["search"] = {"budget_s": float(search_budget_s), "eta": DEFAULT_ETA, "space": describe_space()}
+    elif cv_folds:
+
+        config["cv_folds"] = int(cv_folds)
+    if features:
+
+        config["pose_features"] = FEATURE_NAMES
+    return config
+
+
+# FUNCION: ENTRENAR UN CANDIDATO
+def entrenar_candidato(algo, pipeline, X_train, y_train, X_test, y_test):
+    """
+    Entrena y evalua un pipeline candidato. Se ejecuta en el proceso principal o en un
+    proceso del pool, por lo que devuelve un diccionario en lugar de imprimir.
+
+    :return: Diccionario con el modelo (o None si falla), sus metricas, el tiempo de
+             entrenamiento ('fit_s') y el error, si lo hubo.
+    """
+    start = time.perf_counter()
+    try:
+        model = pipeline.fit(X_train, y_train)
+        fit_s = time.perf_counter() - start
+
+        # Los hilos solo aceleran el entrenamiento: el modelo guardado predice en un solo hilo,
+        # que es mas rapido para las filas sueltas de la clasificacion en vivo
+        if 'n_jobs' in model[-1].get_params():
+
+            model[-1].set_params(n_jobs=None)
+
+        yhat = model.predict(X_test)
+        return {
+            "algo": algo,
+            "model": model,
+            "accuracy": accuracy_score(y_test, yhat),
+            "precision": precision_score(y_test, yhat, average='weighted', zero_division=0),
+            "recall": recall_score(y_test, yhat, average='weighted', zero_division=0),
+            "f1_score": f1_score(y_test, yhat, average='weighted', zero_division=0),
+            "fit_s": fit_s,
+            "wall_s": time.perf_counter() - start,
+            "error": None,
+        }
+    except Exception as e:
+
+        return {"algo": algo, "model": None, "fit_s": None, "wall_s": time.perf_counter() - start, "error": str(e)}
+
+
+def _sin_progreso(event, **details):
+
+    pass
+
+
+def _entrenar_candidatos(X_train, y_train, X_test, y_test, workers, progress=_sin_progreso, algos=None, features=False):
+
+    # Con un solo proceso se entrena en serie y el RandomForest usa todos los nucleos;
+    # en paralelo, cada proceso entrena un candidato y el RandomForest reparte los nucleos sobrantes
+    cpus = os.cpu_count() or 1
+    pipelines = crear_pipelines(rf_jobs=-1 if workers == 1 else max(1, cpus // workers), features=features)
+    if algos is not None:
+
+        pipelines = {algo: pipeline for algo, pipeline in pipelines.items() if algo in algos}
+
+    if workers == 1:
+
+        for algo, pipeline in pipelines.items():
+
+            progress("candidate", algo=algo, status="running")
+            yield entrenar_candidato(algo, pipeline, X_train, y_train, X_test, y_test)
+        return
+
+    with spawn_executor(workers) as executor:
+
+        futures = []
+        for algo, pipeline in pipelines.items():
+
+            futures.append(executor.submit(entrenar_candidato, algo, pipeline, X_train, y_train, X_test, y_test))
+            progress("candidate", algo=algo, status="running")
+        for future in as_completed(futures):
+
+            yield future.result()
+
 
 # FUNCION: ENTRENAR Y EVALUAR UN MODELO
-def entrenar_y_evaluar_modelo(csv_filename, model_output_filename):
+def entrenar_y_evaluar_modelo(csv_filename, model_output_filename, workers=None, use_cache=True, progress=None,
+                              memory_budget_mb=None, max_rows=None, sampling='stratified', search_budget_s=None,
+                              cv_folds=None, features=False):
     """
-    Carga los datos de un CSV, entrena varios modelos de clasificacion, los evalua,
+    Carga los datos de un CSV (o de un almacén binario '.lmk'), entrena varios modelos de clasificacion, los evalua,
     selecciona el modelo con la mejor exactitud (accuracy) y lo guarda.
     Ademas, calcula y devuelve metricas detalladas y datos para visualizaciones.
 
-    :param csv_filename: Ruta al archivo CSV con los datos de landmarks.
+    :param csv_filename: Ruta al archivo CSV (o '.lmk') con los datos de landmarks.
     :param model_output_filename: Nombre del archivo donde se guardara el mejor modelo entrenado (.pkl).
+    :param workers: Procesos para entrenar los candidatos a la vez (None: uno por candidato,
+                    hasta el numero de nucleos; 1: en serie en este proceso).
+    :param use_cache: Devolver los resultados guardados si el dataset y la configuracion no
+                      han cambiado desde el ultimo entrenamiento (ver 'AnalysisCache').
+    :param progress: Funcion opcional progress(evento, **detalles) que recibe la etapa actual
+                     ("stage", name=...) y el estado de cada candidato ("candidate", algo=...,
+                     status="running" | "done" | "failed", ...), p. ej. para un trabajo en segundo plano.
+    :param memory_budget_mb: Presupuesto en MB para el dataset en memoria (float32); si no
+                             cabe entero se muestrea (ver 'load_landmark_sample').
+    :param max_rows: Maximo de filas del dataset que se usan (None: todas las que quepan).
+    :param sampling: Muestreo cuando el dataset no cabe: 'stratified' (por clase) o 'reservoir'.
+    :param search_budget_s: Si se indica, en lugar de los hiperparametros por defecto se buscan los
+                            de cada familia por eliminacion sucesiva durante estos segundos
+                            (ver 'HyperparameterSearch'); los resultados incluyen el tiempo y la
+                            exactitud de cada configuracion en 'training.search'.
+    :param cv_folds: Si se indica, el mejor modelo se elige por la exactitud media de una validacion
+                     cruzada de estos pliegues sobre el entrenamiento (ver 'CrossValidation'), con
+                     media y varianza por candidato en 'training.cv'. Con la busqueda se ignora (con un aviso).
+    :param features: Entrenar sobre las caracteristicas de 'PoseFeatures' (angulos, proporciones
+                     y orientacion del torso) en lugar de las 132 coordenadas; el modelo guardado
+                     sigue recibiendo las filas de landmarks.
     :return: Un diccionario con metricas y datos para graficos, o None si hay un error.
     """
     print(f"\n--- Procesando dataset: {csv_filename} ---")
+    progress = progress or _sin_progreso
+    loading = {"memory_budget_mb": memory_budget_mb, "max_rows": max_rows, "sampling": sampling}
+
+    # Mismo contenido del dataset y misma configuracion: mismos resultados y mismo modelo
+    cache = get_analysis_cache() if use_cache else None
+    cache_key = None
+    if cache is not None and os.path.exists(csv_filename):
+
+        progress("stage", name="cache")
+        cache_key = cache.key(csv_filename, dict(configuracion_entrenamiento(search_budget_s, cv_folds, features), loading=loading))
+        cached_results = cache.get(cache_key, model_output_filename)
+        if cached_results is not None:
+
+            print(f"Resultados recuperados de la cache de analisis ({cache_key[:12]}): el dataset no ha cambiado.")
+            return cached_results
+
+    # Pico de memoria residente desde la carga del dataset hasta el final de la evaluacion
+    with PeakMemoryMonitor() as memory_monitor:
+
+        final_results = _entrenar_y_evaluar(csv_filename, model_output_filename, workers, progress, loading, search_budget_s, cv_folds, features)
+
+    if final_results is None:
+
+        return None
+
+    final_results["memory"].update(memory_monitor.report())
+    print(f"Memoria: {final_results['memory']}")
+
+    if cache_key is not None:
+
+        final_results["cache"] = {"hit": False, "key": cache_key}
+        cache.put(cache_key, final_results, model_output_filename)
+
+    return final_results
+
+
+def _entrenar_y_evaluar(csv_filename, model_output_filename, workers, progress, loading, search_budget_s, cv_folds, features):
+
     try:
 
-        df = pd.read_csv(csv_filename)
+        # Carga por bloques en float32 ('class' categorica), muestreada si no cabe en el presupuesto
+        progress("stage", name="loading")
+        df, dataset_info = load_landmark_sample(csv_filename, max_rows=loading["max_rows"],
+                                                memory_budget_mb=loading["memory_budget_mb"], strategy=loading["sampling"])
 
     except FileNotFoundError:
 
         print(f"Error: El archivo '{csv_filename}' no se encontro. Asegurate de que el CSV de landmarks existe.")
         return None
 
+    except ValueError as e:
+
+        print(f"Error: No se pudo cargar el dataset '{csv_filename}': {e}")
+        return None
+
+    print(f"Filas del dataset: {dataset_info['rows_total']}, usadas: {dataset_info['rows_used']} "
+          f"({dataset_info['strategy']}, {dataset_info['dataset_mb']} MB en memoria).")
+
     print(f"Cargando datos de '{csv_filename}'. Primeras 5 filas:")
     print(df.head())
     print(f"ultimas 5 filas:")
@@ -57,66 +267,110 @@ def entrenar_y_evaluar_modelo(csv_filename, model_output_filename):
         print(f"Error: El dataset '{csv_filename}' debe contener al menos 2 clases para la clasificacion. Clases encontradas: {df['class'].unique()}")
         return None
 
-    X = df.drop('class', axis=1) # Caracteristicas (landmarks)
-    y = df['class'] # Variable objetivo (clase de movimiento)
+    y = df.pop('class') # Variable objetivo (clase de movimiento)
+    X = df # Caracteristicas (landmarks): sin copiar el array float32
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=1234, stratify=y)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=SPLIT_RANDOM_STATE, stratify=y)
+    del X, df # Solo quedan las copias del split
     
     print(f"\nDimensiones de los conjuntos de datos:")
     print(f"X_train: {X_train.shape}, y_train: {y_train.shape}")
     print(f"X_test: {X_test.shape}, y_test: {y_test.shape}")
 
-    pipelines = {
-        'lr': make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, solver='liblinear', random_state=1234)), 
-        'rc': make_pipeline(StandardScaler(), RidgeClassifier(random_state=1234)), # RidgeClassifier no tiene predict_proba
-        'rf': make_pipeline(StandardScaler(), RandomForestClassifier(random_state=1234)),
-        'gb': make_pipeline(StandardScaler(), GradientBoostingClassifier(random_state=1234)),
-    }
-
     fit_models = {}
     model_accuracies = {} 
+    candidate_times = {}
     
-    print("\nEntrenando modelos...")
-    for algo, pipeline in pipelines.items():
-
-        try:
-            model = pipeline.fit(X_train, y_train)
-            fit_models[algo] = model
-            print(f"Modelo {algo} entrenado.")
-
-            yhat = model.predict(X_test)
-            current_accuracy = accuracy_score(y_test, yhat) 
-            model_accuracies[algo] = current_accuracy
-
-            # Imprimir todas las metricas para visibilidad
-            print(
-                f"{algo}: ",
-                f"Accuracy: {current_accuracy:.4f}, ",
-                f"Precision: {precision_score(y_test, yhat, average='weighted', zero_division=0):.4f}, ",
-                f"Recall: {recall_score(y_test, yhat, average='weighted', zero_division=0):.4f}, ",
-                f"F1-Score: {f1_score(y_test, yhat, average='weighted', zero_division=0):.4f}"
-            )
-
-        except Exception as e:
-            print(f"Error al entrenar o evaluar el modelo {algo}: {e}")
-            fit_models[algo] = None 
+    training_start = time.perf_counter()
+    progress("stage", name="training", candidates=list(crear_pipelines()))
+    search = None
+    cv = None
+    if search_budget_s:
+
+        if cv_folds:
+
+            print(f"Aviso: con la busqueda de hiperparametros no se usa la validacion cruzada ({cv_folds} pliegues).")
+
+        # Busqueda de hiperparametros: los candidatos son el mejor de cada familia
+        search = HyperparameterSearch(budget_s=search_budget_s, workers=workers, features=features)
+        workers = search.workers
+        print(f"\nBuscando hiperparametros ({len(search.records)} configuraciones, {search_budget_s} s, {workers} proceso(s))...")
+        candidates = search.run(X_train, y_train, X_test, y_test, progress)
+    elif cv_folds:
+
+        # Validacion cruzada con los pipelines por defecto; solo se reentrenan con todo el
+        # entrenamiento los candidatos que no se descartaron antes de tiempo
+        cv = CrossValidation(crear_pipelines(rf_jobs=1, features=features), n_splits=cv_folds, workers=workers)
+        print(f"\nValidacion cruzada ({cv_folds} pliegues, {cv.workers} proceso(s))...")
+        cv.run(X_train, y_train, progress)
+        for algo, info in cv.summary()["candidates"].items():
+
+            print(f"{algo}: {info['status']}, media {info['mean']}, varianza {info['var']}, pliegues {info['folds']}")
+        survivors = cv.survivors()
+        workers = max(1, min(workers or os.cpu_count() or 1, len(survivors) or 1))
+        candidates = _entrenar_candidatos(X_train, y_train, X_test, y_test, workers, progress, algos=survivors, features=features)
+    else:
+
+        workers = max(1, min(workers or os.cpu_count() or 1, len(crear_pipelines())))
+        print(f"\nEntrenando modelos ({workers} proceso(s))...")
+        candidates = _entrenar_candidatos(X_train, y_train, X_test, y_test, workers, progress, features=features)
+
+    for result in candidates:
 
-    # Seleccionar el mejor modelo basado en la exactitud
-    best_accuracy = -1
+        algo = result["algo"]
+        candidate_times[algo] = {"fit_s": result["fit_s"], "wall_s": round(result["wall_s"], 3), "error": result["error"]}
+        if result["error"] is not None:
+
+            print(f"Error al entrenar o evaluar el modelo {algo}: {result['error']}")
+            progress("candidate", algo=algo, status="failed", error=result["error"])
+            fit_models[algo] = None 
+            continue
+
+        fit_models[algo] = result["model"]
+        model_accuracies[algo] = result["accuracy"]
+        candidate_times[algo]["fit_s"] = round(result["fit_s"], 3)
+        print(f"Modelo {algo} entrenado en {result['fit_s']:.2f} s.")
+        progress("candidate", algo=algo, status="done", fit_s=candidate_times[algo]["fit_s"], accuracy=round(result["accuracy"], 4))
+
+        # Imprimir todas las metricas para visibilidad
+        print(
+            f"{algo}: ",
+            f"Accuracy: {result['accuracy']:.4f}, ",
+            f"Precision: {result['precision']:.4f}, ",
+            f"Recall: {result['recall']:.4f}, ",
+            f"F1-Score: {result['f1_score']:.4f}"
+        )
+
+    training_wall_s = time.perf_counter() - training_start
+    print(f"Candidatos entrenados en {training_wall_s:.2f} s.")
+
+    # Orden fijo de los candidatos: en paralelo terminan en cualquier orden y, ante un
+    # empate de exactitud, se elige el mismo modelo que en serie
+    model_accuracies = {algo: model_accuracies[algo] for algo in crear_pipelines() if algo in model_accuracies}
+
+    # Seleccionar el mejor modelo basado en la exactitud (con validacion cruzada, la media de los pliegues)
+    selection_scores = model_accuracies
+    if cv is not None:
+
+        cv_scores = cv.scores()
+        selection_scores = {algo: cv_scores[algo] for algo in model_accuracies}
+
+    best_score = -1
     best_model_name = None
     best_model = None
 
     print("\nDeterminando el mejor modelo...")
+    progress("stage", name="evaluating")
     if not model_accuracies:
 
         print("No se pudieron evaluar modelos para determinar el mejor.")
         return None
 
-    for algo, accuracy in model_accuracies.items():
+    for algo, score in selection_scores.items():
 
-        if accuracy > best_accuracy:
+        if score > best_score:
 
-            best_accuracy = accuracy
+            best_score = score
             best_model_name = algo
             best_model = fit_models[algo]
 
@@ -125,13 +379,45 @@ def entrenar_y_evaluar_modelo(csv_filename, model_output_filename):
         print(f"No se encontro un modelo adecuado para guardar para '{csv_filename}'.")
         return None
 
-    with open(model_output_filename, 'wb') as f:
+    best_accuracy = model_accuracies[best_model_name]
 
-        pickle.dump(best_model, f)
+    # Versión nueva escrita de forma atómica; las sesiones en vivo la recogen sin reiniciarse
+    save_model(best_model, model_output_filename, metadata={
+        "algorithm": best_model_name,
+        "accuracy": best_accuracy,
+        "dataset": os.path.basename(csv_filename),
+        "rows": dataset_info["rows_used"],
+    })
 
     print(f"\n¡exito! El mejor modelo para '{csv_filename}' es '{best_model_name}' con una exactitud de {best_accuracy:.4f}.")
     print(f"Modelo guardado como '{model_output_filename}'.")
 
+    # Predictor compilado de solo NumPy para la inferencia en vivo; solo se guarda si
+    # predice exactamente lo mismo que el pipeline en el conjunto de prueba
+    compiled_summary = {"path": None}
+    try:
+        compiled = compile_pipeline(best_model)
+        compiled_summary.update(check_agreement(best_model, compiled, X_test, y_test))
+        if compiled_summary["agreement"] == 1.0:
+
+            compiled_summary["path"] = compiled_model_path(model_output_filename)
+            save_model(compiled, compiled_summary["path"], metadata={
+                "algorithm": best_model_name,
+                "compiled_from": os.path.basename(model_output_filename),
+                "agreement": compiled_summary["agreement"],
+            })
+        else:
+
+            print(f"Advertencia: el modelo compilado no coincide con el original ({compiled_summary['agreement']:.4f}); no se guarda.")
+    except ValueError as e:
+
+        print(f"No se pudo compilar el modelo '{best_model_name}': {e}")
+
+    # Un compilado de un entrenamiento anterior ya no corresponde al pickle nuevo
+    if compiled_summary["path"] is None:
+
+        remove_model(compiled_model_path(model_output_filename))
+
     # CALCULAR Y PREPARAR DATOS PARA EL FRONEND 
     y_pred = best_model.predict(X_test)
     labels = sorted(y.unique()) # Asegura un orden consistente para las etiquetas
@@ -176,7 +462,7 @@ def entrenar_y_evaluar_modelo(csv_filename, model_output_filename):
     chart_data_reps = {
         "labels": ["Repeticiones Correctas", "Repeticiones Incorrectas"],
         "values": [int(num_correct_reps), int(num_incorrect_reps)], # Asegurarse de que sean enteros
-        "chart_title": f"Rendimiento de Repeticiones para {os.path.basename(csv_filename).replace('coords_', '').replace('.csv', '').replace('_', ' ').title()}"
+        "chart_title": f"Rendimiento de Repeticiones para {os.path.basename(csv_filename).replace('coords_', '').replace('.csv', '').replace('.lmk', '').replace('_', ' ').title()}"
     }
     print(f"DEBUG: chart_data_reps: {chart_data_reps}")
 
@@ -339,6 +625,16 @@ def entrenar_y_evaluar_modelo(csv_filename, model_output_filename):
         "roc_data": roc_data,
         "pr_data": pr_data,
         "classification_report_data": classification_report_data,
+        "compiled_model": compiled_summary,
+        "features": FEATURE_NAMES if features else None,
+        "memory": dict(dataset_info),
+        "training": {
+            "workers": workers,
+            "wall_s": round(training_wall_s, 3),
+            "candidates": candidate_times,
+            "search": search.summary() if search is not None else None,
+            "cv": cv.summary() if cv is not None else None,
+        },
     }
     print(f"DEBUG: Final analysis_results being returned: {final_results.keys()}")
     return final_results
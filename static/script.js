@@ -934,6 +934,50 @@ document.addEventListener('DOMContentLoaded', () => {
         console.warn("El botón #live-stop-detection no fue encontrado. Asegúrate de añadirlo a tu HTML.");
     }
      
+    /**
+     * Consulta cada segundo el estado de un trabajo de entrenamiento hasta que termina.
+     * Mientras tanto muestra en el loader el estado de cada modelo candidato.
+     * @param {string} jobId - Id del trabajo devuelto por POST /analyze_exercise.
+     * @param {HTMLElement} loader - Loader del análisis (puede ser null).
+     * @returns {Promise<Object>} Los resultados del análisis, o {status: 'failed', error} si falla.
+     */
+    function waitForAnalysisJob(jobId, loader) {
+
+        const loaderText = loader ? loader.querySelector('p') : null;
+        return new Promise((resolve, reject) => {
+
+            const poll = () => {
+
+                fetch(`/analyze_exercise/${jobId}`)
+                    .then(response => response.json())
+                    .then(job => {
+
+                        if (job.status === 'success') {
+
+                            resolve(job.results);
+                            return;
+                        }
+                        if (job.status !== 'queued' && job.status !== 'running') {
+
+                            resolve({ status: 'failed', error: job.error });
+                            return;
+                        }
+
+                        if (loaderText) {
+
+                            const candidates = Object.entries(job.candidates || {})
+                                .map(([algo, info]) => `${algo}: ${info.status}`)
+                                .join(', ');
+                            loaderText.textContent = `Entrenando y evaluando modelo... ${candidates}`;
+                        }
+                        setTimeout(poll, 1000); // Poll cada segundo
+                    })
+                    .catch(reject);
+            };
+            poll();
+        });
+    }
+
     // Lógica para los botones de análisis
     const analysisMenuButtons = document.querySelectorAll('#analysis-content .menu-button');
     analysisMenuButtons.forEach(button => {
@@ -957,6 +1001,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             // Mostrar el loader y la barra de progreso, ocultar resultados anteriores
             if (analysisLoader) analysisLoader.style.display = 'flex';
+            if (analysisLoader) analysisLoader.querySelector('p').textContent = 'Entrenando y evaluando modelo...';
             if (analysisProgressBar) analysisProgressBar.style.display = 'block'; // Block para la barra de progreso
             if (analysisMetricsPanel) analysisMetricsPanel.style.display = 'none';
             if (classificationReportPanel) classificationReportPanel.style.display = 'none';
@@ -982,6 +1027,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
                 return response.json();
             })
+            .then(job => {
+
+                // El entrenamiento se ejecuta en segundo plano: se espera a que termine el trabajo
+                console.log(`Trabajo de entrenamiento ${job.job_id} (${job.coalesced ? 'unido a uno en curso' : 'nuevo'})`);
+                return waitForAnalysisJob(job.job_id, analysisLoader);
+            })
             .then(data => {
 
                 console.log("DEBUG: Resultados del análisis recibidos del backend:", data);
@@ -0,0 +1,242 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+from utils.compiled_model import COMPILED_EXTENSION, CompiledModel, compiled_model_path
+from utils.landmark_store import is_store_path, labels_path
+from utils.model_registry import save_model
+
+
+CACHE_DIR = os.path.join('cache', 'analysis')
+CACHE_FORMAT_VERSION = 1 # Cambiarlo invalida todas las entradas guardadas
+DEFAULT_MAX_ENTRIES = 32 # Entradas que se conservan en disco (las más antiguas se borran)
+
+_HASH_CHUNK = 1 << 20
+
+
+def _sha256_file(path, digest=None):
+
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+
+            digest.update(chunk)
+    return digest
+
+
+def _json_default(value):
+
+    # Escalares y arrays de NumPy que puedan quedar en los resultados
+    if isinstance(value, np.generic):
+
+        return value.item()
+    if isinstance(value, np.ndarray):
+
+        return value.tolist()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _write_atomic(path, data):
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class AnalysisCache:
+    """
+    Caché en disco de los resultados de 'entrenar_y_evaluar_modelo'.
+
+    La clave es el SHA-256 del contenido del dataset (el CSV o el almacén '.lmk' con su
+    vocabulario de etiquetas) junto con la configuración de entrenamiento. Cuando llegan
+    filas nuevas al dataset el contenido cambia y con él la clave, así que las entradas
+    antiguas dejan de usarse sin invalidarlas a mano. Como el hash se recuerda por
+    (tamaño, mtime) del archivo, una petición repetida no vuelve a leer el dataset.
+
+    Cada entrada guarda el diccionario de resultados en JSON y una copia del modelo
+    entrenado (y del compilado, si lo hay). Al acertar, si el modelo servido ya no es el de
+    la entrada (se entrenó después con otros datos), se restaura a través del registro de
+    modelos, de modo que los resultados mostrados siempre describen el modelo en uso.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, int(max_entries))
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self.hits = 0
+        self.misses = 0
+
+    # CLAVES
+    def dataset_fingerprint(self, path):
+        """
+        SHA-256 del contenido del dataset, recalculado solo si el archivo ha cambiado.
+
+        :raises FileNotFoundError: Si el dataset no existe.
+        """
+        files = [path]
+        if is_store_path(path) and os.path.exists(labels_path(path)):
+
+            files.append(labels_path(path))
+
+        signature = tuple((os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files)
+        key = os.path.abspath(path)
+        with self._lock:
+
+            cached = self._fingerprints.get(key)
+        if cached is not None and cached[0] == signature:
+
+            return cached[1]
+
+        digest = hashlib.sha256()
+        for f in files:
+
+            _sha256_file(f, digest)
+        fingerprint = digest.hexdigest()
+        with self._lock:
+
+            self._fingerprints[key] = (signature, fingerprint)
+        return fingerprint
+
+    def key(self, dataset_path, config):
+        """
+        Clave de caché de un dataset con una configuración de entrenamiento.
+
+        :param config: Diccionario serializable que describe el entrenamiento.
+        """
+        payload = json.dumps({"format": CACHE_FORMAT_VERSION, "config": config}, sort_keys=True, default=repr)
+        digest = hashlib.sha256(self.dataset_fingerprint(dataset_path).encode('ascii'))
+        digest.update(payload.encode('utf-8'))
+        return digest.hexdigest()
+
+    # ENTRADAS
+    def _entry_path(self, key, suffix):
+
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    @staticmethod
+    def _artifacts(results, model_path):
+
+        # (sufijo en la caché, ruta lógica) del pickle y, si este entrenamiento lo generó, del compilado
+        artifacts = [('.pkl', model_path)]
+        compiled_path = (results.get("compiled_model") or {}).get("path")
+        if compiled_path:
+
+            artifacts.append(('.compiled' + COMPILED_EXTENSION, compiled_path))
+        return artifacts
+
+    def get(self, key, model_path):
+        """
+        Resultados guardados para la clave, o None si no hay entrada.
+
+        Restaura en 'model_path' el modelo de la entrada si el servido es otro.
+        """
+        path = self._entry_path(key, '.json')
+        try:
+            with open(path, encoding='utf-8') as f:
+
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+
+            self.misses += 1
+            return None
+
+        for suffix, sha256 in entry.get("artifacts", {}).items():
+
+            self._restore(key, suffix, sha256, model_path)
+
+        os.utime(path) # Usada recientemente: la última en borrarse
+        self.hits += 1
+        results = entry["results"]
+        results["cache"] = {"hit": True, "key": key, "created": entry.get("created")}
+        return results
+
+    def _restore(self, key, suffix, sha256, model_path):
+
+        target = compiled_model_path(model_path) if suffix != '.pkl' else model_path
+        try:
+            if _sha256_file(target).hexdigest() == sha256:
+
+                return
+        except FileNotFoundError:
+
+            pass
+
+        with open(self._entry_path(key, suffix), 'rb') as f:
+
+            data = f.read()
+        model = CompiledModel.from_bytes(data) if suffix.endswith(COMPILED_EXTENSION) else pickle.loads(data)
+        save_model(model, target, metadata={"restored_from_cache": key})
+        print(f"Modelo restaurado desde la caché de análisis: '{target}'.")
+
+    def put(self, key, results, model_path):
+        """
+        Guarda los resultados y una copia de los modelos que los produjeron.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        artifacts = {}
+        for suffix, artifact_path in self._artifacts(results, model_path):
+
+            try:
+                with open(artifact_path, 'rb') as f:
+
+                    data = f.read()
+            except FileNotFoundError:
+
+                continue
+            _write_atomic(self._entry_path(key, suffix), data)
+            artifacts[suffix] = hashlib.sha256(data).hexdigest()
+
+        # El JSON se escribe el último: una entrada visible siempre tiene sus modelos
+        entry = {"created": time.time(), "artifacts": artifacts, "results": results}
+        _write_atomic(self._entry_path(key, '.json'),
+                      json.dumps(entry, ensure_ascii=False, default=_json_default).encode('utf-8'))
+        self._prune()
+
+    def _prune(self):
+
+        entries = sorted(glob.glob(os.path.join(glob.escape(self.cache_dir), '*.json')), key=os.path.getmtime)
+        for path in entries[:max(0, len(entries) - self.max_entries)]:
+
+            for candidate in glob.glob(f"{glob.escape(os.path.splitext(path)[0])}.*"):
+
+                os.remove(candidate)
+
+    def stats(self):
+
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """
+    Devuelve la caché de análisis compartida por todo el proceso.
+    """
+    global _cache
+
+    if _cache is None:
+
+        with _cache_lock:
+
+            if _cache is None:
+
+                _cache = AnalysisCache(
+                    cache_dir=os.environ.get('TFM_ANALYSIS_CACHE_DIR', CACHE_DIR),
+                    max_entries=int(os.environ.get('TFM_ANALYSIS_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES)),
+                )
+    return _cache
@@ -0,0 +1,151 @@
+import argparse
+import time
+
+import numpy as np
+
+from utils.pose_landmarks import NUM_LANDMARKS
+
+
+class AngleKernel:
+    """
+    Calcula de una vez todos los angulos articulares que necesita un ejercicio.
+
+    Cada angulo se define con una terna de indices (a, b, c): el angulo en el punto
+    'b' entre los segmentos b->a y b->c, en el plano (x, y) y en grados [0, 180].
+    Ademas de los 33 landmarks se pueden definir puntos virtuales como combinacion
+    lineal de landmarks mas un desplazamiento (por ejemplo, el punto medio de las
+    caderas); sus indices empiezan en 33, en el orden en que se declaran.
+
+    El mismo kernel acepta un fotograma (33, k) o una secuencia (T, 33, k) y devuelve
+    (n,) o (T, n) angulos con una sola llamada vectorizada de NumPy.
+    """
+
+    def __init__(self, triples, virtual_points=()):
+        """
+        :param triples: Lista de ternas (a, b, c) de indices de puntos.
+        :param virtual_points: Lista de (pesos, desplazamiento), donde 'pesos' es un
+                               diccionario {indice de landmark: peso} y 'desplazamiento'
+                               un par (dx, dy) en coordenadas normalizadas.
+        """
+        self.triples = np.asarray(triples, dtype=np.intp).reshape(-1, 3)
+
+        self.weights = None
+        self.offsets = None
+        if virtual_points:
+
+            self.weights = np.zeros((len(virtual_points), NUM_LANDMARKS), dtype=np.float64)
+            self.offsets = np.zeros((len(virtual_points), 2), dtype=np.float64)
+            for i, (weights, offset) in enumerate(virtual_points):
+
+                for index, weight in weights.items():
+
+                    self.weights[i, index] = weight
+                self.offsets[i] = offset
+
+        num_points = NUM_LANDMARKS + (0 if self.weights is None else len(self.weights))
+        if self.triples.size and (self.triples.min() < 0 or self.triples.max() >= num_points):
+
+            raise ValueError(f"Indices de angulo fuera de rango (hay {num_points} puntos)")
+
+    def points(self, landmarks):
+        """
+        Coordenadas (x, y) en float64 de los landmarks seguidas de los puntos virtuales.
+        """
+        xy = np.asarray(landmarks, dtype=np.float64)[..., :2]
+        if self.weights is None:
+
+            return xy
+        return np.concatenate([xy, self.weights @ xy + self.offsets], axis=-2)
+
+    def __call__(self, landmarks):
+        """
+        :param landmarks: Array (33, k) o (T, 33, k) con k >= 2 (x, y, ...).
+        :return: Array (n,) o (T, n) con los angulos en grados.
+        """
+        xy = self.points(landmarks)
+        b = xy[..., self.triples[:, 1], :]
+        ba = xy[..., self.triples[:, 0], :] - b
+        bc = xy[..., self.triples[:, 2], :] - b
+
+        radians = np.arctan2(bc[..., 1], bc[..., 0]) - np.arctan2(ba[..., 1], ba[..., 0])
+        angles = np.abs(np.degrees(radians))
+
+        # Plegar a [0, 180]: se devuelve siempre el angulo menor entre los dos segmentos
+        return np.where(angles > 180.0, 360.0 - angles, angles)
+
+
+def _legacy_calculate_angle(a, b, c):
+
+    # Implementación por llamada que usaban los detectores, conservada solo para el benchmark
+    a = np.array(a)
+    b = np.array(b)
+    c = np.array(c)
+
+    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
+    angle = np.abs(radians * 180.0 / np.pi)
+
+    if angle > 180.0:
+        angle = 360 - angle
+    return angle
+
+
+def benchmark(num_angles=6, frames=1000, repeats=5, seed=1234):
+    """
+    Compara el kernel con la función por llamada en un fotograma y en una secuencia.
+
+    :return: Diccionario con los tiempos medios (microsegundos) y la diferencia máxima.
+    """
+    rng = np.random.default_rng(seed)
+    sequence = rng.random((frames, NUM_LANDMARKS, 4), dtype=np.float32)
+    triples = rng.choice(NUM_LANDMARKS, size=(num_angles, 3), replace=True)
+    kernel = AngleKernel(triples)
+
+    def legacy(frame):
+
+        return [_legacy_calculate_angle(frame[a, :2].tolist(), frame[b, :2].tolist(), frame[c, :2].tolist()) for a, b, c in triples]
+
+    def best_of(function):
+
+        timings = []
+        for _ in range(repeats):
+
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    legacy_s = best_of(lambda: [legacy(frame) for frame in sequence])
+    kernel_frame_s = best_of(lambda: [kernel(frame) for frame in sequence])
+    kernel_sequence_s = best_of(lambda: kernel(sequence))
+
+    max_diff = float(np.max(np.abs(np.asarray([legacy(frame) for frame in sequence]) - kernel(sequence))))
+    return {
+        "angles_per_frame": num_angles,
+        "frames": frames,
+        "legacy_us_per_frame": round(legacy_s / frames * 1e6, 2),
+        "kernel_us_per_frame": round(kernel_frame_s / frames * 1e6, 2),
+        "kernel_sequence_us_per_frame": round(kernel_sequence_s / frames * 1e6, 3),
+        "max_abs_diff_deg": max_diff,
+    }
+
+
+def main(argv=None):
+    """
+    Micro-benchmark del kernel de angulos.
+
+    Ejemplo:
+        python -m utils.angles --angles 6 --frames 2000
+    """
+    parser = argparse.ArgumentParser(description="Benchmark del kernel vectorizado de angulos articulares.")
+    parser.add_argument("--angles", type=int, default=6, help="Angulos por fotograma.")
+    parser.add_argument("--frames", type=int, default=1000, help="Fotogramas de la secuencia.")
+    args = parser.parse_args(argv)
+
+    results = benchmark(num_angles=args.angles, frames=args.frames)
+    for key, value in results.items():
+
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import atexit
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.detector_factory import DETECTOR_CLASSES
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+SUMMARY_FILENAME = 'summary.json'
+
+# Detector del proceso trabajador (uno por proceso, reutilizado entre videos)
+_worker_detector = None
+_worker_exercise = None
+
+
+def _init_worker(exercise_type):
+
+    global _worker_detector, _worker_exercise
+
+    import cv2
+    from utils.detector_factory import create_detector, close_detector
+
+    # Un hilo de OpenCV por proceso: el paralelismo viene del número de procesos
+    cv2.setNumThreads(1)
+
+    # Los landmarks del análisis por lotes van a un CSV desechable propio del proceso
+    temp_dir = tempfile.mkdtemp(prefix="batch_analysis_")
+    _worker_exercise = exercise_type
+    _worker_detector = create_detector(exercise_type, csv_path=os.path.join(temp_dir, "landmarks.csv"))
+
+    def cleanup():
+
+        close_detector(_worker_detector)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    atexit.register(cleanup)
+
+
+def _analyze_one(video_path, output_path):
+
+    from utils.detector_factory import clear_detector_output
+    from utils.video_analysis import analyze_video
+
+    try:
+        results = analyze_video(video_path, _worker_exercise, detector=_worker_detector)
+    except Exception as e:
+
+        return {"video": os.path.basename(video_path), "status": "error", "error": str(e)}
+    finally:
+        # El CSV desechable del proceso se vacía tras cada video para que no crezca con el lote
+        clear_detector_output(_worker_detector)
+
+    results["status"] = "success"
+    _write_json_atomic(output_path, results)
+    return results
+
+
+def _write_json_atomic(path, data):
+
+    # Se escribe en un temporal y se renombra: un JSON existente siempre está completo,
+    # así un lote interrumpido se puede reanudar sin reprocesar ni leer archivos a medias
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_videos(input_dir, extensions=VIDEO_EXTENSIONS):
+    """
+    Lista (ordenados) los videos de un directorio.
+    """
+    return sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(extensions) and os.path.isfile(os.path.join(input_dir, name))
+    )
+
+
+def result_path_for(video_path, output_dir):
+
+    # Nombre completo del video ('set1.mp4.json'): 'set1.mp4' y 'set1.mov' no comparten
+    # resultado, y ningún video puede ocupar el nombre reservado del resumen
+    name = os.path.basename(video_path) + ".json"
+    if name == SUMMARY_FILENAME:
+
+        name = "_" + name
+    return os.path.join(output_dir, name)
+
+
+def run_batch(input_dir, exercise_type, output_dir, workers=None):
+    """
+    Analiza todos los videos de un directorio repartiéndolos entre varios procesos.
+
+    Cada proceso crea un único detector y lo reutiliza para todos sus videos. Se
+    escribe un JSON de resultados por video y un 'summary.json' combinado. Los videos
+    que ya tienen su JSON se omiten, por lo que un lote interrumpido se puede reanudar.
+
+    :param input_dir: Directorio con los videos.
+    :param exercise_type: Clave del ejercicio de todos los videos del lote.
+    :param output_dir: Directorio donde escribir los resultados.
+    :param workers: Número de procesos (por defecto, el número de núcleos).
+    :return: Diccionario con el resumen del lote.
+    """
+    if exercise_type not in DETECTOR_CLASSES:
+
+        raise ValueError(f"Tipo de ejercicio no válido: '{exercise_type}'")
+
+    os.makedirs(output_dir, exist_ok=True)
+    videos = find_videos(input_dir)
+    pending = [video for video in videos if not os.path.exists(result_path_for(video, output_dir))]
+    print(f"{len(videos)} videos encontrados, {len(videos) - len(pending)} ya analizados, {len(pending)} pendientes.")
+
+    errors = []
+    start = time.perf_counter()
+    if pending:
+
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(exercise_type,)) as executor:
+
+            futures = {
+                executor.submit(_analyze_one, video, result_path_for(video, output_dir)): video
+                for video in pending
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+
+                result = future.result()
+                if result.get("status") == "success":
+
+                    stats = result["stats"]
+                    print(f"[{done}/{len(pending)}] {result['video']}: {result['correct_reps']} correctas, "
+                          f"{result['incorrect_reps']} incorrectas ({stats['processing_fps']} FPS)")
+                else:
+
+                    errors.append(result)
+                    print(f"[{done}/{len(pending)}] {result['video']}: ERROR {result['error']}")
+
+    summary = build_summary(videos, output_dir, exercise_type)
+    summary["errors"] = errors
+    summary["batch_wall_s"] = round(time.perf_counter() - start, 3)
+    _write_json_atomic(os.path.join(output_dir, SUMMARY_FILENAME), summary)
+    return summary
+
+
+def build_summary(videos, output_dir, exercise_type):
+    """
+    Combina los JSON por video existentes (de esta ejecución o anteriores) en un resumen.
+    """
+    per_video = []
+    totals = {"correct_reps": 0, "incorrect_reps": 0, "frames": 0, "processing_s": 0.0}
+    for video in videos:
+
+        path = result_path_for(video, output_dir)
+        if not os.path.exists(path):
+
+            continue
+
+        with open(path, encoding="utf-8") as f:
+
+            result = json.load(f)
+
+        stats = result.get("stats", {})
+        per_video.append({
+            "video": result.get("video", os.path.basename(video)),
+            "correct_reps": result.get("correct_reps", 0),
+            "incorrect_reps": result.get("incorrect_reps", 0),
+            "frames": stats.get("frames", 0),
+            "processing_fps": stats.get("processing_fps"),
+            "results_file": os.path.basename(path),
+        })
+        totals["correct_reps"] += result.get("correct_reps", 0)
+        totals["incorrect_reps"] += result.get("incorrect_reps", 0)
+        totals["frames"] += stats.get("frames", 0)
+        totals["processing_s"] += stats.get("processing_s", 0.0)
+
+    totals["processing_s"] = round(totals["processing_s"], 3)
+    return {
+        "exercise_type": exercise_type,
+        "videos_total": len(videos),
+        "videos_analyzed": len(per_video),
+        "totals": totals,
+        "videos": per_video,
+    }
+
+
+def main(argv=None):
+    """
+    CLI del análisis por lotes.
+
+    Ejemplo:
+        python -m utils.batch_analysis grabaciones/sentadillas --exercise squats --output resultados/ --workers 4
+    """
+    parser = argparse.ArgumentParser(description="Análisis por lotes de series grabadas.")
+    parser.add_argument("input_dir", help="Directorio con los videos.")
+    parser.add_argument("--exercise", required=True, choices=sorted(DETECTOR_CLASSES), help="Tipo de ejercicio de los videos.")
+    parser.add_argument("--output", required=True, help="Directorio de resultados (un JSON por video y summary.json).")
+    parser.add_argument("--workers", type=int, default=None, help="Número de procesos (por defecto, núcleos disponibles).")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.input_dir, args.exercise, args.output, workers=args.workers)
+    totals = summary["totals"]
+    print(f"Lote finalizado: {summary['videos_analyzed']}/{summary['videos_total']} videos, "
+          f"{totals['correct_reps']} correctas, {totals['incorrect_reps']} incorrectas, "
+          f"{len(summary['errors'])} errores en {summary['batch_wall_s']} s.")
+
+
+if __name__ == "__main__":
+    main()
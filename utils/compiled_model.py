@@ -0,0 +1,478 @@
+import argparse
+import io
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, RidgeClassifier, SGDClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from utils.landmark_store import NUM_COORDS
+from utils.pose_features import NUM_FEATURES, PoseFeatures, pose_features
+
+
+COMPILED_EXTENSION = '.npz'
+
+# Tipos de modelo compilado (se guardan en el '.npz' junto con sus arrays)
+_KIND_SOFTMAX = 'logistic_softmax'
+_KIND_OVR = 'logistic_ovr'
+_KIND_RIDGE = 'ridge'
+_KIND_FOREST = 'forest'
+_KIND_BOOSTING = 'boosting'
+_PROBABILISTIC_KINDS = (_KIND_SOFTMAX, _KIND_OVR, _KIND_FOREST, _KIND_BOOSTING)
+
+
+def compiled_model_path(path):
+    """
+    Ruta del modelo compilado que acompaña a un pickle ('models/x.pkl' -> 'models/x.compiled.npz').
+
+    El sufijo propio evita que sus versiones y metadatos coincidan con los del pickle en el
+    registro de modelos.
+    """
+    return f"{os.path.splitext(path)[0]}.compiled{COMPILED_EXTENSION}"
+
+
+def _softmax(decision):
+
+    decision = decision - decision.max(axis=1, keepdims=True)
+    np.exp(decision, out=decision)
+    decision /= decision.sum(axis=1, keepdims=True)
+    return decision
+
+
+def _sigmoid(decision):
+
+    return 1.0 / (1.0 + np.exp(-decision))
+
+
+class CompiledModel:
+    """
+    Predictor de solo NumPy equivalente a un pipeline entrenado en 'model_3.py'.
+
+    Guarda la media y la escala del 'StandardScaler' y los parámetros del clasificador en
+    arrays planos: pesos y sesgos para los modelos lineales y, para los bosques, todos los
+    nodos de todos los árboles concatenados (característica, umbral, hijos y valor de la
+    hoja). Predecir una fila son unas pocas operaciones de NumPy, sin la validación ni la
+    conversión de DataFrame que scikit-learn hace en cada llamada.
+
+    Expone 'classes_', 'n_features_in_', 'decision_function' y 'predict' como un
+    clasificador de scikit-learn, de modo que el registro de modelos y la clasificación en
+    vivo lo usan igual que el pipeline original.
+
+    Si el pipeline empieza por 'PoseFeatures', el modelo recibe igualmente las 132
+    columnas de landmarks y calcula las características antes de escalar.
+    """
+
+    def __init__(self, kind, classes, mean, scale, arrays):
+
+        self.kind = kind
+        self.classes_ = np.asarray(classes)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.arrays = arrays
+        self.pose_features = 'pose_features' in arrays
+        self.n_features_in_ = NUM_COORDS if self.pose_features else len(self.mean)
+        if self.pose_features and int(arrays['pose_features']) != NUM_FEATURES:
+
+            raise ValueError(f"El modelo se compiló con {int(arrays['pose_features'])} características de pose y ahora hay {NUM_FEATURES}")
+
+        if kind in (_KIND_FOREST, _KIND_BOOSTING):
+
+            self._feature = arrays['feature']
+            self._threshold = arrays['threshold']
+            self._children = arrays['children']
+            self._values = arrays['values']
+            self._roots = arrays['roots']
+            self._depth = int(arrays['depth'])
+
+    def _transform(self, X):
+
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+
+            raise ValueError(f"Se esperaban {self.n_features_in_} características y hay {X.shape[1]}")
+        if self.pose_features:
+
+            X = pose_features(X)
+        return (X - self.mean) / self.scale
+
+    def _forest_sum(self, X):
+
+        # Los árboles de scikit-learn comparan en float32 contra umbrales float64
+        X = X.astype(np.float32)
+        flat = X.ravel()
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        children = self._children.ravel()
+        nodes = np.broadcast_to(self._roots, (len(X), len(self._roots)))
+
+        # Las hojas apuntan a sí mismas: basta con bajar tantos niveles como el árbol más profundo.
+        # Con 'take' sobre arrays planos cada nivel son cinco accesos vectorizados.
+        for _ in range(self._depth):
+
+            go_right = flat.take(row_offsets + self._feature.take(nodes)) > self._threshold.take(nodes)
+            nodes = children.take(nodes * 2 + go_right)
+        return self._values[nodes].sum(axis=1)
+
+    def decision_function(self, X):
+        """
+        Puntuaciones por clase (una columna en los modelos binarios lineales y de boosting).
+        """
+        X = self._transform(X)
+        if self.kind in (_KIND_SOFTMAX, _KIND_OVR, _KIND_RIDGE):
+
+            return X @ self.arrays['coef'].T + self.arrays['intercept']
+
+        if self.kind == _KIND_BOOSTING:
+
+            return self.arrays['init'] + self.arrays['learning_rate'] * self._forest_sum(X)
+
+        return self._forest_sum(X) / len(self._roots)
+
+    def _probabilities(self, decision):
+
+        if self.kind == _KIND_FOREST:
+
+            return decision
+
+        if decision.shape[1] == 1:
+
+            positive = _sigmoid(decision[:, 0])
+            return np.column_stack([1.0 - positive, positive])
+
+        if self.kind == _KIND_OVR:
+
+            probabilities = _sigmoid(decision)
+            return probabilities / probabilities.sum(axis=1, keepdims=True)
+        return _softmax(decision)
+
+    def predict(self, X):
+
+        decision = self.decision_function(X)
+        if self.kind == _KIND_RIDGE and decision.shape[1] == 1:
+
+            return self.classes_[(decision[:, 0] > 0).astype(np.intp)]
+
+        if self.kind != _KIND_RIDGE:
+
+            decision = self._probabilities(decision)
+        return self.classes_[np.argmax(decision, axis=1)]
+
+    # SERIALIZACIÓN
+    def to_bytes(self):
+        """
+        Contenido del archivo '.npz' del modelo (sin pickle: solo arrays de NumPy).
+        """
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, kind=np.asarray(self.kind), classes=self.classes_.astype(str),
+                            mean=self.mean, scale=self.scale, **self.arrays)
+        return buffer.getvalue()
+
+    @staticmethod
+    def from_bytes(data):
+
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+
+            arrays = {name: npz[name] for name in npz.files}
+
+        kind = str(arrays.pop('kind'))
+        model_class = CompiledProbabilisticModel if kind in _PROBABILISTIC_KINDS else CompiledModel
+        return model_class(kind, arrays.pop('classes'), arrays.pop('mean'), arrays.pop('scale'), arrays)
+
+    def save(self, path):
+
+        with open(path, 'wb') as f:
+
+            f.write(self.to_bytes())
+
+    @staticmethod
+    def load(path):
+
+        with open(path, 'rb') as f:
+
+            return CompiledModel.from_bytes(f.read())
+
+    def __repr__(self):
+
+        return f"CompiledModel(kind='{self.kind}', classes={[str(label) for label in self.classes_]}, features={self.n_features_in_})"
+
+
+class CompiledProbabilisticModel(CompiledModel):
+    """
+    Modelo compilado con 'predict_proba' (todos salvo RidgeClassifier, que no la tiene).
+    """
+
+    def predict_proba(self, X):
+
+        return self._probabilities(self.decision_function(X))
+
+
+def _flatten_trees(trees, columns, num_outputs):
+
+    # Concatena los nodos de todos los árboles; los índices de los hijos pasan a ser globales
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    depth = 0
+    for tree, column in zip(trees, columns):
+
+        tree = tree.tree_
+        n_nodes = tree.node_count
+        nodes = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        left = np.where(is_leaf, nodes, tree.children_left) + offset
+        right = np.where(is_leaf, nodes, tree.children_right) + offset
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        children.append(np.column_stack([left, right]))
+
+        node_values = np.zeros((n_nodes, num_outputs))
+        if column is None:
+
+            # Clasificación: proporción de cada clase en la hoja
+            raw = tree.value[:, 0, :]
+            node_values[:] = raw / raw.sum(axis=1, keepdims=True)
+        else:
+
+            # Regresión (boosting): la hoja suma en la columna de su clase
+            node_values[:, column] = tree.value[:, 0, 0]
+        values.append(node_values)
+
+        roots.append(offset)
+        offset += n_nodes
+        depth = max(depth, tree.max_depth)
+
+    return {
+        'feature': np.concatenate(features).astype(np.intp),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'children': np.concatenate(children).astype(np.intp),
+        'values': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.intp),
+        'depth': np.asarray(depth),
+    }
+
+
+def _logistic_kind(estimator, num_features):
+
+    # Multiclase: según la versión de scikit-learn, softmax o uno-contra-todos normalizado.
+    # Se elige la fórmula que reproduce 'predict_proba' del propio modelo.
+    if len(estimator.classes_) <= 2:
+
+        return _KIND_SOFTMAX
+
+    probe = np.random.default_rng(0).normal(size=(8, num_features))
+    expected = estimator.predict_proba(probe)
+    decision = probe @ estimator.coef_.T + estimator.intercept_
+    ovr = _sigmoid(decision)
+    ovr /= ovr.sum(axis=1, keepdims=True)
+    if np.allclose(ovr, expected) and not np.allclose(_softmax(decision.copy()), expected):
+
+        return _KIND_OVR
+    return _KIND_SOFTMAX
+
+
+def compile_pipeline(pipeline):
+    """
+    Convierte un pipeline [PoseFeatures +] StandardScaler + (LogisticRegression | RidgeClassifier |
+    SGDClassifier | RandomForestClassifier | GradientBoostingClassifier) en un 'CompiledModel'.
+
+    :param pipeline: Pipeline entrenado (o el clasificador solo, sin escalado).
+    :return: CompiledModel (CompiledProbabilisticModel si el clasificador tiene probabilidades).
+    :raises ValueError: Si el pipeline tiene otros pasos o el clasificador no está soportado.
+    """
+    steps = [step for _, step in pipeline.steps] if isinstance(pipeline, Pipeline) else [pipeline]
+    feature_stage = len(steps) > 1 and isinstance(steps[0], PoseFeatures)
+    if feature_stage:
+
+        steps = steps[1:]
+    estimator = steps[-1]
+    num_features = estimator.n_features_in_
+
+    mean = np.zeros(num_features)
+    scale = np.ones(num_features)
+    for step in steps[:-1]:
+
+        if not isinstance(step, StandardScaler) or len(steps) > 2:
+
+            raise ValueError(f"Paso de pipeline no soportado: {type(step).__name__}")
+        if step.mean_ is not None:
+
+            mean = np.asarray(step.mean_, dtype=np.float64)
+        if step.scale_ is not None:
+
+            scale = np.asarray(step.scale_, dtype=np.float64)
+
+    classes = estimator.classes_
+    if isinstance(estimator, (LogisticRegression, RidgeClassifier, SGDClassifier)):
+
+        arrays = {'coef': np.asarray(estimator.coef_, dtype=np.float64).reshape(-1, num_features),
+                  'intercept': np.asarray(estimator.intercept_, dtype=np.float64).reshape(-1)}
+
+        # Un SGDClassifier solo tiene probabilidades con pérdida logística; sin ellas predice
+        # con la función de decisión lineal, igual que RidgeClassifier
+        linear_only = isinstance(estimator, RidgeClassifier) or (
+            isinstance(estimator, SGDClassifier) and estimator.loss != 'log_loss')
+        kind = _KIND_RIDGE if linear_only else _logistic_kind(estimator, num_features)
+
+    elif isinstance(estimator, RandomForestClassifier):
+
+        kind = _KIND_FOREST
+        arrays = _flatten_trees(estimator.estimators_, [None] * len(estimator.estimators_), len(classes))
+
+    elif isinstance(estimator, GradientBoostingClassifier):
+
+        kind = _KIND_BOOSTING
+        stages, num_outputs = estimator.estimators_.shape
+        trees = estimator.estimators_.reshape(-1)
+        arrays = _flatten_trees(trees, [k for _ in range(stages) for k in range(num_outputs)], num_outputs)
+        arrays['learning_rate'] = np.asarray(float(estimator.learning_rate))
+
+        # Predicción inicial (prior de las clases): lo que queda de la función de decisión
+        # del modelo en un punto cualquiera al quitar la suma de los árboles
+        arrays['init'] = np.zeros(num_outputs)
+        probe = np.zeros((1, num_features))
+        partial = CompiledModel(kind, classes, np.zeros(num_features), np.ones(num_features), arrays)
+        decision = np.asarray(estimator.decision_function(probe), dtype=np.float64).reshape(1, -1)
+        arrays['init'] = (decision - partial.decision_function(probe))[0]
+
+    else:
+
+        raise ValueError(f"Clasificador no soportado: {type(estimator).__name__}")
+
+    if feature_stage:
+
+        arrays['pose_features'] = np.asarray(NUM_FEATURES)
+
+    model_class = CompiledProbabilisticModel if kind in _PROBABILISTIC_KINDS else CompiledModel
+    return model_class(kind, classes, mean, scale, arrays)
+
+
+def _as_model_input(model, X):
+
+    if getattr(model, 'feature_names_in_', None) is not None and not isinstance(X, pd.DataFrame):
+
+        return pd.DataFrame(np.asarray(X), columns=list(model.feature_names_in_))
+    return X
+
+
+def check_agreement(model, compiled, X, y=None):
+    """
+    Compara las predicciones del modelo original y del compilado sobre las mismas filas.
+
+    :param X: Filas de características (DataFrame o array).
+    :param y: Etiquetas reales opcionales, para comparar también la exactitud.
+    :return: Diccionario con la fracción de predicciones iguales, la diferencia máxima de
+             probabilidades (si las hay) y las exactitudes.
+    """
+    expected = np.asarray(model.predict(_as_model_input(model, X)))
+    predicted = compiled.predict(np.asarray(X))
+    result = {
+        "rows": int(len(expected)),
+        "agreement": float(np.mean(expected.astype(str) == predicted.astype(str))) if len(expected) else 1.0,
+        "max_proba_diff": None,
+    }
+    if hasattr(model, 'predict_proba') and hasattr(compiled, 'predict_proba') and len(expected):
+
+        difference = np.abs(model.predict_proba(_as_model_input(model, X)) - compiled.predict_proba(np.asarray(X)))
+        result["max_proba_diff"] = float(difference.max())
+
+    if y is not None and len(expected):
+
+        y = np.asarray(y).astype(str)
+        result["accuracy_original"] = float(np.mean(expected.astype(str) == y))
+        result["accuracy_compiled"] = float(np.mean(predicted.astype(str) == y))
+    return result
+
+
+def benchmark(model, compiled, X, rows=200):
+    """
+    Latencia media de predecir una sola fila con el modelo original y con el compilado.
+
+    :return: Diccionario con los microsegundos por fila de cada uno.
+    """
+    X = np.asarray(X, dtype=np.float64)[:rows]
+
+    def per_row_us(function, inputs):
+
+        start = time.perf_counter()
+        for row in inputs:
+
+            function(row)
+        return round((time.perf_counter() - start) / max(1, len(inputs)) * 1e6, 2)
+
+    original_inputs = [_as_model_input(model, X[i:i + 1]) for i in range(len(X))]
+    return {
+        "benchmark_rows": int(len(X)),
+        "original_us_per_row": per_row_us(model.predict, original_inputs),
+        "compiled_us_per_row": per_row_us(compiled.predict, [X[i:i + 1] for i in range(len(X))]),
+    }
+
+
+def main(argv=None):
+    """
+    Compila un modelo entrenado, comprueba que predice igual y mide la latencia.
+
+    Ejemplo:
+        python -m utils.compiled_model models/flexiones_model.pkl --data data/coords_flexiones.csv
+    """
+    from utils.landmark_store import load_landmark_dataframe
+    from utils.model_registry import save_model
+
+    parser = argparse.ArgumentParser(description="Compila un pipeline entrenado a un predictor de solo NumPy.")
+    parser.add_argument("model", help="Pickle del pipeline entrenado.")
+    parser.add_argument("--data", help="CSV o '.lmk' de landmarks para comprobar la equivalencia.")
+    parser.add_argument("--output", help="Archivo '.npz' de salida (por defecto, junto al pickle).")
+    parser.add_argument("--force", action="store_true",
+                        help="Guardar aunque el modelo compilado no prediga exactamente lo mismo que el original.")
+    args = parser.parse_args(argv)
+
+    with open(args.model, 'rb') as f:
+
+        model = pickle.load(f)
+    compiled = compile_pipeline(model)
+    print(compiled)
+
+    if args.data:
+
+        df = load_landmark_dataframe(args.data)
+        X, y = df.drop('class', axis=1), df['class']
+    elif compiled.pose_features:
+
+        # Sin datos y con características de pose: el escalado es de las características,
+        # así que se generan filas sintéticas de landmarks ([x, y, z, v] en [0, 1))
+        rng = np.random.default_rng(1234)
+        X, y = rng.random((500, NUM_COORDS)), None
+    else:
+
+        # Sin datos: filas sintéticas alrededor de la media del escalado
+        rng = np.random.default_rng(1234)
+        X, y = compiled.mean + compiled.scale * rng.normal(size=(500, compiled.n_features_in_)), None
+
+    agreement = check_agreement(model, compiled, X, y)
+    for key, value in {**agreement, **benchmark(model, compiled, X)}.items():
+
+        print(f"{key}: {value}")
+
+    # La clasificación en vivo prefiere el compilado al pickle: solo se guarda si predice lo mismo
+    if agreement["agreement"] < 1.0 and not args.force:
+
+        parser.exit(1, f"El modelo compilado no coincide con el original ({agreement['agreement']:.4f}); "
+                       f"no se guarda (usa --force para guardarlo igualmente).\n")
+
+    output = args.output or compiled_model_path(args.model)
+    version_path = save_model(compiled, output, metadata={
+        "compiled_from": os.path.basename(args.model),
+        "agreement": agreement["agreement"],
+    })
+    print(f"Modelo compilado guardado en '{output}' ({os.path.getsize(version_path)} bytes).")
+
+
+if __name__ == "__main__":
+    main()
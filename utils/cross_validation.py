@@ -0,0 +1,257 @@
+import collections
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold
+
+from utils.process_pool import spawn_executor, stop_executor
+
+
+# Valores por defecto de la validación cruzada
+DEFAULT_FOLDS = 5
+MIN_FOLDS_TO_STOP = 3 # Pliegues comunes con el líder antes de poder descartar un candidato
+STOP_Z = 2.0 # Margen (en errores estándar) con el que un candidato se da por perdido
+MIN_STOP_GAP = 0.02 # Diferencia media mínima con el líder (y suelo del error estándar) para descartar
+
+
+def stratified_folds(y, n_splits=DEFAULT_FOLDS, seed=1234):
+    """
+    Índices (entrenamiento, validación) de cada pliegue estratificado, calculados una vez.
+
+    Si alguna clase tiene menos filas que pliegues, se usan tantos pliegues como filas
+    tenga la clase más pequeña (mínimo 2).
+
+    :raises ValueError: Si alguna clase tiene menos de 2 filas.
+    """
+    y = np.asarray(y)
+    smallest = int(np.unique(y, return_counts=True)[1].min())
+    if smallest < 2:
+
+        raise ValueError("Cada clase necesita al menos 2 filas para la validación cruzada.")
+    splitter = StratifiedKFold(n_splits=max(2, min(int(n_splits), smallest)), shuffle=True, random_state=seed)
+    return list(splitter.split(np.zeros(len(y)), y))
+
+
+# Datos, pliegues y pipelines de cada proceso del pool: se envían una sola vez al crearlo
+_worker_data = None
+
+
+def _init_worker(data):
+
+    global _worker_data
+    _worker_data = data
+
+
+def _fit_fold(algo, fold, data=None):
+
+    # Un pipeline candidato entrenado y puntuado en un pliegue
+    data = data or _worker_data
+    train_index, test_index = data["folds"][fold]
+    start = time.perf_counter()
+    try:
+        model = clone(data["pipelines"][algo]).fit(data["X"][train_index], data["y"][train_index])
+        accuracy = accuracy_score(data["y"][test_index], model.predict(data["X"][test_index]))
+        return {"algo": algo, "fold": fold, "accuracy": accuracy, "fit_s": time.perf_counter() - start, "error": None}
+    except Exception as e:
+
+        return {"algo": algo, "fold": fold, "accuracy": None, "fit_s": time.perf_counter() - start, "error": str(e)}
+
+
+class CrossValidation:
+    """
+    Selección de modelo por validación cruzada estratificada de k pliegues.
+
+    Los índices de los pliegues se calculan una vez y, junto con los datos, se envían a
+    cada proceso del pool al crearlo; las tareas son solo (candidato, pliegue). Se
+    encolan pliegue a pliegue (el pliegue 0 de todos los candidatos, luego el 1...) para
+    que todos avancen a la par y se puedan comparar pronto, y solo hay en marcha tantas
+    como procesos: la siguiente se envía cuando una termina.
+
+    Parada temprana: cuando un candidato comparte al menos MIN_FOLDS_TO_STOP pliegues con
+    el líder (el de mayor media), se comparan pliegue a pliegue; si la diferencia media
+    supera en STOP_Z errores estándar a cero (y al menos MIN_STOP_GAP), el candidato ya no
+    puede ganar y sus pliegues pendientes ya no se envían. Así, con k pliegues, el tiempo
+    de reloj no se multiplica por k. Un pliegue que ya estaba en marcha se deja terminar
+    y su resultado no cuenta; el pool no se reinicia.
+    """
+
+    def __init__(self, pipelines, n_splits=DEFAULT_FOLDS, workers=None, seed=1234, early_stopping=True):
+
+        self.pipelines = pipelines
+        self.n_splits = int(n_splits)
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.seed = seed
+        self.early_stopping = early_stopping
+        self.folds = None
+        self.wall_s = None
+        self.candidates = {
+            algo: {"status": "running", "scores": {}, "fit_s": 0.0, "stopped_after": None, "error": None}
+            for algo in pipelines
+        }
+
+    # PARADA TEMPRANA
+    def _mean(self, algo):
+
+        scores = self.candidates[algo]["scores"]
+        return sum(scores.values()) / len(scores) if scores else None
+
+    def _leader(self):
+
+        running = [algo for algo, info in self.candidates.items() if info["status"] == "running" and info["scores"]]
+        return max(running, key=self._mean) if running else None
+
+    def _cannot_win(self, algo, leader):
+
+        # Diferencias pareadas con el líder en los pliegues que ambos han completado
+        common = sorted(set(self.candidates[algo]["scores"]) & set(self.candidates[leader]["scores"]))
+        if len(common) < MIN_FOLDS_TO_STOP:
+
+            return False
+        differences = np.array([self.candidates[leader]["scores"][f] - self.candidates[algo]["scores"][f] for f in common])
+        # Con diferencias iguales en todos los pliegues la desviación es 0: el suelo evita
+        # descartar por una sola fila de validación
+        standard_error = max(differences.std(ddof=1) / math.sqrt(len(common)), MIN_STOP_GAP / STOP_Z)
+        mean = differences.mean()
+        return mean >= MIN_STOP_GAP and mean - STOP_Z * standard_error > 0
+
+    def _stop_losers(self, progress):
+
+        if not self.early_stopping:
+
+            return []
+        leader = self._leader()
+        stopped = []
+        for algo, info in self.candidates.items():
+
+            if algo != leader and info["status"] == "running" and leader is not None and self._cannot_win(algo, leader):
+
+                info["status"] = "stopped"
+                info["stopped_after"] = len(info["scores"])
+                progress("candidate", algo=algo, status="stopped", folds=len(info["scores"]), cv_mean=round(self._mean(algo), 4))
+                stopped.append(algo)
+        return stopped
+
+    def _record(self, result, progress):
+
+        info = self.candidates[result["algo"]]
+        info["fit_s"] += result["fit_s"]
+        if info["status"] != "running":
+
+            # Pliegue que terminó después de descartar el candidato: no cuenta
+            return
+        if result["error"] is not None:
+
+            info["status"] = "failed"
+            info["error"] = result["error"]
+            progress("candidate", algo=result["algo"], status="failed", error=result["error"])
+            return
+        info["scores"][result["fold"]] = result["accuracy"]
+        progress("candidate", algo=result["algo"], status="cv", folds=len(info["scores"]),
+                 cv_mean=round(self._mean(result["algo"]), 4))
+
+    def run(self, X, y, progress=None):
+        """
+        Valida todos los candidatos y devuelve el resumen (ver 'summary').
+
+        :param progress: Función opcional progress(evento, **detalles) (ver 'entrenar_y_evaluar_modelo').
+        """
+        progress = progress or (lambda event, **details: None)
+        start = time.perf_counter()
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        self.folds = stratified_folds(y, self.n_splits, self.seed)
+        data = {"X": X, "y": y, "folds": self.folds, "pipelines": self.pipelines}
+        tasks = [(algo, fold) for fold in range(len(self.folds)) for algo in self.pipelines]
+
+        if self.workers == 1:
+
+            for algo, fold in tasks:
+
+                if self.candidates[algo]["status"] == "running":
+
+                    self._record(_fit_fold(algo, fold, data), progress)
+                    self._stop_losers(progress)
+        else:
+
+            self._run_pool(tasks, data, progress)
+
+        for info in self.candidates.values():
+
+            if info["status"] == "running":
+
+                info["status"] = "completed"
+        self.wall_s = time.perf_counter() - start
+        return self.summary()
+
+    def _run_pool(self, tasks, data, progress):
+
+        workers = min(self.workers, len(tasks))
+        queue = collections.deque(tasks)
+        running = {}
+        executor = spawn_executor(workers, _init_worker, (data,))
+        try:
+            while True:
+
+                # Como mucho un pliegue en marcha por proceso; los de candidatos descartados no se envían
+                while queue and len(running) < workers:
+
+                    algo, fold = queue.popleft()
+                    if self.candidates[algo]["status"] == "running":
+
+                        running[executor.submit(_fit_fold, algo, fold)] = (algo, fold)
+                if not running:
+
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+
+                    del running[future]
+                    self._record(future.result(), progress)
+                    self._stop_losers(progress)
+        finally:
+            stop_executor(executor, abandon=bool(running))
+
+    def survivors(self):
+        """
+        Candidatos que completaron todos los pliegues, en el orden original.
+        """
+        return [algo for algo, info in self.candidates.items() if info["status"] == "completed"]
+
+    def scores(self):
+        """
+        Exactitud media de validación cruzada de cada candidato que completó todos los pliegues.
+        """
+        return {algo: self._mean(algo) for algo in self.survivors()}
+
+    def summary(self):
+        """
+        Pliegues, tiempo de reloj y, por candidato, su estado, la exactitud de cada
+        pliegue, la media, la varianza, el tiempo de entrenamiento sumado y, si se
+        descartó antes de tiempo, tras cuántos pliegues.
+        """
+        candidates = {}
+        for algo, info in self.candidates.items():
+
+            scores = [info["scores"][fold] for fold in sorted(info["scores"])]
+            candidates[algo] = {
+                "status": info["status"],
+                "folds": [round(score, 4) for score in scores],
+                "mean": round(float(np.mean(scores)), 4) if scores else None,
+                "var": round(float(np.var(scores, ddof=1)), 6) if len(scores) > 1 else None,
+                "fit_s": round(info["fit_s"], 3),
+                "stopped_after": info["stopped_after"],
+                "error": info["error"],
+            }
+        return {
+            "n_splits": len(self.folds) if self.folds is not None else self.n_splits,
+            "workers": self.workers,
+            "wall_s": round(self.wall_s, 3) if self.wall_s is not None else None,
+            "candidates": candidates,
+        }
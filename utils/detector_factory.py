@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+
+from utils.landmark_store import STORE_EXTENSION
+from utils.landmark_writer import flush_landmarks
+from utils.shoulder_press_flask import ShoulderPressDetector
+from utils.flexiones_prueba_flask import PushupDetector
+from utils.sentadilla_trasera_prueba_analiza_flask import SquatDetector
+from utils.peso_muerto_prueba_analiza_flask import DeadliftDetector
+
+
+# Clase de detector para cada tipo de ejercicio
+DETECTOR_CLASSES = {
+    "shoulder_press": ShoulderPressDetector,
+    "pushups": PushupDetector,
+    "squats": SquatDetector,
+    "deadlift": DeadliftDetector,
+}
+
+# Nombre del CSV de landmarks de cada ejercicio (dentro de la carpeta 'data')
+CSV_FILENAMES = {
+    "squats": 'coords_sentadilla.csv',
+    "pushups": 'coords_flexiones.csv',
+    "deadlift": 'coords_peso_muerto.csv',
+    "shoulder_press": 'coords_press_hombro.csv',
+}
+
+
+# Formato de los datasets de landmarks: 'csv' (por defecto) o 'lmk' (almacén binario, ver utils/landmark_store.py)
+LANDMARK_FORMAT = os.environ.get('TFM_LANDMARK_FORMAT', 'csv').lower()
+
+
+def default_csv_path(exercise_type, data_dir=None, landmark_format=None):
+    """
+    Devuelve la ruta del dataset de landmarks para un tipo de ejercicio.
+    """
+    data_dir = data_dir or os.path.join(os.getcwd(), 'data')
+    filename = CSV_FILENAMES[exercise_type]
+    if (landmark_format or LANDMARK_FORMAT) == 'lmk':
+
+        filename = os.path.splitext(filename)[0] + STORE_EXTENSION
+    return os.path.join(data_dir, filename)
+
+
+def create_detector(exercise_type, csv_path=None, pose_model=None, reset_csv=False):
+    """
+    Crea una instancia nueva del detector para el tipo de ejercicio indicado.
+
+    Cada detector tiene su propio grafo de MediaPipe Pose y su propio estado, por lo
+    que varias sesiones pueden usar el mismo ejercicio a la vez.
+
+    :param exercise_type: Clave del ejercicio ('squats', 'pushups', 'deadlift', 'shoulder_press').
+    :param csv_path: Ruta del CSV de landmarks. Por defecto 'data/coords_*.csv'.
+    :param pose_model: Objeto con la interfaz de mp_pose.Pose a usar en lugar de un grafo propio
+                       (por ejemplo, un cliente de 'PoseInferencePool').
+    :param reset_csv: Si es True se vacía un dataset existente; por defecto las filas se añaden.
+    :return: La instancia del detector.
+    :raises KeyError: Si el tipo de ejercicio no existe.
+    """
+    detector_class = DETECTOR_CLASSES[exercise_type]
+    csv_path = os.path.abspath(csv_path or default_csv_path(exercise_type))
+
+    # Los detectores no comparten el nombre del argumento de la ruta del CSV
+    if detector_class in (ShoulderPressDetector, PushupDetector):
+
+        return detector_class(csv_file_path=csv_path, reset_csv=reset_csv, pose_model=pose_model)
+
+    return detector_class(csv_file_name=csv_path, reset_csv=reset_csv, pose_model=pose_model)
+
+
+def close_detector(detector):
+    """
+    Libera los recursos (grafo de MediaPipe) de un detector.
+
+    Antes se escriben los landmarks pendientes, por si el CSV del detector se elimina
+    a continuación (por ejemplo, el CSV temporal de un análisis offline).
+    """
+    flush_landmarks()
+    close = getattr(detector, 'close', None)
+    if close is not None:
+
+        close()
+
+
+def set_detector_output(detector, csv_path):
+    """
+    Cambia el dataset (CSV o '.lmk') al que un detector exporta sus landmarks.
+
+    El archivo se crea con su encabezado si no existe; si existe, se añaden filas.
+    """
+    # Los detectores no comparten el nombre del atributo de la ruta del CSV
+    attribute = 'csv_file_path' if isinstance(detector, (ShoulderPressDetector, PushupDetector)) else 'csv_file_name'
+    setattr(detector, attribute, csv_path)
+    detector._initialize_csv(reset=False)
+
+
+def clear_detector_output(detector):
+    """
+    Vacía el dataset al que exporta un detector, dejando solo el encabezado.
+
+    Antes se escriben los landmarks pendientes, para que no lleguen después de vaciarlo.
+    """
+    flush_landmarks()
+    detector._initialize_csv(reset=True)
+
+
+def detector_pose_model(detector):
+    """
+    Devuelve el objeto de pose (mp_pose.Pose o compatible) que usa un detector.
+    """
+    pose_model = getattr(detector, 'pose_model', None)
+    return pose_model if pose_model is not None else getattr(detector, 'pose', None)
+
+
+def detector_has_pose(detector):
+    """
+    Indica si el detector encontró una pose en el último fotograma procesado.
+    """
+    return detector.landmarks.valid
+
+
+def reset_detector(detector):
+    """
+    Deja un detector listo para una nueva serie: reinicia contadores y el seguimiento de pose.
+    """
+    detector.reset_counters()
+    pose_model = detector_pose_model(detector)
+    if hasattr(pose_model, 'reset'):
+
+        pose_model.reset()
+
+
+class DetectorPool:
+    """
+    Pool acotado de detectores creados bajo demanda.
+
+    Los detectores (y sus grafos de MediaPipe Pose) solo se crean la primera vez que
+    se necesita un ejercicio. Al liberarse vuelven al pool para reutilizarse, con un
+    maximo de 'max_idle_per_exercise' en reposo por ejercicio; los que superan ese
+    maximo, o llevan mas de 'idle_timeout' segundos sin usarse, se cierran con
+    'close()' para devolver la memoria del grafo.
+    """
+
+    def __init__(self, max_idle_per_exercise=2, idle_timeout=300.0, pose_factory=None):
+
+        self.max_idle_per_exercise = max_idle_per_exercise
+        self.idle_timeout = idle_timeout
+        # Función opcional que crea el objeto de pose de cada detector nuevo
+        # (por ejemplo, un cliente del pool de inferencia)
+        self.pose_factory = pose_factory
+
+        self._idle = {} # exercise_type -> lista de (detector, instante de liberación)
+        self._in_use = {} # id(detector) -> exercise_type
+        self._lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._reaper = None
+
+    def acquire(self, exercise_type):
+        """
+        Obtiene un detector del ejercicio: uno en reposo si lo hay, o uno nuevo.
+
+        :raises KeyError: Si el tipo de ejercicio no existe.
+        """
+        if exercise_type not in DETECTOR_CLASSES:
+
+            raise KeyError(exercise_type)
+
+        with self._lock:
+
+            idle = self._idle.get(exercise_type)
+            detector = idle.pop()[0] if idle else None
+            if detector is not None:
+
+                self._in_use[id(detector)] = exercise_type
+
+        if detector is not None:
+
+            reset_detector(detector)
+            return detector
+
+        # La creación (grafo de MediaPipe) se hace fuera del lock
+        pose_model = self.pose_factory() if self.pose_factory is not None else None
+        detector = create_detector(exercise_type, pose_model=pose_model)
+        with self._lock:
+
+            self._in_use[id(detector)] = exercise_type
+        self._ensure_reaper()
+        return detector
+
+    def release(self, detector):
+        """
+        Devuelve un detector al pool (o lo cierra si el pool de ese ejercicio está lleno
+        o el pool ya se cerró).
+        """
+        to_close = None
+        with self._lock:
+
+            exercise_type = self._in_use.pop(id(detector), None)
+            if exercise_type is None or self._stop_event.is_set():
+
+                to_close = detector # No pertenece al pool, o ya nadie cerraría los detectores en reposo
+            else:
+
+                idle = self._idle.setdefault(exercise_type, [])
+                if len(idle) >= self.max_idle_per_exercise:
+
+                    to_close = detector
+                else:
+
+                    idle.append((detector, time.monotonic()))
+
+        if to_close is not None:
+
+            close_detector(to_close)
+
+    def close_idle(self, max_idle_s=None):
+        """
+        Cierra los detectores en reposo durante más de 'max_idle_s' segundos (por defecto 'idle_timeout').
+
+        Retorna:
+            int: Número de detectores cerrados.
+        """
+        max_idle_s = self.idle_timeout if max_idle_s is None else max_idle_s
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+
+            for exercise_type, idle in self._idle.items():
+
+                keep = []
+                for detector, released_at in idle:
+
+                    if now - released_at >= max_idle_s:
+
+                        expired.append(detector)
+                    else:
+
+                        keep.append((detector, released_at))
+                self._idle[exercise_type] = keep
+
+        for detector in expired:
+
+            close_detector(detector)
+        if expired:
+
+            print(f"Pool de detectores: {len(expired)} detector(es) inactivo(s) cerrado(s).")
+        return len(expired)
+
+    def _ensure_reaper(self):
+
+        with self._lock:
+
+            if self._reaper is not None or self.idle_timeout is None:
+
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="detector-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+
+        interval = max(1.0, self.idle_timeout / 2.0)
+        while not self._stop_event.wait(interval):
+
+            self.close_idle()
+
+    def stats(self):
+
+        with self._lock:
+
+            return {
+                "in_use": len(self._in_use),
+                "idle": {exercise_type: len(idle) for exercise_type, idle in self._idle.items() if idle},
+            }
+
+    def close(self):
+        """
+        Cierra todos los detectores en reposo y detiene el hilo de limpieza. Los que
+        se liberen después se cierran en lugar de volver al pool.
+        """
+        self._stop_event.set()
+        self.close_idle(max_idle_s=0)
@@ -0,0 +1,498 @@
+import argparse
+import time
+
+import numpy as np
+
+from utils.landmark_store import is_store_path, load_landmark_dataframe, load_store
+from utils.pose_landmarks import (
+    NUM_LANDMARKS, LANDMARK_VALUES, LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+    LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE
+)
+from utils.rule_engine import RuleEngine
+
+
+# Especificaciones declarativas de cada ejercicio, evaluadas por 'utils.rule_engine.RuleEngine'.
+#
+#   angles:         nombre -> terna (a, b, c) de indices; el angulo se mide en 'b'
+#   virtual_points: puntos adicionales (indices 33, 34, ...) como combinación de landmarks
+#   derived:        valores calculados a partir de los angulos y de x(i), y(i), z(i), v(i)
+#   thresholds:     umbrales ajustables; se pueden sustituir al crear el motor
+#   state:          variables de estado con su valor inicial ('start_<nombre>' es su valor al empezar el fotograma)
+#   counters:       variables con las repeticiones (correctas, incorrectas)
+#   labels:         etiquetas que el ejercicio puede exportar al dataset
+#   steps:          pasos en orden; cada paso es una cadena if/elif de ramas {when, set, export, log}
+#   metrics:        metricas que devuelve 'process_frame'
+#   no_pose:        pasos y metricas de los fotogramas sin pose
+
+SQUAT_RULES = {
+    "name": "squats",
+    # Lado izquierdo: rodilla (cadera-rodilla-tobillo), cadera (hombro-cadera-rodilla) y espalda (hombro-cadera-tobillo)
+    "angles": {
+        "knee_angle": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+        "hip_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+        "back_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_ANKLE),
+    },
+    "thresholds": {
+        "KNEE_ANGLE_UP_THRESHOLD": 160,
+        "KNEE_ANGLE_DOWN_THRESHOLD": 110,
+        "KNEE_IDEAL_MIN": 20,
+        "HIP_IDEAL_MIN": 40,
+        "BACK_IDEAL_MIN": 70,
+    },
+    "state": {
+        "squat_state": "up",
+        "reps_count": 0,
+        "incorrect_reps_count": 0,
+        "current_feedback": "Esperando...",
+        "repetition_has_error": False,
+        "stage": None,
+    },
+    "counters": ("reps_count", "incorrect_reps_count"),
+    "labels": ["up", "down", "correct_rep", "rodillas_se_doblan_demasiado", "caderas_se_doblan_demasiado", "espalda_se_inclina_demasiado"],
+    "steps": [
+        # Evaluación de la forma en cada fotograma; un error se mantiene hasta el final de la repetición
+        [
+            {"when": "knee_angle < KNEE_IDEAL_MIN", "set": {"repetition_has_error": "True", "current_feedback": "'Rodillas se doblan demasiado'"}},
+            {"when": "hip_angle < HIP_IDEAL_MIN", "set": {"repetition_has_error": "True", "current_feedback": "'Caderas se doblan demasiado'"}},
+            {"when": "back_angle < BACK_IDEAL_MIN", "set": {"repetition_has_error": "True", "current_feedback": "'Espalda se inclina demasiado'"}},
+            {"when": "not repetition_has_error", "set": {"current_feedback": "'Forma Correcta'"}},
+        ],
+        # Contador de repeticiones
+        [
+            {"when": "squat_state == 'up' and knee_angle < KNEE_ANGLE_DOWN_THRESHOLD",
+             "set": {"squat_state": "'down'", "current_feedback": "'Bajando...'", "repetition_has_error": "False"}},
+            {"when": "squat_state == 'down' and knee_angle > KNEE_ANGLE_UP_THRESHOLD and not repetition_has_error",
+             "set": {"squat_state": "'up'", "reps_count": "reps_count + 1", "current_feedback": "'Repetición Correcta'", "repetition_has_error": "False"},
+             "export": "'correct_rep'"},
+            {"when": "squat_state == 'down' and knee_angle > KNEE_ANGLE_UP_THRESHOLD",
+             "set": {"squat_state": "'up'", "incorrect_reps_count": "incorrect_reps_count + 1", "repetition_has_error": "False"},
+             "export": "slug(current_feedback)"},
+        ],
+        # 'stage': movimiento (arriba/abajo) con un pequeño margen sobre los umbrales
+        [
+            {"when": "squat_state == 'up' and knee_angle > KNEE_ANGLE_UP_THRESHOLD - 5", "set": {"stage": "'Arriba'"}},
+            {"when": "squat_state == 'up'", "set": {"stage": "'Subiendo...'"}},
+            {"when": "knee_angle < KNEE_ANGLE_DOWN_THRESHOLD + 5", "set": {"stage": "'Abajo'"}},
+            {"set": {"stage": "'Bajando...'"}},
+        ],
+        # ... salvo que haya un error o una repetición recién completada
+        [
+            {"when": "repetition_has_error", "set": {"stage": "current_feedback"}},
+            {"when": "'Correcta' in current_feedback and squat_state == 'up'", "set": {"stage": "'Repetición Correcta'"}},
+            {"when": "'Incorrecta' in current_feedback and squat_state == 'up'", "set": {"stage": "current_feedback"}},
+        ],
+        # Se exporta el estado en cada fotograma, o el tipo de repetición al finalizar
+        [
+            {"when": "squat_state == 'up' and 'Correcta' in current_feedback", "export": "'correct_rep'"},
+            {"when": "squat_state == 'up' and 'Incorrecta' in current_feedback", "export": "slug(current_feedback)"},
+            {"export": "squat_state"},
+        ],
+    ],
+    # Los contadores y el feedback se informan con su valor al empezar el fotograma
+    "metrics": {
+        "reps": "start_reps_count",
+        "incorrect_reps": "start_incorrect_reps_count",
+        "feedback": "start_current_feedback",
+        "knee_angle": "int(knee_angle)",
+        "hip_angle": "int(hip_angle)",
+        "back_angle": "int(back_angle)",
+        "stage": "stage",
+    },
+    "no_pose": {
+        "metrics": {
+            "reps": "reps_count",
+            "incorrect_reps": "incorrect_reps_count",
+            "feedback": "current_feedback",
+            "knee_angle": "-1",
+            "hip_angle": "-1",
+            "back_angle": "-1",
+        },
+    },
+}
+
+# Puntos virtuales del peso muerto: punto medio de los hombros, punto medio de las
+# caderas y un punto vertical por debajo de la cadera (indices 33, 34 y 35)
+MID_SHOULDER, MID_HIP, HIP_VERTICAL = 33, 34, 35
+
+DEADLIFT_RULES = {
+    "name": "deadlift",
+    # Torso con la vertical, caderas y rodillas (izquierda y derecha)
+    "angles": {
+        "torso_angle": (MID_SHOULDER, MID_HIP, HIP_VERTICAL),
+        "left_hip_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+        "right_hip_angle": (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+        "left_knee_angle": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+        "right_knee_angle": (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+    },
+    "virtual_points": [
+        ({LEFT_SHOULDER: 0.5, RIGHT_SHOULDER: 0.5}, (0.0, 0.0)),
+        ({LEFT_HIP: 0.5, RIGHT_HIP: 0.5}, (0.0, 0.0)),
+        ({LEFT_HIP: 0.5, RIGHT_HIP: 0.5}, (0.0, 0.1)),
+    ],
+    "derived": {
+        "avg_hip_angle": "(left_hip_angle + right_hip_angle) / 2",
+        "avg_knee_angle": "(left_knee_angle + right_knee_angle) / 2",
+    },
+    "thresholds": {
+        "hip_angle_threshold_down": 150, # Cadera casi extendida: posición de "arriba"
+        "knee_angle_threshold_min_down": 100, # Rango ideal de rodilla durante la bajada
+        "knee_angle_threshold_max_down": 160,
+        "knee_lock_threshold": 170, # Rodilla "bloqueada" (casi recta) durante la subida
+        "torso_straight_threshold_up": 170, # Torso recto en la parte superior
+        "torso_rounded_threshold": 120, # Por debajo, torso redondeado (incorrecto)
+    },
+    "state": {
+        "stage": "initial", # "initial", "down", "transition", "up"
+        "correct_reps": 0,
+        "incorrect_reps": 0,
+        # Estado de la repetición en curso. Al bajar se marca "none" (nunca "correct"), por lo que
+        # los chequeos de la subida no cambian nada y toda repetición se cuenta como incorrecta
+        "rep_status": "unknown",
+        "min_hip_angle_in_down": 180, # Ángulo de cadera más bajo alcanzado durante el descenso
+    },
+    "counters": ("correct_reps", "incorrect_reps"),
+    "labels": ["down", "transition", "up"],
+    # Cada fase solo se evalúa si era la fase al empezar el fotograma (cadena if/elif sobre 'stage')
+    "steps": [
+        # INITIAL: la cadera empieza a flexionarse
+        [
+            {"when": "start_stage == 'initial' and avg_hip_angle < hip_angle_threshold_down",
+             "set": {"stage": "'down'", "rep_status": "'none'", "min_hip_angle_in_down": "avg_hip_angle"},
+             "log": ["Transición a DOWN desde INITIAL."]},
+        ],
+        # DOWN: bajando el peso
+        [
+            {"when": "start_stage == 'down' and avg_hip_angle < min_hip_angle_in_down", "set": {"min_hip_angle_in_down": "avg_hip_angle"}},
+        ],
+        [
+            {"when": "start_stage == 'down' and not (knee_angle_threshold_min_down < avg_knee_angle < knee_angle_threshold_max_down)",
+             "set": {"rep_status": "'incorrect'"}, "log": ["DOWN: Rodillas fuera de rango ideal."]},
+        ],
+        [
+            {"when": "start_stage == 'down' and torso_angle < torso_rounded_threshold",
+             "set": {"rep_status": "'incorrect'"}, "log": ["DOWN: Torso redondeado."]},
+        ],
+        [
+            # La cadera sube más de 5 grados desde su punto más bajo: empieza la subida
+            {"when": "start_stage == 'down' and avg_hip_angle > min_hip_angle_in_down + 5",
+             "set": {"stage": "'transition'"}, "log": ["Transición a TRANSITION desde DOWN."]},
+        ],
+        # TRANSITION: subiendo el peso
+        [
+            {"when": "start_stage == 'transition' and avg_knee_angle > knee_lock_threshold and torso_angle < torso_straight_threshold_up - 10 and rep_status == 'correct'",
+             "set": {"rep_status": "'incorrect'"}, "log": ["TRANSITION: Rodillas bloqueadas prematuramente (antes que la espalda)."]},
+        ],
+        [
+            {"when": "start_stage == 'transition' and torso_angle < torso_rounded_threshold and rep_status == 'correct'",
+             "set": {"rep_status": "'incorrect'"}, "log": ["TRANSITION: Torso redondeado durante la subida."]},
+        ],
+        [
+            {"when": "start_stage == 'transition' and avg_hip_angle > hip_angle_threshold_down and rep_status == 'correct'",
+             "set": {"stage": "'up'", "correct_reps": "correct_reps + 1", "rep_status": "'unknown'"},
+             "log": ["Transición a UP desde TRANSITION", "¡Repetición CORRECTA! Total correctas: {correct_reps}"]},
+            {"when": "start_stage == 'transition' and avg_hip_angle > hip_angle_threshold_down",
+             "set": {"stage": "'up'", "incorrect_reps": "incorrect_reps + 1", "rep_status": "'unknown'"},
+             "log": ["Transición a UP desde TRANSITION", "¡Repetición INCORRECTA! Total incorrectas: {incorrect_reps}"]},
+        ],
+        # UP: de pie; se vuelve a INITIAL si la cadera sigue extendida
+        [
+            {"when": "start_stage == 'up' and avg_hip_angle > hip_angle_threshold_down - 5",
+             "set": {"stage": "'initial'"}, "log": ["Volviendo a INITIAL desde UP."]},
+        ],
+        # Solo se exportan las fases activas de la repetición
+        [
+            {"when": "stage in ('down', 'transition', 'up')", "export": "stage"},
+        ],
+    ],
+    "metrics": {
+        "correct_reps": "correct_reps",
+        "incorrect_reps": "incorrect_reps",
+        "stage": "stage",
+        "csv_stage": "stage",
+        "left_hip_angle": "int(left_hip_angle)",
+        "right_hip_angle": "int(right_hip_angle)",
+        "left_knee_angle": "int(left_knee_angle)",
+        "right_knee_angle": "int(right_knee_angle)",
+        "torso_angle": "int(torso_angle)",
+    },
+    "no_pose": {
+        "metrics": {
+            "correct_reps": "correct_reps",
+            "incorrect_reps": "incorrect_reps",
+            "stage": "stage",
+            "csv_stage": "stage",
+            "left_hip_angle": "0",
+            "right_hip_angle": "0",
+            "left_knee_angle": "0",
+            "right_knee_angle": "0",
+            "torso_angle": "0",
+        },
+    },
+}
+
+PUSHUP_RULES = {
+    "name": "pushups",
+    # Caderas, rodillas y codos (izquierda y derecha)
+    "angles": {
+        "left_hip_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+        "right_hip_angle": (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+        "left_knee_angle": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+        "right_knee_angle": (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+        "left_elbow_angle": (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+        "right_elbow_angle": (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+    },
+    "derived": {
+        "avg_elbow_angle": "(left_elbow_angle + right_elbow_angle) / 2",
+        "avg_hip_angle": "(left_hip_angle + right_hip_angle) / 2",
+    },
+    "thresholds": {
+        "elbow_threshold_down": 100, # Codo para considerar la posición "abajo"
+        "elbow_threshold_up": 160, # Codo para considerar la posición "arriba"
+        "incorrect_hip_angle_threshold": 160, # Cadera por debajo: cadera "caída" (incorrecta)
+    },
+    "state": {
+        "stage": None, # None, 'down' o 'up'
+        "counter_correct": 0,
+        "counter_incorrect": 0,
+        "current_export_label": "neutral",
+        "hip_angle_at_down_stage": None, # Ángulo de cadera al llegar a 'down'
+    },
+    "counters": ("counter_correct", "counter_incorrect"),
+    "labels": ["neutral", "down", "up", "correct_finish", "incorrect_finish", "no_pose_detected"],
+    "steps": [
+        [
+            # Bajada: empieza una repetición y se guarda la cadera para evaluarla al subir
+            {"when": "stage != 'down' and avg_elbow_angle < elbow_threshold_down",
+             "set": {"stage": "'down'", "current_export_label": "'down'", "hip_angle_at_down_stage": "avg_hip_angle"}},
+            {"when": "stage == 'up'", "set": {"current_export_label": "'up'"}},
+            {"when": "stage == 'down' and avg_elbow_angle > elbow_threshold_up and hip_angle_at_down_stage is not None and hip_angle_at_down_stage < incorrect_hip_angle_threshold",
+             "set": {"counter_incorrect": "counter_incorrect + 1", "current_export_label": "'incorrect_finish'", "stage": "'up'", "hip_angle_at_down_stage": "None"}},
+            {"when": "stage == 'down' and avg_elbow_angle > elbow_threshold_up",
+             "set": {"counter_correct": "counter_correct + 1", "current_export_label": "'correct_finish'", "stage": "'up'", "hip_angle_at_down_stage": "None"}},
+            {"when": "stage == 'down'", "set": {"current_export_label": "'down'"}},
+        ],
+        [
+            {"export": "current_export_label"},
+        ],
+    ],
+    "metrics": {
+        "reps": "counter_correct",
+        "incorrect_reps": "counter_incorrect",
+        "stage": "stage",
+        "current_export_label": "current_export_label",
+        "L_Hip_Angle": "int(left_hip_angle)",
+        "R_Hip_Angle": "int(right_hip_angle)",
+        "L_Knee_Angle": "int(left_knee_angle)",
+        "R_Knee_Angle": "int(right_knee_angle)",
+        "L_Elbow_Angle": "int(left_elbow_angle)",
+        "R_Elbow_Angle": "int(right_elbow_angle)",
+    },
+    "no_pose": {
+        "steps": [
+            [{"set": {"current_export_label": "'no_pose_detected'"}}],
+        ],
+        "metrics": {
+            "reps": "counter_correct",
+            "incorrect_reps": "counter_incorrect",
+            "stage": "stage",
+            "current_export_label": "current_export_label",
+            "L_Hip_Angle": "-1",
+            "R_Hip_Angle": "-1",
+            "L_Knee_Angle": "-1",
+            "R_Knee_Angle": "-1",
+            "L_Elbow_Angle": "-1",
+            "R_Elbow_Angle": "-1",
+        },
+    },
+}
+
+SHOULDER_PRESS_RULES = {
+    "name": "shoulder_press",
+    # Codos (hombro-codo-muñeca), derecho e izquierdo
+    "angles": {
+        "angle_r_elbow": (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+        "angle_l_elbow": (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+    },
+    "derived": {
+        "avg_elbow_angle": "(angle_r_elbow + angle_l_elbow) / 2",
+        # Profundidad del codo respecto al hombro: codos adelantados o atrasados respecto al plano
+        "z_diff_r": "z(RIGHT_ELBOW) - z(RIGHT_SHOULDER)",
+        "z_diff_l": "z(LEFT_ELBOW) - z(LEFT_SHOULDER)",
+    },
+    "thresholds": {
+        "Z_THRESHOLD_FORWARD": 0.23,
+        "Z_THRESHOLD_BACKWARD": -0.23,
+        "ANGLE_THRESHOLD_FULL_EXTENSION": 150,
+        "ELBOW_ANGLE_DOWN": 100, # Codos flexionados (abajo)
+        "ELBOW_ANGLE_UP": 160, # Codos extendidos (arriba)
+    },
+    "state": {
+        "stage": None,
+        "reps": 0,
+        "incorrect_reps": 0,
+        "shoulder_plane_status_r": "OK",
+        "shoulder_plane_status_l": "OK",
+        "max_angle_reached": 0,
+        "last_rep_outcome_state": None,
+        "current_stage_for_export": "no_pose",
+    },
+    "counters": ("reps", "incorrect_reps"),
+    "labels": ["down", "transition", "up_initial", "correct_up", "incorrect_short_range", "incorrect_plane"],
+    "steps": [
+        [
+            {"when": "z_diff_r > Z_THRESHOLD_FORWARD", "set": {"shoulder_plane_status_r": "'ADELANTE'"}},
+            {"when": "z_diff_r < Z_THRESHOLD_BACKWARD", "set": {"shoulder_plane_status_r": "'ATRAS'"}},
+            {"set": {"shoulder_plane_status_r": "'OK'"}},
+        ],
+        [
+            {"when": "z_diff_l > Z_THRESHOLD_FORWARD", "set": {"shoulder_plane_status_l": "'ADELANTE'"}},
+            {"when": "z_diff_l < Z_THRESHOLD_BACKWARD", "set": {"shoulder_plane_status_l": "'ATRAS'"}},
+            {"set": {"shoulder_plane_status_l": "'OK'"}},
+        ],
+        [
+            # Codos flexionados (abajo): empieza una repetición
+            {"when": "avg_elbow_angle < ELBOW_ANGLE_DOWN",
+             "set": {"stage": "'down'", "current_stage_for_export": "'down'", "max_angle_reached": "0", "last_rep_outcome_state": "None"}},
+            # Codos extendidos (arriba) desde 'down': se evalúa la repetición
+            {"when": "avg_elbow_angle > ELBOW_ANGLE_UP and stage == 'down' and shoulder_plane_status_r == 'OK' and shoulder_plane_status_l == 'OK' and max_angle_reached >= ANGLE_THRESHOLD_FULL_EXTENSION",
+             "set": {"stage": "'up'", "reps": "reps + 1", "current_stage_for_export": "'correct_up'", "last_rep_outcome_state": "'correct_up'"}},
+            {"when": "avg_elbow_angle > ELBOW_ANGLE_UP and stage == 'down' and shoulder_plane_status_r == 'OK' and shoulder_plane_status_l == 'OK'",
+             "set": {"stage": "'invalid'", "incorrect_reps": "incorrect_reps + 1", "current_stage_for_export": "'incorrect_short_range'", "last_rep_outcome_state": "'incorrect_short_range'"}},
+            {"when": "avg_elbow_angle > ELBOW_ANGLE_UP and stage == 'down'",
+             "set": {"stage": "'invalid'", "incorrect_reps": "incorrect_reps + 1", "current_stage_for_export": "'incorrect_plane'", "last_rep_outcome_state": "'incorrect_plane'"}},
+            # Arriba sin venir de 'down': se mantiene el último resultado o es la posición inicial
+            {"when": "avg_elbow_angle > ELBOW_ANGLE_UP and last_rep_outcome_state is not None", "set": {"current_stage_for_export": "last_rep_outcome_state"}},
+            {"when": "avg_elbow_angle > ELBOW_ANGLE_UP", "set": {"stage": "'up_initial'", "current_stage_for_export": "'up_initial'"}},
+            # Fase de transición
+            {"when": "stage in ('down', 'up_initial')",
+             "set": {"max_angle_reached": "max(max_angle_reached, avg_elbow_angle)", "current_stage_for_export": "'transition'"}},
+            {"when": "last_rep_outcome_state is not None", "set": {"current_stage_for_export": "last_rep_outcome_state"}},
+            {"set": {"current_stage_for_export": "'transition'"}},
+        ],
+        [
+            {"export": "current_stage_for_export"},
+        ],
+    ],
+    "metrics": {
+        "reps": "reps",
+        "incorrect_reps": "incorrect_reps",
+        "stage": "stage",
+        "csv_stage": "current_stage_for_export",
+        "max_angle": "int(max_angle_reached)",
+        "shoulder_plane_r": "shoulder_plane_status_r",
+        "shoulder_plane_l": "shoulder_plane_status_l",
+    },
+    "no_pose": {
+        "steps": [
+            [{"set": {"current_stage_for_export": "'no_pose'"}}],
+        ],
+    },
+}
+
+EXERCISE_RULES = {
+    "squats": SQUAT_RULES,
+    "deadlift": DEADLIFT_RULES,
+    "pushups": PUSHUP_RULES,
+    "shoulder_press": SHOULDER_PRESS_RULES,
+}
+
+
+def create_rule_engine(exercise_type, thresholds=None):
+    """
+    Crea el motor de reglas de un ejercicio, opcionalmente con otros umbrales.
+
+    :raises ValueError: Si el ejercicio no existe o algún umbral no pertenece a su especificación.
+    """
+    if exercise_type not in EXERCISE_RULES:
+
+        raise ValueError(f"Tipo de ejercicio no válido: '{exercise_type}'")
+    return RuleEngine(EXERCISE_RULES[exercise_type], thresholds=thresholds)
+
+
+def load_landmark_sequence(path):
+    """
+    Carga un dataset de landmarks ('.csv' o '.lmk') como secuencia (T, 33, 4).
+
+    Las filas consecutivas idénticas (un fotograma exportado dos veces, por ejemplo al
+    completar una sentadilla) se cuentan una sola vez.
+    """
+    if is_store_path(path):
+
+        coords, _, _ = load_store(path)
+    else:
+
+        coords = load_landmark_dataframe(path).iloc[:, 1:].to_numpy(dtype=np.float32)
+    coords = np.asarray(coords, dtype=np.float32)
+    if len(coords) > 1:
+
+        repeated = np.all(coords[1:] == coords[:-1], axis=1)
+        coords = coords[np.concatenate([[True], ~repeated])]
+    return coords.reshape(-1, NUM_LANDMARKS, LANDMARK_VALUES)
+
+
+def rescore(path, exercise_type, thresholds=None):
+    """
+    Re-evalúa un dataset de landmarks grabado con las reglas (y umbrales) indicados.
+
+    :return: Resultado de 'RuleEngine.evaluate' con el tiempo empleado.
+    """
+    engine = create_rule_engine(exercise_type, thresholds)
+    start = time.perf_counter()
+    sequence = load_landmark_sequence(path)
+    results = engine.evaluate(sequence)
+    results["path"] = path
+    results["thresholds"] = engine.thresholds
+    results["processing_s"] = round(time.perf_counter() - start, 3)
+    return results
+
+
+def _parse_threshold(text):
+
+    name, sep, value = text.partition('=')
+    if not sep:
+
+        raise argparse.ArgumentTypeError(f"Se esperaba UMBRAL=VALOR: '{text}'")
+    try:
+        return name.strip(), float(value)
+    except ValueError:
+
+        raise argparse.ArgumentTypeError(f"Valor no numérico para '{name}': '{value}'") from None
+
+
+def main(argv=None):
+    """
+    CLI: re-evalúa sesiones grabadas con otros umbrales, sin reproducir el video.
+
+    Ejemplo:
+        python -m utils.exercise_rules data/coords_sentadilla.lmk --exercise squats --set KNEE_ANGLE_DOWN_THRESHOLD=105
+    """
+    parser = argparse.ArgumentParser(description="Re-evaluación de datasets de landmarks con las reglas de un ejercicio.")
+    parser.add_argument("inputs", nargs='+', help="Datasets de landmarks ('.csv' o '.lmk').")
+    parser.add_argument("--exercise", required=True, choices=sorted(EXERCISE_RULES), help="Tipo de ejercicio.")
+    parser.add_argument("--set", dest="thresholds", action='append', type=_parse_threshold, default=[],
+                        metavar="UMBRAL=VALOR", help="Sustituye un umbral de la especificación (se puede repetir).")
+    parser.add_argument("--list-thresholds", action='store_true', help="Muestra los umbrales del ejercicio y termina.")
+    args = parser.parse_args(argv)
+
+    if args.list_thresholds:
+
+        for name, value in EXERCISE_RULES[args.exercise]["thresholds"].items():
+
+            print(f"{name} = {value}")
+        return
+
+    thresholds = dict(args.thresholds)
+    for path in args.inputs:
+
+        try:
+            results = rescore(path, args.exercise, thresholds)
+        except ValueError as e:
+
+            parser.error(str(e))
+        labels = ", ".join(f"{label}: {count}" for label, count in sorted(results["label_counts"].items()))
+        print(f"'{path}': {results['correct_reps']} correctas, {results['incorrect_reps']} incorrectas "
+              f"({results['frames']} fotogramas en {results['processing_s']} s). Etiquetas: {labels}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+import itertools
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, RidgeClassifier
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from utils.compiled_model import compile_pipeline
+from utils.pose_features import PoseFeatures
+from utils.process_pool import spawn_executor, stop_executor
+
+
+# Valores por defecto de la búsqueda
+DEFAULT_BUDGET_S = 60.0 # Segundos de reloj para las rondas de eliminación
+DEFAULT_ETA = 3 # En cada ronda sigue 1 de cada 'eta' configuraciones, con 'eta' veces más filas
+VALIDATION_SIZE = 0.25 # Parte del entrenamiento reservada para comparar configuraciones
+MIN_ROWS_PER_CLASS = 4 # Filas mínimas por clase en la primera ronda
+LATENCY_REPEATS = 20 # Predicciones de una fila para medir la latencia en vivo
+
+# Espacio de búsqueda: estimador base y valores de sus hiperparámetros por familia.
+# Con 'lbfgs' la regresión logística admite más de dos clases (liblinear no).
+SEARCH_SPACE = {
+    'lr': (LogisticRegression(max_iter=1000, random_state=1234), {'C': [0.01, 0.1, 1.0, 10.0]}),
+    'rc': (RidgeClassifier(random_state=1234), {'alpha': [0.1, 1.0, 10.0, 100.0]}),
+    'rf': (RandomForestClassifier(random_state=1234), {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 12],
+        'min_samples_leaf': [1, 3],
+    }),
+    'gb': (GradientBoostingClassifier(random_state=1234), {
+        'n_estimators': [50, 100],
+        'learning_rate': [0.05, 0.1, 0.2],
+        'max_depth': [2, 3],
+    }),
+}
+
+
+def search_configurations(space=SEARCH_SPACE):
+    """
+    Todas las configuraciones del espacio como lista de (familia, parámetros).
+    """
+    configurations = []
+    for algo, (_, grid) in space.items():
+
+        names = sorted(grid)
+        for values in itertools.product(*(grid[name] for name in names)):
+
+            configurations.append((algo, dict(zip(names, values))))
+    return configurations
+
+
+def describe_space(space=SEARCH_SPACE):
+    """
+    Descripción serializable del espacio (para la clave de la caché de análisis).
+    """
+    return {algo: {"estimator": repr(estimator), "grid": grid} for algo, (estimator, grid) in space.items()}
+
+
+def _stratified_order(y, seed):
+
+    # Orden de las filas en el que cualquier prefijo mantiene la proporción de clases:
+    # los subconjuntos de cada ronda están anidados y contienen todas las clases
+    rng = np.random.default_rng(seed)
+    keys = np.empty(len(y))
+    for label in np.unique(y):
+
+        index = np.flatnonzero(y == label)
+        keys[rng.permutation(index)] = (np.arange(len(index)) + rng.random()) / len(index)
+    return np.argsort(keys, kind='stable')
+
+
+def _metrics(y_true, yhat):
+
+    return {
+        "accuracy": accuracy_score(y_true, yhat),
+        "precision": precision_score(y_true, yhat, average='weighted', zero_division=0),
+        "recall": recall_score(y_true, yhat, average='weighted', zero_division=0),
+        "f1_score": f1_score(y_true, yhat, average='weighted', zero_division=0),
+    }
+
+
+# Datos ya escalados de cada proceso del pool: se envían una sola vez al crearlo
+_worker_data = None
+
+
+def _init_worker(data):
+
+    global _worker_data
+    _worker_data = data
+
+
+def _evaluate(algo, params, rows, space, data=None):
+
+    # Una configuración entrenada con las primeras 'rows' filas y puntuada en validación
+    X_fit, y_fit, X_val, y_val = (data or _worker_data)["search"]
+    start = time.perf_counter()
+    try:
+        estimator = clone(space[algo][0]).set_params(**params)
+        estimator.fit(X_fit[:rows], y_fit[:rows])
+        fit_s = time.perf_counter() - start
+        return {"accuracy": accuracy_score(y_val, estimator.predict(X_val)), "fit_s": fit_s, "error": None}
+    except Exception as e:
+
+        return {"accuracy": None, "fit_s": time.perf_counter() - start, "error": str(e)}
+
+
+def _refit(algo, params, space, data=None):
+
+    # Finalista de una familia reentrenado con todo el entrenamiento y evaluado en prueba
+    X_train, y_train, X_test, y_test = (data or _worker_data)["final"]
+    start = time.perf_counter()
+    try:
+        estimator = clone(space[algo][0]).set_params(**params)
+        estimator.fit(X_train, y_train)
+        fit_s = time.perf_counter() - start
+        result = _metrics(y_test, estimator.predict(X_test))
+        result.update({"algo": algo, "estimator": estimator, "fit_s": fit_s, "error": None})
+    except Exception as e:
+
+        result = {"algo": algo, "estimator": None, "fit_s": time.perf_counter() - start, "error": str(e)}
+    result["wall_s"] = time.perf_counter() - start
+    return result
+
+
+def _new_executor(workers, data):
+
+    return spawn_executor(workers, _init_worker, (data,))
+
+
+class HyperparameterSearch:
+    """
+    Búsqueda de hiperparámetros por eliminación sucesiva ('successive halving') entre
+    todas las familias de modelos a la vez, con un presupuesto de tiempo de reloj.
+
+    El entrenamiento se divide una vez en ajuste y validación. En la primera ronda todas
+    las configuraciones del espacio se entrenan con pocas filas; en cada ronda siguiente
+    sigue la mejor de cada 'eta' (por exactitud en validación) con 'eta' veces más filas,
+    hasta usar todas o quedar una. Las configuraciones se reparten entre 'workers'
+    procesos. Si se agota 'budget_s', las que no han terminado se descartan (sus procesos
+    se terminan) y se usa la última ronda completada. En serie, un entrenamiento ya
+    empezado no se interrumpe, ni tampoco el arranque de los procesos del pool:
+    'summary()' informa del exceso real sobre el presupuesto ('overrun_s') y del tiempo
+    gastado en enviar las tareas, arranque incluido ('submit_s').
+
+    El escalado se calcula una sola vez (para la búsqueda y para el reentrenamiento
+    final) y cada proceso recibe los datos escalados al crearse: los candidatos solo
+    entrenan el clasificador (con 'features', lo mismo vale para las características de
+    pose, que se calculan antes de escalar). Al final, la mejor configuración de cada familia se
+    reentrena con todo el entrenamiento y se evalúa en prueba; estos finalistas son los
+    candidatos de 'entrenar_y_evaluar_modelo'. El reentrenamiento final, en un pool nuevo,
+    no cuenta para el presupuesto.
+
+    'summary()' devuelve el tiempo y la exactitud de cada configuración en cada ronda y,
+    para los finalistas, la latencia de una predicción con el modelo compilado.
+    """
+
+    def __init__(self, budget_s=DEFAULT_BUDGET_S, eta=DEFAULT_ETA, workers=None, space=SEARCH_SPACE, seed=1234,
+                 features=False):
+
+        self.budget_s = float(budget_s)
+        self.eta = max(2, int(eta))
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.space = space
+        self.seed = seed
+        self.features = features
+        self.records = [
+            {"algo": algo, "params": params, "status": "pending", "rounds": []}
+            for algo, params in search_configurations(space)
+        ]
+        self.rounds = []
+        self.finalists = {}
+        self.search_s = None
+        self.refit_s = None
+        self.submit_s = 0.0
+
+    def _schedule(self, n_rows, n_classes):
+
+        # Filas de cada ronda: la última usa todas, cada una anterior 'eta' veces menos
+        n_rounds = max(1, int(math.floor(math.log(len(self.records), self.eta))) + 1)
+        min_rows = min(n_rows, n_classes * MIN_ROWS_PER_CLASS)
+        schedule = [max(min_rows, n_rows // self.eta ** (n_rounds - 1 - r)) for r in range(n_rounds)]
+        return sorted(set(schedule))
+
+    def _prepare(self, X_train, y_train, X_test, y_test):
+
+        # Las características de pose también se calculan una sola vez, antes del escalado
+        self._live_row = np.asarray(X_test, dtype=np.float64)[:1]
+        self.feature_stage = None
+        if self.features:
+
+            self.feature_stage = PoseFeatures().fit(X_train)
+            X_train = self.feature_stage.transform(X_train)
+            X_test = self.feature_stage.transform(X_test)
+
+        X_train = np.asarray(X_train, dtype=np.float64)
+        X_test = np.asarray(X_test, dtype=np.float64)
+        y_train = np.asarray(y_train)
+        y_test = np.asarray(y_test)
+
+        X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=VALIDATION_SIZE,
+                                                      random_state=self.seed, stratify=y_train)
+        order = _stratified_order(y_fit, self.seed)
+        search_scaler = StandardScaler().fit(X_fit)
+
+        self.scaler = StandardScaler().fit(X_train)
+        return {
+            "search": (search_scaler.transform(X_fit)[order], y_fit[order], search_scaler.transform(X_val), y_val),
+            "final": (self.scaler.transform(X_train), y_train, self.scaler.transform(X_test), y_test),
+        }
+
+    def _run_round(self, executor, data, survivors, rows, deadline):
+
+        # Devuelve True si quedaron entrenamientos sin terminar en el pool
+
+        if executor is None:
+
+            for record in survivors:
+
+                if time.perf_counter() >= deadline:
+
+                    record["status"] = "timeout"
+                    continue
+                record["rounds"].append(dict(rows=rows, **_evaluate(record["algo"], record["params"], rows, self.space, data)))
+            return False
+
+        # El primer envío arranca los procesos del pool ('spawn'): no se puede interrumpir
+        submit_start = time.perf_counter()
+        futures = {executor.submit(_evaluate, record["algo"], record["params"], rows, self.space): record for record in survivors}
+        self.submit_s += time.perf_counter() - submit_start
+        pending = set(futures)
+        while pending:
+
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+            for future in done:
+
+                futures[future]["rounds"].append(dict(rows=rows, **future.result()))
+            if not done and time.perf_counter() >= deadline:
+
+                break
+
+        # Lo que no terminó a tiempo se descarta (las tareas aún en cola se cancelan)
+        for future in pending:
+
+            future.cancel()
+            futures[future]["status"] = "timeout"
+        return bool(pending)
+
+    def run(self, X_train, y_train, X_test, y_test, progress=None):
+        """
+        Ejecuta la búsqueda y reentrena los finalistas.
+
+        :param progress: Función opcional progress(evento, **detalles) (ver 'entrenar_y_evaluar_modelo').
+        :return: Generador de un resultado por familia con el modelo (StandardScaler + clasificador,
+                 o None si falla), sus métricas en prueba, 'fit_s', 'wall_s' y el error, si lo hubo.
+        """
+        progress = progress or (lambda event, **details: None)
+        start = time.perf_counter()
+        deadline = start + self.budget_s
+        data = self._prepare(X_train, y_train, X_test, y_test)
+        schedule = self._schedule(len(data["search"][1]), len(np.unique(data["search"][1])))
+
+        # Pool propio de la búsqueda: al agotarse el presupuesto se detiene sin esperar
+        executor = _new_executor(self.workers, data) if self.workers > 1 else None
+        abandoned = False
+        try:
+            survivors = list(self.records)
+            for round_index, rows in enumerate(schedule):
+
+                if not survivors or time.perf_counter() >= deadline:
+
+                    break
+                round_start = time.perf_counter()
+                for algo in self.space:
+
+                    count = sum(1 for record in survivors if record["algo"] == algo)
+                    if count:
+
+                        progress("candidate", algo=algo, status="searching", round=round_index, rows=rows, configs=count)
+
+                abandoned = self._run_round(executor, data, survivors, rows, deadline) or abandoned
+                scored = [record for record in survivors if record["rounds"] and record["rounds"][-1]["rows"] == rows
+                          and record["rounds"][-1]["error"] is None]
+                for record in survivors:
+
+                    if record["rounds"] and record["rounds"][-1]["error"] is not None:
+
+                        record["status"] = "failed"
+
+                self.rounds.append({"rows": rows, "configs": len(survivors), "completed": len(scored),
+                                    "wall_s": round(time.perf_counter() - round_start, 3)})
+                if not scored:
+
+                    break
+
+                # Siguen las mejores por exactitud; ante un empate, la que entrena más rápido
+                scored.sort(key=lambda record: (-record["rounds"][-1]["accuracy"], record["rounds"][-1]["fit_s"]))
+                keep = max(1, math.ceil(len(scored) / self.eta)) if round_index < len(schedule) - 1 else len(scored)
+                for record in scored[keep:]:
+
+                    record["status"] = "eliminated"
+                survivors = scored[:keep]
+                if len(survivors) == 1:
+
+                    break
+
+            for record in survivors:
+
+                if record["status"] == "pending":
+
+                    record["status"] = "survivor"
+        finally:
+            stop_executor(executor, abandoned)
+        self.search_s = time.perf_counter() - start
+
+        # Mejor configuración de cada familia: la que llegó más lejos y, en esa ronda, con mayor exactitud
+        for algo in self.space:
+
+            evaluated = [record for record in self.records if record["algo"] == algo
+                         and any(r["error"] is None for r in record["rounds"])]
+            if evaluated:
+
+                self.finalists[algo] = max(evaluated, key=lambda record: (
+                    max(r["rows"] for r in record["rounds"] if r["error"] is None),
+                    [r["accuracy"] for r in record["rounds"] if r["error"] is None][-1],
+                ))
+
+        refit_start = time.perf_counter()
+        workers = min(self.workers, len(self.finalists))
+        executor = _new_executor(workers, data) if workers > 1 else None
+        try:
+            yield from self._refit_finalists(executor, data, progress)
+        finally:
+            stop_executor(executor, False)
+        self.refit_s = time.perf_counter() - refit_start
+
+    def _refit_finalists(self, executor, data, progress):
+
+        for algo in self.space:
+
+            if algo not in self.finalists:
+
+                progress("candidate", algo=algo, status="failed", error="Ninguna configuración terminó a tiempo")
+                yield {"algo": algo, "model": None, "fit_s": None, "wall_s": 0.0,
+                       "error": "Ninguna configuración terminó a tiempo"}
+
+        if executor is None:
+
+            results = (_refit(algo, record["params"], self.space, data) for algo, record in self.finalists.items())
+        else:
+
+            futures = [executor.submit(_refit, algo, record["params"], self.space) for algo, record in self.finalists.items()]
+            results = (future.result() for future in futures)
+
+        for algo in self.finalists:
+
+            progress("candidate", algo=algo, status="running")
+        for result in results:
+
+            estimator = result.pop("estimator")
+            steps = [self.feature_stage] if self.feature_stage is not None else []
+            result["model"] = make_pipeline(*steps, self.scaler, estimator) if estimator is not None else None
+            record = self.finalists[result["algo"]]
+            record["status"] = "finalist"
+            record["test_accuracy"] = result.get("accuracy")
+            record["live_predict_us"] = _live_latency_us(result["model"], self._live_row)
+            yield result
+
+    def summary(self):
+        """
+        Configuraciones evaluadas (familia, parámetros, estado y cada ronda con sus filas,
+        exactitud en validación y tiempo de entrenamiento) y los finalistas.
+        """
+        def clean(record):
+
+            entry = {key: value for key, value in record.items() if key != "rounds"}
+            entry["rounds"] = [
+                {"rows": r["rows"], "accuracy": round(r["accuracy"], 4) if r["accuracy"] is not None else None,
+                 "fit_s": round(r["fit_s"], 4), "error": r["error"]}
+                for r in record["rounds"]
+            ]
+            return entry
+
+        return {
+            "budget_s": self.budget_s,
+            "search_s": round(self.search_s, 3) if self.search_s is not None else None,
+            "overrun_s": round(max(0.0, self.search_s - self.budget_s), 3) if self.search_s is not None else None,
+            "submit_s": round(self.submit_s, 3),
+            "refit_s": round(self.refit_s, 3) if self.refit_s is not None else None,
+            "eta": self.eta,
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "finalists": {algo: record["params"] for algo, record in self.finalists.items()},
+            "candidates": [clean(record) for record in self.records],
+        }
+
+
+def _live_latency_us(model, X_row):
+
+    # Mediana de una predicción de una fila con el predictor compilado (el que usa la clasificación en vivo)
+    if model is None:
+
+        return None
+    try:
+        compiled = compile_pipeline(model)
+    except ValueError:
+
+        return None
+    times = []
+    for _ in range(LATENCY_REPEATS):
+
+        start = time.perf_counter()
+        compiled.predict(X_row)
+        times.append(time.perf_counter() - start)
+    return round(float(np.median(times)) * 1e6, 1)
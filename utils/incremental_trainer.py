@@ -0,0 +1,315 @@
+import argparse
+import copy
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from utils.compiled_model import compile_pipeline, compiled_model_path
+from utils.exercise_rules import EXERCISE_RULES
+from utils.landmark_dataset import get_dataset
+from utils.landmark_store import COORD_COLUMNS, NUM_COORDS, is_store_path, open_store
+from utils.model_registry import get_model_registry
+
+
+# Valores por defecto del entrenamiento incremental
+DEFAULT_SNAPSHOT_INTERVAL = 30.0 # Segundos entre versiones publicadas del modelo
+DEFAULT_MIN_SNAPSHOT_ROWS = 256 # Filas nuevas necesarias para publicar una versión
+DEFAULT_MAX_PENDING_BATCHES = 256 # Lotes en espera (si se llena, los lotes nuevos se descartan)
+DEFAULT_CHUNK_ROWS = 4096 # Filas por bloque al entrenar desde un archivo
+
+
+def incremental_model_path(model_path):
+    """
+    Ruta lógica del modelo incremental de un ejercicio ('models/x.pkl' -> 'models/x.incremental.pkl').
+    """
+    return f"{os.path.splitext(model_path)[0]}.incremental.pkl"
+
+
+def _new_estimators():
+
+    return StandardScaler(), SGDClassifier(loss='log_loss', alpha=1e-4, random_state=1234)
+
+
+class IncrementalTrainer:
+    """
+    Entrenamiento incremental del modelo de un ejercicio con 'partial_fit'.
+
+    Se registra como receptor del escritor de landmarks ('LandmarkWriter.add_listener'):
+    cada lote de filas etiquetadas que los detectores exportan al dataset del ejercicio
+    (archivo de entrenamiento o segmentos de sesión) se encola y un hilo propio actualiza
+    con él un StandardScaler y un SGDClassifier logístico. El coste de cada actualización
+    depende solo de las filas nuevas, no del histórico.
+
+    Antes de aprender de un lote se predice con el modelo actual (validación progresiva),
+    lo que da una exactitud sobre datos aún no vistos sin reservar un conjunto de prueba.
+
+    Cada 'snapshot_interval' segundos, si hay al menos 'min_snapshot_rows' filas nuevas,
+    se publica una copia del modelo en el registro de modelos ('<modelo>.incremental.pkl')
+    junto con su versión compilada; la clasificación en vivo la recoge en caliente. Al
+    arrancar se continúa desde la última versión publicada.
+    """
+
+    def __init__(self, exercise_type, model_path, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+                 min_snapshot_rows=DEFAULT_MIN_SNAPSHOT_ROWS, max_pending_batches=DEFAULT_MAX_PENDING_BATCHES,
+                 registry=None):
+
+        if exercise_type not in EXERCISE_RULES:
+
+            raise ValueError(f"Tipo de ejercicio no válido: '{exercise_type}'")
+
+        self.exercise_type = exercise_type
+        self.snapshot_path = incremental_model_path(model_path)
+        self.snapshot_interval = float(snapshot_interval)
+        self.min_snapshot_rows = max(1, int(min_snapshot_rows))
+        self.registry = registry or get_model_registry()
+
+        # Las clases posibles son las etiquetas que exportan las reglas del ejercicio
+        self.classes = np.array(sorted(EXERCISE_RULES[exercise_type]["labels"]))
+
+        dataset = get_dataset(exercise_type)
+        self._training_path = os.path.abspath(dataset.training_path)
+        self._segment_dir = os.path.join(os.path.abspath(dataset.segment_dir), '')
+
+        self.scaler, self.classifier = self._initial_estimators()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, int(max_pending_batches)))
+
+        # Estadísticas
+        self.rows_seen = 0
+        self.rows_skipped = 0
+        self.dropped_batches = 0
+        self.batches = 0
+        self.snapshots = 0
+        self.update_ms = 0.0
+        self._prequential_correct = 0
+        self._prequential_total = 0
+        self._rows_since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"incremental-{exercise_type}", daemon=True)
+        self._thread.start()
+
+    def _initial_estimators(self):
+
+        # Se continúa desde la última versión publicada si es compatible
+        previous = self.registry.get(self.snapshot_path) if os.path.exists(self.snapshot_path) else None
+        if isinstance(previous, Pipeline) and len(previous.steps) == 2:
+
+            scaler, classifier = (copy.deepcopy(step) for _, step in previous.steps)
+            if (isinstance(scaler, StandardScaler) and isinstance(classifier, SGDClassifier)
+                    and list(classifier.classes_) == list(self.classes)):
+
+                print(f"Entrenamiento incremental de '{self.exercise_type}' continuado desde '{self.snapshot_path}'.")
+                return scaler, classifier
+        return _new_estimators()
+
+    # ENTRADA DE FILAS
+    def accepts(self, path):
+        """
+        Indica si 'path' es el archivo de entrenamiento o un segmento del dataset del ejercicio.
+        """
+        path = os.path.abspath(path)
+        return path == self._training_path or path.startswith(self._segment_dir)
+
+    def on_rows(self, path, rows):
+        """
+        Receptor del escritor de landmarks: encola las filas [etiqueta, x1, y1, ...] de un lote. No bloquea.
+        """
+        if self._closed or not rows or not self.accepts(path):
+
+            return
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+
+            self.dropped_batches += 1
+
+    def _parse(self, rows):
+
+        labels = np.array([str(row[0]) for row in rows])
+        known = np.isin(labels, self.classes)
+        self.rows_skipped += int(len(labels) - known.sum())
+        X = np.array([row[1:] for row, keep in zip(rows, known) if keep], dtype=np.float64).reshape(-1, NUM_COORDS)
+        return labels[known], X
+
+    # ENTRENAMIENTO
+    def update(self, labels, X):
+        """
+        Actualiza el modelo con un lote de filas (etiquetas desconocidas ya filtradas).
+        """
+        if len(labels) == 0:
+
+            return
+
+        start = time.perf_counter()
+        with self._lock:
+
+            # Validación progresiva: primero se predice el lote con el modelo de antes
+            if hasattr(self.classifier, 'coef_'):
+
+                predicted = self.classifier.predict(self.scaler.transform(X))
+                self._prequential_correct += int(np.sum(predicted == labels))
+                self._prequential_total += len(labels)
+
+            self.scaler.partial_fit(X)
+            self.classifier.partial_fit(self.scaler.transform(X), labels, classes=self.classes)
+
+            self.rows_seen += len(labels)
+            self._rows_since_snapshot += len(labels)
+            self.batches += 1
+        self.update_ms += (time.perf_counter() - start) * 1000.0
+
+    def snapshot(self, force=False):
+        """
+        Publica una versión nueva del modelo en el registro si hay suficientes filas nuevas.
+
+        :return: Ruta de la versión guardada, o None si no se publicó.
+        """
+        with self._lock:
+
+            if not hasattr(self.classifier, 'coef_'):
+
+                return None
+            if not force and self._rows_since_snapshot < self.min_snapshot_rows:
+
+                return None
+            model = make_pipeline(copy.deepcopy(self.scaler), copy.deepcopy(self.classifier))
+            metadata = {
+                "algorithm": "sgd_incremental",
+                "exercise_type": self.exercise_type,
+                "rows_seen": self.rows_seen,
+                "prequential_accuracy": self.prequential_accuracy(),
+            }
+            self._rows_since_snapshot = 0
+            self._last_snapshot = time.monotonic()
+
+        version_path = self.registry.save(model, self.snapshot_path, metadata=metadata)
+        self.registry.save(compile_pipeline(model), compiled_model_path(self.snapshot_path), metadata=metadata)
+        self.snapshots += 1
+        return version_path
+
+    def _run(self):
+
+        while True:
+
+            timeout = max(0.0, self._last_snapshot + self.snapshot_interval - time.monotonic())
+            try:
+                rows = self._queue.get(timeout=timeout)
+            except queue.Empty:
+
+                rows = None
+
+            if rows is None and self._closed:
+
+                return
+
+            try:
+                if rows is not None:
+
+                    self.update(*self._parse(rows))
+                if time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+
+                    self._last_snapshot = time.monotonic()
+                    self.snapshot()
+            except Exception as e:
+
+                print(f"Error en el entrenamiento incremental de '{self.exercise_type}': {e}")
+
+    def train_file(self, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Entrena con un dataset existente (CSV o '.lmk') por bloques, sin cargarlo entero.
+
+        :return: Filas usadas.
+        """
+        before = self.rows_seen
+        if is_store_path(path):
+
+            # El almacén se recorre sobre el mapeo de memoria, bloque a bloque
+            records, vocabulary = open_store(path)
+            vocabulary = np.asarray(vocabulary, dtype=str)
+            for start in range(0, len(records), chunk_rows):
+
+                chunk = records[start:start + chunk_rows]
+                chunk_labels = vocabulary[chunk['label']]
+                known = np.isin(chunk_labels, self.classes)
+                self.rows_skipped += int(len(chunk_labels) - known.sum())
+                self.update(chunk_labels[known], np.asarray(chunk['coords'], dtype=np.float64)[known])
+            return self.rows_seen - before
+
+        dtypes = dict.fromkeys(COORD_COLUMNS, np.float64)
+        for chunk in pd.read_csv(path, dtype=dict(dtypes, **{'class': str}), chunksize=chunk_rows):
+
+            known = chunk['class'].isin(self.classes).to_numpy()
+            self.rows_skipped += int(len(chunk) - known.sum())
+            self.update(chunk['class'].to_numpy()[known], chunk[COORD_COLUMNS].to_numpy()[known])
+        return self.rows_seen - before
+
+    def prequential_accuracy(self):
+
+        if not self._prequential_total:
+
+            return None
+        return round(self._prequential_correct / self._prequential_total, 4)
+
+    def stats(self):
+
+        return {
+            "exercise_type": self.exercise_type,
+            "rows_seen": self.rows_seen,
+            "rows_skipped": self.rows_skipped,
+            "batches": self.batches,
+            "dropped_batches": self.dropped_batches,
+            "snapshots": self.snapshots,
+            "prequential_accuracy": self.prequential_accuracy(),
+            "update_ms_per_row": round(self.update_ms / self.rows_seen, 4) if self.rows_seen else None,
+        }
+
+    def close(self, timeout=5.0):
+        """
+        Procesa los lotes pendientes, publica una última versión y detiene el hilo.
+        """
+        if self._closed:
+
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        if self._rows_since_snapshot:
+
+            self.snapshot(force=True)
+
+
+def main(argv=None):
+    """
+    Entrena (o continúa entrenando) el modelo incremental de un ejercicio con un dataset.
+
+    Ejemplo:
+        python -m utils.incremental_trainer data/coords_sentadilla.csv --exercise squats --model models/sentadilla_model.pkl
+    """
+    parser = argparse.ArgumentParser(description="Entrenamiento incremental (partial_fit) del modelo de un ejercicio.")
+    parser.add_argument("dataset", help="CSV o '.lmk' de landmarks etiquetados.")
+    parser.add_argument("--exercise", required=True, choices=sorted(EXERCISE_RULES), help="Tipo de ejercicio.")
+    parser.add_argument("--model", required=True, help="Ruta lógica del modelo del ejercicio ('.pkl').")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Filas por bloque.")
+    args = parser.parse_args(argv)
+
+    trainer = IncrementalTrainer(args.exercise, args.model)
+    rows = trainer.train_file(args.dataset, chunk_rows=args.chunk_rows)
+    trainer.close()
+    print(f"{rows} filas usadas.")
+    for key, value in trainer.stats().items():
+
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+import collections
+import itertools
+import multiprocessing as mp_proc
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.pose_landmarks import PoseResult, array_to_landmarks
+
+
+# Parametros por defecto de los grafos de MediaPipe Pose (los mismos que usan los detectores)
+DEFAULT_POSE_KWARGS = {
+    "min_detection_confidence": 0.5,
+    "min_tracking_confidence": 0.5,
+}
+
+
+def _inference_worker(worker_index, request_queue, result_queue, pose_kwargs):
+    """
+    Bucle de un proceso de inferencia.
+
+    Cada proceso mantiene un grafo de MediaPipe Pose por stream (para conservar el
+    seguimiento entre fotogramas) y lee los fotogramas directamente de la memoria
+    compartida que le indica el cliente, sin copiarlos a traves de la cola.
+    """
+    import mediapipe as mp
+
+    from utils.pose_landmarks import landmarks_to_array
+
+    graphs = {} # stream_id -> mp_pose.Pose
+    buffers = {} # nombre de memoria compartida -> SharedMemory
+    backlog = collections.deque() # Mensajes recibidos pendientes de atender
+    cancelled = set() # Peticiones que el cliente dio por perdidas (timeout)
+
+    def release_buffer(shm_name):
+
+        shm = buffers.pop(shm_name, None)
+        if shm is not None:
+
+            shm.close()
+
+    while True:
+
+        # Se vacía la cola antes de atender el siguiente mensaje, para conocer las
+        # cancelaciones que llegaron detrás de sus peticiones
+        try:
+            while True:
+
+                message = request_queue.get(block=not backlog)
+                if message is not None and message[0] == "cancel":
+
+                    cancelled.add(message[1])
+                else:
+
+                    backlog.append(message)
+        except queue.Empty:
+
+            pass
+
+        message = backlog.popleft()
+        if message is None:
+
+            break
+
+        kind = message[0]
+        try:
+            if kind == "process":
+
+                _, request_id, stream_id, shm_name, shape = message
+
+                # Las peticiones de cada proceso llegan en orden: las cancelaciones de
+                # peticiones anteriores ya atendidas no hacen falta
+                cancelled = {cancelled_id for cancelled_id in cancelled if cancelled_id >= request_id}
+                if request_id in cancelled:
+
+                    # Se responde igualmente: el cliente libera el bloque al recibir la respuesta
+                    cancelled.discard(request_id)
+                    result_queue.put((request_id, None, {"cancelled": True, "worker": worker_index}))
+                    continue
+
+                shm = buffers.get(shm_name)
+                if shm is None:
+
+                    shm = shared_memory.SharedMemory(name=shm_name)
+                    buffers[shm_name] = shm
+
+                pose = graphs.get(stream_id)
+                if pose is None:
+
+                    pose = mp.solutions.pose.Pose(**pose_kwargs)
+                    graphs[stream_id] = pose
+
+                image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+                start = time.perf_counter()
+                results = pose.process(image)
+                elapsed_ms = (time.perf_counter() - start) * 1000.0
+                del image # No mantener referencias al buffer compartido
+
+                landmarks = None
+                if results.pose_landmarks:
+
+                    landmarks = landmarks_to_array(results.pose_landmarks)
+
+                result_queue.put((request_id, landmarks, {"inference_ms": elapsed_ms, "worker": worker_index}))
+
+            elif kind == "release_buffer":
+
+                release_buffer(message[1])
+
+            elif kind == "reset_stream":
+
+                # Se descarta el grafo del stream: el siguiente fotograma crea uno sin seguimiento previo
+                pose = graphs.pop(message[1], None)
+                if pose is not None:
+
+                    pose.close()
+
+            elif kind == "close_stream":
+
+                _, stream_id, shm_name = message
+                release_buffer(shm_name)
+                pose = graphs.pop(stream_id, None)
+                if pose is not None:
+
+                    pose.close()
+
+        except Exception as e:
+
+            traceback.print_exc()
+            if kind == "process":
+
+                result_queue.put((message[1], None, {"error": str(e), "worker": worker_index}))
+
+    for pose in graphs.values():
+
+        pose.close()
+    for shm in buffers.values():
+
+        shm.close()
+
+
+class PoseInferencePool:
+    """
+    Conjunto de procesos de inferencia de pose para varios streams concurrentes.
+
+    Cada proceso posee sus propios grafos de MediaPipe Pose, de modo que la inferencia
+    no compite por el GIL del proceso de Flask y el rendimiento escala con el numero de
+    nucleos. Los fotogramas se entregan mediante memoria compartida y solo los
+    landmarks (33x4 float32) y las metricas de inferencia vuelven por la cola.
+    """
+
+    def __init__(self, num_workers, pose_kwargs=None, request_timeout=5.0):
+
+        self.num_workers = max(1, int(num_workers))
+        self.pose_kwargs = dict(DEFAULT_POSE_KWARGS, **(pose_kwargs or {}))
+        self.request_timeout = request_timeout
+
+        self._context = mp_proc.get_context("spawn") # Evita heredar hilos y grafos del proceso de Flask
+        self._workers = []
+        self._request_queues = []
+        self._result_queue = None
+        self._dispatcher = None
+
+        self._pending = {} # request_id -> Future
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._stream_ids = itertools.count(1)
+        self._next_worker = itertools.count()
+
+        self._start_lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        """
+        Arranca los procesos de inferencia (idempotente).
+        """
+        with self._start_lock:
+
+            if self._running:
+
+                return
+
+            self._result_queue = self._context.Queue()
+            for worker_index in range(self.num_workers):
+
+                request_queue = self._context.Queue()
+                worker = self._context.Process(
+                    target=_inference_worker,
+                    args=(worker_index, request_queue, self._result_queue, self.pose_kwargs),
+                    name=f"pose-inference-{worker_index}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+                self._request_queues.append(request_queue)
+
+            self._running = True
+            self._dispatcher = threading.Thread(target=self._dispatch_results, name="pose-inference-results", daemon=True)
+            self._dispatcher.start()
+            print(f"Pool de inferencia de pose iniciado con {self.num_workers} procesos.")
+
+    def _dispatch_results(self):
+
+        # Reparte los resultados de los procesos a las peticiones que los esperan
+        while self._running:
+
+            try:
+                request_id, landmarks, info = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+
+                continue
+            except (EOFError, OSError):
+
+                break
+
+            with self._pending_lock:
+
+                future = self._pending.pop(request_id, None)
+            if future is not None:
+
+                future.set_result((landmarks, info))
+
+    def create_client(self):
+        """
+        Crea un cliente con la interfaz de 'mp_pose.Pose' asignado a uno de los procesos.
+        """
+        self.start()
+        worker_index = next(self._next_worker) % self.num_workers
+        return RemotePose(self, worker_index, next(self._stream_ids))
+
+    def _submit(self, worker_index, stream_id, shm_name, shape):
+
+        request_id = next(self._request_ids)
+        future = Future()
+        with self._pending_lock:
+
+            self._pending[request_id] = future
+
+        self._request_queues[worker_index].put(("process", request_id, stream_id, shm_name, shape))
+        return request_id, future
+
+    def _cancel(self, worker_index, request_id):
+
+        # La petición sigue registrada: su respuesta tardía indica al cliente que el proceso
+        # ya no usa el bloque de memoria compartida
+        self._send(worker_index, ("cancel", request_id))
+
+    def _send(self, worker_index, message):
+
+        if self._running:
+
+            self._request_queues[worker_index].put(message)
+
+    def close(self):
+        """
+        Detiene los procesos de inferencia.
+        """
+        with self._start_lock:
+
+            if not self._running:
+
+                return
+
+            for request_queue in self._request_queues:
+
+                request_queue.put(None)
+            for worker in self._workers:
+
+                worker.join(timeout=5.0)
+                if worker.is_alive():
+
+                    worker.terminate()
+
+            self._running = False
+            if self._dispatcher is not None:
+
+                self._dispatcher.join(timeout=2.0)
+
+            self._workers = []
+            self._request_queues = []
+            self._dispatcher = None
+
+            # Despertar a cualquier petición pendiente
+            with self._pending_lock:
+
+                pending = list(self._pending.values())
+                self._pending.clear()
+            for future in pending:
+
+                future.set_result((None, {"error": "pool cerrado"}))
+            print("Pool de inferencia de pose detenido.")
+
+
+class RemotePose:
+    """
+    Sustituto de 'mp_pose.Pose' que delega la inferencia en un proceso del pool.
+
+    El fotograma RGB se copia una sola vez a un bloque de memoria compartida propio
+    del cliente; el proceso de inferencia lo lee sin serializarlo.
+
+    Hay como mucho una petición en curso por stream. Si una vence el tiempo de espera,
+    se cancela en el proceso y el stream pasa a un bloque nuevo (el proceso podría estar
+    leyendo el anterior), que se libera cuando llega la respuesta tardía. Mientras no
+    llega, los fotogramas siguientes se devuelven sin pose en lugar de acumularse en un
+    proceso atascado.
+    """
+
+    def __init__(self, pool, worker_index, stream_id):
+
+        self.pool = pool
+        self.worker_index = worker_index
+        self.stream_id = stream_id
+        self._shm = None
+        self._late = None # (future, bloque) de la petición que venció el tiempo de espera
+        self._closed = False
+
+        # Metricas de la ultima inferencia (tiempo en el proceso y proceso asignado)
+        self.last_info = {}
+
+    def _buffer_for(self, image):
+
+        if self._shm is not None and self._shm.size >= image.nbytes:
+
+            return self._shm
+
+        # El tamaño del fotograma cambió: liberar el bloque anterior en el proceso y crear uno nuevo
+        self._release_buffer()
+        self._shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        return self._shm
+
+    def _release_buffer(self):
+
+        if self._shm is None:
+
+            return
+
+        self._discard_buffer(self._shm)
+        self._shm = None
+
+    def _discard_buffer(self, shm):
+
+        self.pool._send(self.worker_index, ("release_buffer", shm.name))
+        shm.close()
+        shm.unlink()
+
+    def process(self, image):
+        """
+        Ejecuta la deteccion de pose sobre un fotograma RGB (uint8, HxWx3).
+
+        Retorna:
+            PoseResult: Objeto con 'pose_landmarks' (o None si no se detecto pose).
+        """
+        if self._closed:
+
+            raise RuntimeError("RemotePose cerrado")
+
+        if self._late is not None:
+
+            late_future, late_shm = self._late
+            if not late_future.done():
+
+                # El proceso sigue con la petición vencida: no se le envía más trabajo
+                self.last_info = {"error": "busy"}
+                return PoseResult(None)
+            self._late = None
+            self._discard_buffer(late_shm)
+
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        shm = self._buffer_for(image)
+        np.ndarray(image.shape, dtype=np.uint8, buffer=shm.buf)[...] = image
+
+        request_id, future = self.pool._submit(self.worker_index, self.stream_id, shm.name, image.shape)
+        try:
+            landmarks, info = future.result(timeout=self.pool.request_timeout)
+        except FutureTimeoutError:
+
+            self.pool._cancel(self.worker_index, request_id)
+            self._late = (future, shm)
+            self._shm = None
+            self.last_info = {"error": "timeout"}
+            return PoseResult(None)
+
+        self.last_info = info
+        if landmarks is None:
+
+            return PoseResult(None)
+        return PoseResult(array_to_landmarks(landmarks), landmarks_array=landmarks)
+
+    def reset(self):
+        """
+        Reinicia el seguimiento del grafo del stream (equivalente a 'mp_pose.Pose.reset').
+        """
+        if not self._closed:
+
+            self.pool._send(self.worker_index, ("reset_stream", self.stream_id))
+        self.last_info = {}
+
+    def close(self):
+        """
+        Libera el grafo del stream en el proceso de inferencia y la memoria compartida.
+        """
+        if self._closed:
+
+            return
+
+        self._closed = True
+        if self._late is not None:
+
+            self._discard_buffer(self._late[1])
+            self._late = None
+        shm_name = self._shm.name if self._shm is not None else None
+        self.pool._send(self.worker_index, ("close_stream", self.stream_id, shm_name))
+        if self._shm is not None:
+
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,186 @@
+import time
+
+import cv2
+import mediapipe as mp
+
+from utils.inference_pool import DEFAULT_POSE_KWARGS
+from utils.pose_landmarks import array_to_landmarks, landmarks_to_array
+
+mp_pose = mp.solutions.pose
+mp_drawing = mp.solutions.drawing_utils
+
+
+class AdaptiveInferenceScheduler:
+    """
+    Decide en que fotogramas se ejecuta la deteccion de pose completa.
+
+    La inferencia se lanza a 'target_hz' como maximo. Si el tiempo medido de
+    inferencia supera la fraccion 'max_load' del intervalo, la frecuencia baja
+    automaticamente hasta 'min_hz' (el minimo que necesitan las maquinas de estados
+    de repeticiones); cuando la inferencia vuelve a ser rapida, sube de nuevo.
+    """
+
+    def __init__(self, target_hz=15.0, min_hz=10.0, max_load=0.5, smoothing=0.2):
+
+        self.target_hz = float(target_hz)
+        self.min_hz = min(float(min_hz), self.target_hz)
+        self.max_load = float(max_load)
+        self.smoothing = float(smoothing)
+
+        self.avg_inference_s = None # Media movil exponencial del tiempo de inferencia
+        self.interval_s = 1.0 / self.target_hz
+        self._next_due = 0.0
+
+        # Estadisticas
+        self.inferred_frames = 0
+        self.reused_frames = 0
+
+    def should_infer(self, now=None):
+        """
+        Indica si en el instante 'now' toca ejecutar la inferencia.
+        """
+        now = time.monotonic() if now is None else now
+        if now >= self._next_due:
+
+            return True
+
+        self.reused_frames += 1
+        return False
+
+    def record_inference(self, elapsed_s, started_at):
+        """
+        Registra la duracion de una inferencia y programa la siguiente.
+        """
+        if self.avg_inference_s is None:
+
+            self.avg_inference_s = elapsed_s
+        else:
+
+            self.avg_inference_s += self.smoothing * (elapsed_s - self.avg_inference_s)
+
+        # El intervalo es el mayor entre el objetivo y el que mantiene la carga por debajo de max_load
+        interval = max(1.0 / self.target_hz, self.avg_inference_s / self.max_load)
+        self.interval_s = min(interval, 1.0 / self.min_hz)
+        self._next_due = started_at + self.interval_s
+        self.inferred_frames += 1
+
+    @property
+    def current_hz(self):
+
+        return 1.0 / self.interval_s
+
+    def stats(self):
+
+        return {
+            "inference_hz": round(self.current_hz, 1),
+            "inference_ms": round((self.avg_inference_s or 0.0) * 1000.0, 1),
+            "inferred_frames": self.inferred_frames,
+            "reused_frames": self.reused_frames,
+        }
+
+
+class LandmarkInterpolator:
+    """
+    Estima los landmarks de los fotogramas intermedios a partir de las dos ultimas inferencias.
+
+    Se extrapola linealmente (como maximo un intervalo de inferencia hacia delante)
+    para que el esqueleto dibujado siga el movimiento entre inferencias.
+    """
+
+    def __init__(self, max_extrapolation=1.0):
+
+        self.max_extrapolation = max_extrapolation
+        self._previous = None # (t, landmarks)
+        self._last = None # (t, landmarks)
+
+    def update(self, landmarks, timestamp):
+
+        if landmarks is None:
+
+            # Sin pose detectada: no se dibuja nada hasta la siguiente deteccion
+            self._previous = None
+            self._last = None
+            return
+
+        self._previous = self._last
+        self._last = (timestamp, landmarks.copy())
+
+    def predict(self, timestamp):
+        """
+        Devuelve los landmarks estimados para 'timestamp', o None si no hay pose.
+        """
+        if self._last is None:
+
+            return None
+
+        t1, last = self._last
+        if self._previous is None:
+
+            return last
+
+        t0, previous = self._previous
+        if t1 <= t0:
+
+            return last
+
+        alpha = min((timestamp - t1) / (t1 - t0), self.max_extrapolation)
+        predicted = last + alpha * (last - previous)
+        predicted[:, 3] = last[:, 3] # La visibilidad no se extrapola
+        return predicted
+
+
+class LandmarkRecorder:
+    """
+    Envoltorio de un objeto con la interfaz de 'mp_pose.Pose' que guarda los ultimos landmarks.
+
+    Permite que la sesion reutilice los landmarks de la ultima inferencia del detector
+    sin modificar su logica interna.
+    """
+
+    def __init__(self, pose_model=None):
+
+        self.pose_model = pose_model if pose_model is not None else mp_pose.Pose(**DEFAULT_POSE_KWARGS)
+        self.last_landmarks = None # Array (33, 4) float32, o None si no se detecto pose
+
+    def process(self, image):
+
+        results = self.pose_model.process(image)
+        if results.pose_landmarks:
+
+            landmarks_array = getattr(results, 'landmarks_array', None)
+            if landmarks_array is not None:
+
+                self.last_landmarks = landmarks_array
+            else:
+
+                self.last_landmarks = landmarks_to_array(results.pose_landmarks, out=self.last_landmarks)
+        else:
+
+            self.last_landmarks = None
+        return results
+
+    def reset(self):
+
+        self.last_landmarks = None
+        if hasattr(self.pose_model, 'reset'):
+
+            self.pose_model.reset()
+
+    def close(self):
+
+        self.pose_model.close()
+
+
+def draw_cached_pose(frame, landmarks):
+    """
+    Dibuja sobre un fotograma nuevo los landmarks reutilizados o interpolados.
+
+    El fotograma se invierte como espejo, igual que hacen los detectores.
+    """
+    image = cv2.flip(frame, 1)
+    if landmarks is not None:
+
+        mp_drawing.draw_landmarks(image, array_to_landmarks(landmarks), mp_pose.POSE_CONNECTIONS,
+                                  mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2),
+                                  mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2))
+    return image
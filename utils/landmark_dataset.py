@@ -0,0 +1,228 @@
+import json
+import os
+import re
+import threading
+import time
+
+from utils.detector_factory import DETECTOR_CLASSES, default_csv_path
+from utils.landmark_store import CSV_COLUMNS, append_arrays, is_store_path, load_landmark_dataframe, load_store
+from utils.landmark_writer import create_landmark_file, flush_landmarks
+
+
+MANIFEST_FILENAME = 'manifest.json'
+SEGMENTS_DIRNAME = 'segments'
+
+
+class LandmarkDataset:
+    """
+    Dataset de landmarks de un ejercicio formado por segmentos de solo añadido.
+
+    Cada sesion de captura escribe su propio segmento ('data/segments/<dataset>/...')
+    y queda registrada en un 'manifest.json'. Ningun archivo se borra al arrancar:
+    los datos se acumulan entre reinicios. La compactacion añade al archivo de
+    entrenamiento ('data/coords_*.csv' o '.lmk') solo los segmentos cerrados que
+    aun no se habian incorporado, sin reescribirlo; los segmentos incorporados salen
+    del manifiesto, que solo guarda los pendientes y los totales acumulados.
+    """
+
+    def __init__(self, exercise_type, data_dir=None, landmark_format=None):
+
+        if exercise_type not in DETECTOR_CLASSES:
+
+            raise ValueError(f"Tipo de ejercicio no válido: '{exercise_type}'")
+
+        self.exercise_type = exercise_type
+        self.training_path = default_csv_path(exercise_type, data_dir, landmark_format)
+        self.extension = os.path.splitext(self.training_path)[1]
+        dataset_name = os.path.splitext(os.path.basename(self.training_path))[0]
+        self.segment_dir = os.path.join(os.path.dirname(self.training_path), SEGMENTS_DIRNAME, dataset_name)
+        self.manifest_path = os.path.join(self.segment_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+
+    # MANIFIESTO
+    def _read_manifest(self):
+
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+
+                return json.load(f)
+        except FileNotFoundError:
+
+            return {"exercise_type": self.exercise_type, "segments": [], "next_segment": 1,
+                    "compacted_segments": 0, "compacted_rows": 0}
+
+    def _write_manifest(self, manifest):
+
+        os.makedirs(self.segment_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def segments(self):
+
+        with self._lock:
+
+            return self._read_manifest()["segments"]
+
+    # SEGMENTOS
+    def new_segment(self, session_id):
+        """
+        Crea el segmento de una nueva sesion de captura y lo registra en el manifiesto.
+
+        :return: Ruta del archivo del segmento.
+        """
+        safe_session = re.sub(r'[^A-Za-z0-9_.-]+', '_', str(session_id)) or 'session'
+        with self._lock:
+
+            manifest = self._read_manifest()
+            # Contador propio: el número de entradas baja al compactar y no sirve para numerar
+            sequence = manifest.get("next_segment", len(manifest["segments"]) + 1)
+            manifest["next_segment"] = sequence + 1
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}_{safe_session}_{sequence:05d}{self.extension}"
+            path = os.path.join(self.segment_dir, filename)
+
+            os.makedirs(self.segment_dir, exist_ok=True)
+            create_landmark_file(path, CSV_COLUMNS)
+            manifest["segments"].append({
+                "file": filename,
+                "session_id": str(session_id),
+                "created": time.time(),
+                "pid": os.getpid(),
+                "closed": False,
+                "compacted": False,
+            })
+            self._write_manifest(manifest)
+        return path
+
+    def close_segment(self, path):
+        """
+        Marca un segmento como cerrado (sus filas pendientes ya deben estar escritas).
+        """
+        filename = os.path.basename(path)
+        with self._lock:
+
+            manifest = self._read_manifest()
+            for segment in manifest["segments"]:
+
+                if segment["file"] == filename and not segment["closed"]:
+
+                    segment["closed"] = True
+                    segment["closed_at"] = time.time()
+            self._write_manifest(manifest)
+
+    def _is_mergeable(self, segment):
+
+        # Un segmento abierto por un proceso anterior (cierre abrupto del servidor) ya no recibe filas
+        return not segment["compacted"] and (segment["closed"] or segment.get("pid") != os.getpid())
+
+    # COMPACTACION
+    def compact(self):
+        """
+        Añade al archivo de entrenamiento los segmentos cerrados aun no compactados.
+
+        Los segmentos incorporados se eliminan del disco y del manifiesto; este solo
+        acumula su número ('compacted_segments') y sus filas ('compacted_rows').
+
+        :return: Número de filas añadidas.
+        """
+        flush_landmarks()
+        added_rows = 0
+        with self._lock:
+
+            manifest = self._read_manifest()
+            # Entradas ya compactadas de manifiestos anteriores a este formato
+            manifest["segments"] = [segment for segment in manifest["segments"] if not segment["compacted"]]
+            pending = [segment for segment in manifest["segments"] if self._is_mergeable(segment)]
+            if not pending:
+
+                return 0
+
+            if not os.path.exists(self.training_path):
+
+                create_landmark_file(self.training_path, CSV_COLUMNS)
+
+            for segment in pending:
+
+                path = os.path.join(self.segment_dir, segment["file"])
+                rows = self._append_segment(path) if os.path.exists(path) else 0
+
+                # El manifiesto se actualiza segmento a segmento: si la compactación se interrumpe,
+                # los segmentos ya incorporados no se vuelven a añadir
+                manifest["segments"].remove(segment)
+                manifest["compacted_segments"] = manifest.get("compacted_segments", 0) + 1
+                manifest["compacted_rows"] = manifest.get("compacted_rows", 0) + rows
+                self._write_manifest(manifest)
+                self._remove_segment(path)
+                added_rows += rows
+
+        print(f"Dataset '{os.path.basename(self.training_path)}': {len(pending)} segmento(s) compactado(s), {added_rows} filas añadidas.")
+        return added_rows
+
+    def _append_segment(self, path):
+
+        if is_store_path(self.training_path):
+
+            if is_store_path(path):
+
+                X, y, t = load_store(path)
+                append_arrays(self.training_path, y, X, t)
+                return len(y)
+
+            df = load_landmark_dataframe(path)
+            append_arrays(self.training_path, df['class'].tolist(), df[CSV_COLUMNS[1:]].values)
+            return len(df)
+
+        if not is_store_path(path):
+
+            # CSV -> CSV: se copian las líneas tal cual, sin el encabezado
+            with open(path, newline='') as src, open(self.training_path, 'a', newline='') as dst:
+
+                src.readline()
+                lines = src.readlines()
+                dst.writelines(lines)
+            return len(lines)
+
+        df = load_landmark_dataframe(path)
+        df.to_csv(self.training_path, mode='a', header=False, index=False)
+        return len(df)
+
+    def _remove_segment(self, path):
+
+        for candidate in (path, f"{path}.labels.json"):
+
+            if os.path.exists(candidate):
+
+                os.remove(candidate)
+
+    def stats(self):
+
+        with self._lock:
+
+            manifest = self._read_manifest()
+        segments = manifest["segments"]
+        return {
+            "segments": len(segments),
+            "open_segments": sum(1 for segment in segments if not segment["closed"]),
+            "pending_segments": sum(1 for segment in segments if not segment["compacted"]),
+            "compacted_segments": manifest.get("compacted_segments", 0),
+            "compacted_rows": manifest.get("compacted_rows", 0),
+        }
+
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def get_dataset(exercise_type):
+    """
+    Devuelve el dataset compartido (uno por ejercicio) de la carpeta 'data' actual.
+    """
+    with _datasets_lock:
+
+        dataset = _datasets.get(exercise_type)
+        if dataset is None:
+
+            dataset = _datasets[exercise_type] = LandmarkDataset(exercise_type)
+        return dataset
@@ -0,0 +1,198 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+from utils.landmark_store import COORD_COLUMNS, CSV_COLUMNS, NUM_COORDS, is_store_path, open_store
+
+
+DEFAULT_CHUNK_ROWS = 50000 # Filas por bloque al recorrer el dataset
+MIN_ROWS_PER_CLASS = 2 # Mínimo por clase en el muestreo estratificado (lo exige el split estratificado)
+BYTES_PER_ROW = NUM_COORDS * 4 + 8 # Coordenadas float32 más la etiqueta
+
+SAMPLING_STRATEGIES = ('stratified', 'reservoir')
+
+
+def iter_landmark_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Recorre un dataset de landmarks ('.csv' o '.lmk') por bloques, sin cargarlo entero.
+
+    :return: Generador de (etiquetas como array de objetos, coordenadas float32 (n, 132)).
+    :raises ValueError: Si el CSV no tiene las columnas del dataset de landmarks.
+    """
+    if is_store_path(path):
+
+        # El almacén se lee sobre el mapeo de memoria: cada bloque es una vista
+        records, vocabulary = open_store(path)
+        vocabulary = np.asarray(vocabulary, dtype=object)
+        for start in range(0, len(records), chunk_rows):
+
+            chunk = records[start:start + chunk_rows]
+            yield vocabulary[chunk['label']], np.asarray(chunk['coords'], dtype=np.float32)
+        return
+
+    dtypes = dict.fromkeys(COORD_COLUMNS, np.float32)
+    dtypes['class'] = str
+    for chunk in pd.read_csv(path, usecols=CSV_COLUMNS, dtype=dtypes, chunksize=chunk_rows):
+
+        yield chunk['class'].to_numpy(dtype=object), chunk[COORD_COLUMNS].to_numpy(dtype=np.float32)
+
+
+def count_labels(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Filas por etiqueta del dataset, leyendo solo la columna de etiquetas.
+    """
+    counts = collections.Counter()
+    if is_store_path(path):
+
+        records, vocabulary = open_store(path)
+        for start in range(0, len(records), chunk_rows):
+
+            codes = np.bincount(records['label'][start:start + chunk_rows], minlength=len(vocabulary))
+            counts.update({vocabulary[code]: int(count) for code, count in enumerate(codes) if count})
+        return dict(counts)
+
+    for chunk in pd.read_csv(path, usecols=['class'], dtype={'class': str}, chunksize=chunk_rows):
+
+        counts.update(chunk['class'].value_counts().to_dict())
+    return dict(counts)
+
+
+def rows_for_budget(memory_budget_mb):
+    """
+    Filas que caben en 'memory_budget_mb' MB con coordenadas float32.
+    """
+    return max(1, int(memory_budget_mb * 1024 * 1024) // BYTES_PER_ROW)
+
+
+def _stratified_quotas(counts, limit):
+
+    # Reparto proporcional con un mínimo por clase; el exceso se descuenta de las clases mayores
+    total = sum(counts.values())
+    quotas = {label: min(count, max(MIN_ROWS_PER_CLASS, limit * count // total)) for label, count in counts.items()}
+    excess = sum(quotas.values()) - limit
+    for label in sorted(quotas, key=quotas.get, reverse=True):
+
+        if excess <= 0:
+
+            break
+        removable = max(0, quotas[label] - MIN_ROWS_PER_CLASS)
+        taken = min(removable, excess)
+        quotas[label] -= taken
+        excess -= taken
+    return quotas
+
+
+def _reservoir_update(X, labels, offset, quota, seen, rng, chunk_X, chunk_labels):
+
+    # Algoritmo R vectorizado: la fila t-ésima entra con probabilidad quota / (t + 1)
+    t = seen + np.arange(len(chunk_labels))
+    fill = t < quota
+    X[offset + t[fill]] = chunk_X[fill]
+    labels[offset + t[fill]] = chunk_labels[fill]
+
+    rest = ~fill
+    if rest.any():
+
+        slots = rng.integers(0, t[rest] + 1)
+        keep = slots < quota
+        X[offset + slots[keep]] = chunk_X[rest][keep]
+        labels[offset + slots[keep]] = chunk_labels[rest][keep]
+    return seen + len(chunk_labels)
+
+
+def load_landmark_sample(path, max_rows=None, memory_budget_mb=None, strategy='stratified', seed=1234,
+                         chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Carga un dataset de landmarks en float32, por bloques y, si no cabe, muestreado.
+
+    El dataset se recorre dos veces por bloques: primero solo las etiquetas (para saber
+    cuántas filas hay de cada clase) y después las coordenadas, que se copian a un único
+    array float32 reservado de antemano. Si el dataset supera 'max_rows' o el presupuesto
+    'memory_budget_mb', se muestrea:
+
+    - 'stratified': un reservorio por clase con una cuota proporcional a su frecuencia
+      (y al menos MIN_ROWS_PER_CLASS filas), de modo que se conservan todas las clases.
+    - 'reservoir': un único reservorio uniforme sobre todas las filas.
+
+    :return: (DataFrame con 'class' categórica y las coordenadas float32, diccionario con
+             las filas totales y usadas, la estrategia y los MB del dataset en memoria).
+    :raises ValueError: Si la estrategia no existe o el CSV no tiene las columnas esperadas.
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+
+        raise ValueError(f"Estrategia de muestreo no válida: '{strategy}' (opciones: {', '.join(SAMPLING_STRATEGIES)})")
+
+    counts = count_labels(path, chunk_rows)
+    total = sum(counts.values())
+    limit = total
+    if max_rows is not None:
+
+        limit = min(limit, int(max_rows))
+    if memory_budget_mb is not None:
+
+        limit = min(limit, rows_for_budget(memory_budget_mb))
+
+    rng = np.random.default_rng(seed)
+    if limit >= total:
+
+        strategy_used = 'all'
+        slots = {None: (0, total)}
+    elif strategy == 'stratified':
+
+        strategy_used = strategy
+        quotas = _stratified_quotas(counts, limit)
+        offsets = np.cumsum([0] + [quotas[label] for label in counts])
+        slots = {label: (int(offset), quotas[label]) for label, offset in zip(counts, offsets)}
+    else:
+
+        strategy_used = strategy
+        slots = {None: (0, limit)}
+
+    size = sum(quota for _, quota in slots.values())
+    X = np.empty((size, NUM_COORDS), dtype=np.float32)
+    labels = np.empty(size, dtype=object)
+    seen = dict.fromkeys(slots, 0)
+
+    for chunk_labels, chunk_X in iter_landmark_chunks(path, chunk_rows):
+
+        if strategy_used == 'all':
+
+            # Las filas añadidas al archivo después de contar las etiquetas se ignoran
+            start = seen[None]
+            taken = min(len(chunk_labels), size - start)
+            X[start:start + taken] = chunk_X[:taken]
+            labels[start:start + taken] = chunk_labels[:taken]
+            seen[None] += taken
+            continue
+
+        if strategy_used == 'reservoir':
+
+            offset, quota = slots[None]
+            seen[None] = _reservoir_update(X, labels, offset, quota, seen[None], rng, chunk_X, chunk_labels)
+            continue
+
+        for label in np.unique(chunk_labels):
+
+            if label not in slots:
+
+                continue
+            mask = chunk_labels == label
+            offset, quota = slots[label]
+            seen[label] = _reservoir_update(X, labels, offset, quota, seen[label], rng, chunk_X[mask], chunk_labels[mask])
+
+    # Si el archivo se acortó entre las dos pasadas, quedan huecos sin rellenar al final de cada cuota
+    if strategy_used == 'all' and seen[None] < size:
+
+        X, labels, size = X[:seen[None]], labels[:seen[None]], seen[None]
+
+    # El DataFrame envuelve el array float32 sin copiarlo
+    df = pd.DataFrame(X, columns=COORD_COLUMNS, copy=False)
+    df.insert(0, 'class', pd.Categorical(labels))
+    info = {
+        "rows_total": int(total),
+        "rows_used": int(size),
+        "strategy": strategy_used,
+        "dataset_mb": round(X.nbytes / (1024 * 1024), 2),
+    }
+    return df, info
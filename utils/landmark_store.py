@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.pose_landmarks import NUM_LANDMARKS, LANDMARK_VALUES
+
+
+# Formato binario de landmarks ('.lmk'):
+#   cabecera de 32 bytes: magic (8s), version (u4), landmarks (u4), valores por landmark (u4), tamaño de registro (u4), reservado (8x)
+#   registros de tamaño fijo: instante (f8), indice de etiqueta (u2), coordenadas (132 x f4)
+# El vocabulario de etiquetas se guarda en un JSON contiguo ('<archivo>.labels.json').
+STORE_EXTENSION = '.lmk'
+STORE_MAGIC = b'LMKSTORE'
+STORE_VERSION = 1
+HEADER_FORMAT = '<8sIIII8x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+NUM_COORDS = NUM_LANDMARKS * LANDMARK_VALUES
+RECORD_DTYPE = np.dtype([
+    ('t', '<f8'),
+    ('label', '<u2'),
+    ('coords', '<f4', (NUM_COORDS,)),
+])
+
+# Columnas equivalentes del CSV de landmarks ('class', 'x1', 'y1', 'z1', 'v1', ...)
+COORD_COLUMNS = [f'{axis}{index}' for index in range(1, NUM_LANDMARKS + 1) for axis in ('x', 'y', 'z', 'v')]
+CSV_COLUMNS = ['class'] + COORD_COLUMNS
+
+# Vocabularios de etiquetas cargados, por ruta del almacén
+_labels_cache = {}
+_labels_lock = threading.Lock()
+
+
+def is_store_path(path):
+    """
+    Indica si una ruta corresponde a un almacén binario de landmarks.
+    """
+    return str(path).lower().endswith(STORE_EXTENSION)
+
+
+def labels_path(path):
+
+    return f"{path}.labels.json"
+
+
+def _read_labels(path):
+
+    try:
+        with open(labels_path(path), encoding='utf-8') as f:
+
+            return json.load(f)
+    except FileNotFoundError:
+
+        return []
+
+
+def _write_labels(path, labels):
+
+    # Escritura atómica: el vocabulario nunca queda a medias
+    tmp_path = f"{labels_path(path)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+
+        json.dump(labels, f, ensure_ascii=False)
+    os.replace(tmp_path, labels_path(path))
+
+
+def create_store(path):
+    """
+    Crea (o vacía) un almacén binario con la cabecera y un vocabulario de etiquetas vacío.
+    """
+    with open(path, 'wb') as f:
+
+        f.write(struct.pack(HEADER_FORMAT, STORE_MAGIC, STORE_VERSION, NUM_LANDMARKS, LANDMARK_VALUES, RECORD_DTYPE.itemsize))
+    _write_labels(path, [])
+    with _labels_lock:
+
+        _labels_cache[os.path.abspath(path)] = []
+
+
+def _check_header(path):
+
+    with open(path, 'rb') as f:
+
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+
+        raise ValueError(f"'{path}' no es un almacén de landmarks válido (cabecera incompleta)")
+
+    magic, version, num_landmarks, values, record_size = struct.unpack(HEADER_FORMAT, header)
+    if magic != STORE_MAGIC or version != STORE_VERSION:
+
+        raise ValueError(f"'{path}' no es un almacén de landmarks válido")
+    if (num_landmarks, values, record_size) != (NUM_LANDMARKS, LANDMARK_VALUES, RECORD_DTYPE.itemsize):
+
+        raise ValueError(f"'{path}' usa un formato de registro incompatible")
+
+
+def append_rows(path, rows, timestamps=None):
+    """
+    Añade al almacén filas con el formato del CSV: [etiqueta, x1, y1, z1, v1, ...].
+
+    :param path: Ruta del almacén ('.lmk'). Se crea si no existe.
+    :param rows: Lista de filas (etiqueta seguida de 132 valores).
+    :param timestamps: Instantes (segundos epoch) de cada fila. Por defecto, el actual.
+    """
+    if not rows:
+
+        return
+
+    append_arrays(path, [row[0] for row in rows], [row[1:] for row in rows], timestamps)
+
+
+def append_arrays(path, labels, coords, timestamps=None):
+    """
+    Añade al almacén registros dados como arrays.
+
+    :param path: Ruta del almacén ('.lmk'). Se crea si no existe.
+    :param labels: Secuencia de etiquetas (una por registro).
+    :param coords: Array (n, 132) de coordenadas.
+    :param timestamps: Instante de cada registro (o uno común). Por defecto, el actual.
+    """
+    coords = np.asarray(coords, dtype=np.float32).reshape(-1, NUM_COORDS)
+    if len(coords) == 0:
+
+        return
+
+    if not os.path.exists(path):
+
+        create_store(path)
+
+    key = os.path.abspath(path)
+    records = np.empty(len(coords), dtype=RECORD_DTYPE)
+    with _labels_lock:
+
+        vocabulary = _labels_cache.get(key)
+        if vocabulary is None:
+
+            vocabulary = _labels_cache[key] = _read_labels(path)
+
+        # Se traduce cada etiqueta distinta una sola vez
+        unique_labels, inverse = np.unique(np.asarray([str(label) for label in labels], dtype=object), return_inverse=True)
+        new_labels = False
+        label_ids = np.empty(len(unique_labels), dtype=np.uint16)
+        for i, label in enumerate(unique_labels):
+
+            if label not in vocabulary:
+
+                vocabulary.append(label)
+                new_labels = True
+            label_ids[i] = vocabulary.index(label)
+
+        # El vocabulario se guarda antes que los registros que lo usan
+        if new_labels:
+
+            _write_labels(path, vocabulary)
+
+    records['label'] = label_ids[inverse]
+    records['coords'] = coords
+    records['t'] = time.time() if timestamps is None else timestamps
+
+    with open(path, 'ab') as f:
+
+        f.write(records.tobytes())
+
+
+def open_store(path):
+    """
+    Abre un almacén con mapeo de memoria (sin copiar los datos).
+
+    Retorna:
+        tuple: (registros como np.memmap de RECORD_DTYPE, lista de etiquetas)
+    """
+    _check_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize # Se ignora un registro final incompleto
+    labels = _read_labels(path)
+    if count == 0:
+
+        return np.empty(0, dtype=RECORD_DTYPE), labels
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,)), labels
+
+
+def load_store(path):
+    """
+    Carga un almacén como matriz de coordenadas y vector de etiquetas.
+
+    Retorna:
+        tuple: (X vista float32 (n, 132) sobre el mapeo de memoria, y array de etiquetas, t array float64)
+    """
+    records, labels = open_store(path)
+    y = np.asarray(labels, dtype=object)[records['label']] if len(records) else np.empty(0, dtype=object)
+    return records['coords'], y, records['t']
+
+
+def load_landmark_dataframe(path):
+    """
+    Carga un dataset de landmarks ('.csv' o '.lmk') como DataFrame con las columnas del CSV.
+    """
+    if not is_store_path(path):
+
+        return pd.read_csv(path)
+
+    X, y, _ = load_store(path)
+    df = pd.DataFrame(np.asarray(X), columns=COORD_COLUMNS)
+    df.insert(0, 'class', y)
+    return df
+
+
+def csv_to_store(csv_path, store_path=None, chunksize=10000):
+    """
+    Convierte un CSV de landmarks al formato binario, por bloques para acotar la memoria.
+
+    Las filas convertidas reciben como instante la fecha de modificación del CSV.
+
+    :return: (ruta del almacén, número de filas convertidas)
+    """
+    store_path = store_path or os.path.splitext(csv_path)[0] + STORE_EXTENSION
+    create_store(store_path)
+
+    timestamp = os.path.getmtime(csv_path)
+    total = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+
+        append_arrays(store_path, chunk['class'].tolist(), chunk[COORD_COLUMNS].values, timestamps=timestamp)
+        total += len(chunk)
+    return store_path, total
+
+
+def store_to_csv(store_path, csv_path=None):
+    """
+    Exporta un almacén binario al CSV de landmarks de siempre.
+    """
+    csv_path = csv_path or os.path.splitext(store_path)[0] + '.csv'
+    load_landmark_dataframe(store_path).to_csv(csv_path, index=False)
+    return csv_path
+
+
+def main(argv=None):
+    """
+    CLI de conversión entre CSV y almacén binario.
+
+    Ejemplo:
+        python -m utils.landmark_store data/coords_sentadilla.csv
+        python -m utils.landmark_store data/coords_sentadilla.lmk --to-csv
+    """
+    parser = argparse.ArgumentParser(description="Conversión de datasets de landmarks CSV <-> binario (.lmk).")
+    parser.add_argument("inputs", nargs='+', help="Archivos a convertir.")
+    parser.add_argument("--to-csv", action='store_true', help="Convertir almacenes .lmk a CSV.")
+    args = parser.parse_args(argv)
+
+    for path in args.inputs:
+
+        if args.to_csv:
+
+            print(f"'{path}' -> '{store_to_csv(path)}'")
+        else:
+
+            start = time.perf_counter()
+            store_path, total = csv_to_store(path)
+            print(f"'{path}' -> '{store_path}': {total} filas, {os.path.getsize(path)} -> {os.path.getsize(store_path)} bytes "
+                  f"en {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+
+from utils.landmark_store import append_rows, create_store, is_store_path
+
+
+# Valores por defecto de la escritura por lotes
+DEFAULT_FLUSH_INTERVAL = 1.0 # Segundos máximos que una fila espera en memoria
+DEFAULT_FLUSH_ROWS = 256 # Filas acumuladas que fuerzan una escritura
+DEFAULT_MAX_PENDING_ROWS = 20000 # Límite de filas en memoria (memoria acotada)
+
+
+class _FlushRequest:
+
+    def __init__(self):
+
+        self.done = threading.Event()
+
+
+class LandmarkWriter:
+    """
+    Escritor asíncrono de filas de landmarks a archivos CSV o almacenes binarios ('.lmk').
+
+    Los detectores encolan las filas en memoria y un hilo en segundo plano las agrupa
+    por archivo y las escribe por lotes (un único open/append por archivo y lote), en
+    lugar de abrir y cerrar el CSV en cada fotograma. La cola está acotada: si el disco
+    no da abasto y se alcanza 'max_pending_rows', las filas nuevas se descartan y se
+    contabilizan en 'dropped_rows' sin bloquear el bucle de video.
+    """
+
+    def __init__(self, flush_interval=DEFAULT_FLUSH_INTERVAL, flush_rows=DEFAULT_FLUSH_ROWS,
+                 max_pending_rows=DEFAULT_MAX_PENDING_ROWS):
+
+        self.flush_interval = float(flush_interval)
+        self.flush_rows = max(1, int(flush_rows))
+        self._queue = queue.Queue(maxsize=max(1, int(max_pending_rows)))
+
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        # Funciones que reciben cada lote escrito (p. ej. el entrenamiento incremental)
+        self._listeners = []
+
+        # Estadísticas
+        self.written_rows = 0
+        self.dropped_rows = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+
+        if self._thread is not None:
+
+            return
+
+        with self._start_lock:
+
+            if self._thread is None:
+
+                self._thread = threading.Thread(target=self._run, name="landmark-writer", daemon=True)
+                self._thread.start()
+
+    def add_listener(self, listener):
+        """
+        Registra listener(path, rows), llamado desde el hilo del escritor con cada lote de
+        filas ya escrito en 'path'. Debe ser rápido: no debe bloquear la escritura.
+        """
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener):
+
+        self._listeners = [registered for registered in self._listeners if registered is not listener]
+
+    def write_row(self, path, row):
+        """
+        Encola una fila para añadirla al dataset 'path' (CSV o '.lmk'). No bloquea.
+
+        Retorna:
+            bool: False si la fila se descartó porque la cola está llena o el escritor cerrado.
+        """
+        if self._closed:
+
+            self.dropped_rows += 1
+            return False
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((path, row, time.time()))
+        except queue.Full:
+
+            self.dropped_rows += 1
+            return False
+        return True
+
+    def flush(self, timeout=5.0):
+        """
+        Espera a que todas las filas encoladas hasta ahora estén escritas en disco.
+
+        Retorna:
+            bool: True si la escritura terminó dentro de 'timeout'.
+        """
+        if self._thread is None or not self._thread.is_alive():
+
+            return True
+
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+
+            return False
+        return request.done.wait(timeout)
+
+    def _run(self):
+
+        pending = {} # path -> lista de filas
+        pending_count = 0
+        deadline = None
+
+        while True:
+
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+
+                item = None
+
+            if isinstance(item, _FlushRequest):
+
+                self._write(pending)
+                pending, pending_count, deadline = {}, 0, None
+                item.done.set()
+                continue
+
+            if item is not None:
+
+                path, row, timestamp = item
+                pending.setdefault(path, []).append((row, timestamp))
+                pending_count += 1
+                if deadline is None:
+
+                    deadline = time.monotonic() + self.flush_interval
+
+            if pending_count >= self.flush_rows or (deadline is not None and time.monotonic() >= deadline):
+
+                self._write(pending)
+                pending, pending_count, deadline = {}, 0, None
+
+    def _write(self, pending):
+
+        for path, entries in pending.items():
+
+            rows = [row for row, _ in entries]
+            try:
+                if is_store_path(path):
+
+                    append_rows(path, rows, timestamps=[timestamp for _, timestamp in entries])
+                else:
+
+                    with open(path, mode='a', newline='') as f:
+
+                        csv_writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                        csv_writer.writerows(rows)
+                self.written_rows += len(rows)
+            except (OSError, ValueError) as e:
+
+                # El archivo pudo eliminarse (por ejemplo, el CSV temporal de un análisis offline)
+                self.dropped_rows += len(rows)
+                print(f"Error al escribir {len(rows)} landmarks en '{path}': {e}")
+                continue
+
+            for listener in self._listeners:
+
+                try:
+                    listener(path, rows)
+                except Exception as e:
+
+                    print(f"Error en un receptor de landmarks: {e}")
+        if pending:
+
+            self.batches += 1
+
+    def stats(self):
+
+        return {
+            "written_rows": self.written_rows,
+            "dropped_rows": self.dropped_rows,
+            "batches": self.batches,
+            "pending_rows": self._queue.qsize(),
+        }
+
+    def close(self, timeout=5.0):
+        """
+        Escribe las filas pendientes y deja de aceptar filas nuevas.
+        """
+        self.flush(timeout=timeout)
+        self._closed = True
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def create_landmark_file(path, header):
+    """
+    Crea (o vacía) un dataset de landmarks: CSV con su encabezado, o almacén binario si la ruta es '.lmk'.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if is_store_path(path):
+
+        create_store(path)
+        return
+
+    with open(path, mode='w', newline='') as f:
+
+        csv_writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        csv_writer.writerow(header)
+
+
+def get_landmark_writer():
+    """
+    Devuelve el escritor de landmarks compartido por todos los detectores del proceso.
+    """
+    global _writer
+
+    if _writer is None:
+
+        with _writer_lock:
+
+            if _writer is None:
+
+                _writer = LandmarkWriter(
+                    flush_interval=float(os.environ.get('TFM_LANDMARK_FLUSH_S', DEFAULT_FLUSH_INTERVAL)),
+                    flush_rows=int(os.environ.get('TFM_LANDMARK_FLUSH_ROWS', DEFAULT_FLUSH_ROWS)),
+                )
+    return _writer
+
+
+def flush_landmarks(timeout=5.0):
+    """
+    Escribe en disco todas las filas de landmarks pendientes del proceso.
+    """
+    if _writer is not None:
+
+        return _writer.flush(timeout=timeout)
+    return True
+
+
+# Garantiza que no se pierdan filas al terminar el proceso
+atexit.register(flush_landmarks)
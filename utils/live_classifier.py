@@ -0,0 +1,257 @@
+import collections
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.compiled_model import compiled_model_path
+from utils.landmark_store import COORD_COLUMNS, NUM_COORDS
+from utils.model_registry import get_model_registry
+
+
+# Valores por defecto de la clasificación en vivo
+DEFAULT_BATCH_SIZE = 4 # Fotogramas por lote de predicción
+DEFAULT_MAX_WAIT = 0.01 # Segundos máximos que un fotograma espera a completar su lote
+DEFAULT_SMOOTHING_WINDOW = 5 # Predicciones que se promedian para la etiqueta mostrada
+FRAME_BUDGET_MS = 1000.0 / 30 # Presupuesto por fotograma a 30 FPS
+
+def _preferred_model_path(model_path):
+
+    # El modelo compilado solo se usa si es al menos tan reciente como el pickle
+    compiled_path = compiled_model_path(model_path)
+    try:
+        if os.path.getmtime(compiled_path) >= os.path.getmtime(model_path):
+
+            return compiled_path
+    except OSError:
+
+        pass
+    return model_path
+
+
+def _predict_batch(model, X):
+
+    # Los modelos se entrenan con un DataFrame: se predice con los mismos nombres de columna
+    if getattr(model, 'feature_names_in_', None) is not None:
+
+        X = pd.DataFrame(X, columns=COORD_COLUMNS)
+
+    if hasattr(model, 'predict_proba'):
+
+        return model.predict_proba(X)
+
+    # Sin probabilidades (p. ej. RidgeClassifier): una predicción equivale a probabilidad 1
+    labels = model.predict(X)
+    probabilities = np.zeros((len(labels), len(model.classes_)))
+    probabilities[np.arange(len(labels)), np.searchsorted(model.classes_, labels)] = 1.0
+    return probabilities
+
+
+class LiveFormClassifier:
+    """
+    Clasificador de la forma del ejercicio en vivo con el modelo entrenado del ejercicio.
+
+    El bucle de video entrega el vector de landmarks de cada fotograma con 'submit', que
+    no bloquea. Un hilo en segundo plano agrupa los vectores en micro-lotes (hasta
+    'batch_size' fotogramas o 'max_wait' segundos desde el primero) y hace una sola
+    predicción por lote, que cuesta mucho menos por fotograma que una predicción por
+    fotograma. Cuando el modelo va al día los lotes son de uno o dos fotogramas; si se
+    retrasa (varias estaciones, un modelo pesado) los fotogramas acumulados se predicen
+    juntos y la latencia se recupera. Las probabilidades de las últimas 'smoothing_window'
+    predicciones se promedian para que la etiqueta mostrada no parpadee.
+
+    'metrics' devuelve la etiqueta suavizada, su confianza y la latencia por fotograma
+    (desde 'submit' hasta tener la predicción), que debe quedar por debajo de 33 ms a 30 FPS.
+
+    El modelo se toma del registro de modelos ('ModelRegistry') antes de cada lote: si se
+    entrena una versión nueva, el siguiente lote ya la usa, sin detener la sesión. Si junto
+    al pickle hay un modelo compilado ('CompiledModel', mismo nombre con '.compiled.npz')
+    al día, se usa ese: predice lo mismo en microsegundos en lugar de milisegundos.
+    """
+
+    def __init__(self, model_path, batch_size=DEFAULT_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 smoothing_window=DEFAULT_SMOOTHING_WINDOW, max_pending=64, registry=None, prefer_compiled=True):
+        """
+        :param prefer_compiled: Usar el modelo compilado del pickle si existe y está al día.
+        :raises ValueError: Si no hay ningún modelo utilizable en 'model_path'.
+        """
+        self.source_path = model_path
+        self.prefer_compiled = prefer_compiled
+        self.model_path = _preferred_model_path(model_path) if prefer_compiled else model_path
+        self.registry = registry or get_model_registry()
+        self.model = self.registry.get(self.model_path)
+        if self.model is None:
+
+            raise ValueError(f"No hay un modelo utilizable en '{self.model_path}'")
+        self.classes = [str(label) for label in self.model.classes_]
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = float(max_wait)
+        self._queue = queue.Queue(maxsize=max(1, int(max_pending)))
+
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=max(1, int(smoothing_window)))
+        self._latencies_ms = collections.deque(maxlen=120)
+        self._predict_ms_per_frame = collections.deque(maxlen=120)
+
+        # Estadísticas
+        self.predicted_frames = 0
+        self.dropped_frames = 0
+        self.batches = 0
+        self.model_swaps = 0
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="live-classifier", daemon=True)
+        self._thread.start()
+
+    def submit(self, landmarks):
+        """
+        Encola el array (33, 4) de landmarks de un fotograma (se copia). No bloquea.
+
+        :param landmarks: Array de landmarks, o None si el fotograma no tiene pose (se ignora).
+        :return: False si el fotograma se descartó.
+        """
+        if landmarks is None or self._closed:
+
+            return False
+
+        vector = np.array(landmarks, dtype=np.float32).reshape(NUM_COORDS)
+        try:
+            self._queue.put_nowait((vector, time.perf_counter()))
+        except queue.Full:
+
+            # El modelo no da abasto: se descarta el fotograma en lugar de acumular latencia
+            self.dropped_frames += 1
+            return False
+        return True
+
+    def _next_batch(self):
+
+        item = self._queue.get()
+        if item is None:
+
+            return None
+
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.batch_size:
+
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+
+                break
+            if item is None:
+
+                self._closed = True
+                break
+            batch.append(item)
+        return batch
+
+    def _refresh_model(self):
+
+        # Las fechas se vuelven a comparar: un compilado que queda atrás de un pickle nuevo
+        # (o que se borra) deja de usarse, y uno recompilado vuelve a usarse
+        if self.prefer_compiled:
+
+            self.model_path = _preferred_model_path(self.source_path)
+        model = self.registry.get(self.model_path)
+        if model is None or model is self.model:
+
+            return
+
+        # Versión nueva del modelo: las probabilidades anteriores pueden tener otras clases
+        with self._lock:
+
+            self.model = model
+            self.classes = [str(label) for label in model.classes_]
+            self._recent.clear()
+            self.model_swaps += 1
+
+    def _run(self):
+
+        while True:
+
+            batch = self._next_batch()
+            if batch is None:
+
+                return
+
+            self._refresh_model()
+            X = np.stack([vector for vector, _ in batch])
+            start = time.perf_counter()
+            try:
+                probabilities = _predict_batch(self.model, X)
+            except Exception as e:
+
+                print(f"Error en la clasificación en vivo: {e}")
+                self.dropped_frames += len(batch)
+                continue
+            done = time.perf_counter()
+
+            with self._lock:
+
+                for row in probabilities:
+
+                    self._recent.append(row)
+                self._latencies_ms.extend((done - submitted) * 1000.0 for _, submitted in batch)
+                self._predict_ms_per_frame.append((done - start) * 1000.0 / len(batch))
+                self.predicted_frames += len(batch)
+                self.batches += 1
+
+            if self._closed:
+
+                return
+
+    def metrics(self):
+        """
+        Etiqueta suavizada, confianza y latencias para añadir al diccionario de metricas.
+        """
+        with self._lock:
+
+            if not self._recent:
+
+                return {"model_label": None, "model_confidence": None, "model_latency_ms": None}
+
+            mean = np.mean(self._recent, axis=0)
+            best = int(np.argmax(mean))
+            latencies = np.asarray(self._latencies_ms)
+            latency_p95 = float(np.percentile(latencies, 95))
+            return {
+                "model_label": self.classes[best],
+                "model_confidence": round(float(mean[best]), 3),
+                "model_latency_ms": round(float(np.median(latencies)), 2),
+                "model_latency_p95_ms": round(latency_p95, 2),
+                "model_predict_ms_per_frame": round(float(np.mean(self._predict_ms_per_frame)), 3),
+                "model_within_budget": latency_p95 <= FRAME_BUDGET_MS,
+            }
+
+    def stats(self):
+
+        return {
+            "model_predicted_frames": self.predicted_frames,
+            "model_dropped_frames": self.dropped_frames,
+            "model_batches": self.batches,
+            "model_swaps": self.model_swaps,
+        }
+
+    def close(self, timeout=1.0):
+        """
+        Detiene el hilo de predicción (los fotogramas aún en cola se descartan).
+        """
+        if self._closed:
+
+            return
+        self._closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+
+            pass
+        self._thread.join(timeout=timeout)
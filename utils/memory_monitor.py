@@ -0,0 +1,144 @@
+import os
+import threading
+
+try:
+    import resource
+except ImportError: # Windows
+
+    resource = None
+
+from utils.process_pool import executor_pids, track_executors, untrack_executors
+
+
+DEFAULT_SAMPLE_INTERVAL = 0.05 # Segundos entre muestras de la memoria residente
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss_bytes(pid=None):
+    """
+    Memoria residente (RSS) actual del proceso (o del proceso 'pid'), o None si no se puede leer.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+
+        return None
+
+
+def pool_rss_bytes(executors):
+    """
+    Suma de la memoria residente de los procesos de los pools ('spawn_executor') abiertos.
+    """
+    return sum(current_rss_bytes(pid) or 0 for pid in executor_pids(executors))
+
+
+def _max_rss_bytes(who=None):
+
+    # Pico histórico (ru_maxrss está en KB en Linux y en bytes en macOS). Con RUSAGE_CHILDREN
+    # es el del mayor de todos los hijos ya terminados del proceso, no la suma
+    if resource is None:
+
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class PeakMemoryMonitor:
+    """
+    Mide el pico de memoria residente del proceso durante un bloque de código.
+
+        with PeakMemoryMonitor() as monitor:
+            ...
+        monitor.report()
+
+    Un hilo muestrea cada 'interval' segundos '/proc/self/statm' y el de cada proceso de
+    los pools que el bloque crea con 'spawn_executor' (desde el mismo hilo): no cuenta
+    otros hijos del proceso, como los de la inferencia de pose u otros entrenamientos.
+    Donde no existe (fuera de Linux) se usa el pico histórico del proceso ('ru_maxrss'),
+    que puede ser anterior al bloque. El informe añade el 'ru_maxrss' de los hijos ya
+    terminados, que es de todo el proceso.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+
+        self.interval = float(interval)
+        self.baseline = None
+        self.peak = None
+        self.pool_peak = None
+        self.total_peak = None
+        self.process_children_maxrss = None
+        self._executors = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+
+            self.peak = rss
+        pools = pool_rss_bytes(self._executors)
+        if self.pool_peak is None or pools > self.pool_peak:
+
+            self.pool_peak = pools
+        if rss is not None and (self.total_peak is None or rss + pools > self.total_peak):
+
+            self.total_peak = rss + pools
+
+    def _run(self):
+
+        while not self._stop.wait(self.interval):
+
+            self._sample()
+
+    def __enter__(self):
+
+        self.baseline = current_rss_bytes()
+        self.peak = self.baseline
+        self._executors = track_executors()
+        if self.baseline is not None:
+
+            self._thread = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+
+        self._stop.set()
+        untrack_executors(self._executors)
+        if self._thread is not None:
+
+            self._thread.join()
+            self._sample()
+        else:
+
+            self.peak = _max_rss_bytes()
+        if resource is not None:
+
+            self.process_children_maxrss = _max_rss_bytes(resource.RUSAGE_CHILDREN)
+        return False
+
+    def report(self):
+        """
+        Memoria del bloque, en MB: base y pico del proceso principal ('baseline_rss_mb',
+        'peak_rss_mb', 'peak_increase_mb'), pico de la suma de los procesos de los pools
+        del bloque ('pool_peak_rss_mb'), pico del proceso más esos pools muestreados a la
+        vez ('total_peak_rss_mb') y el mayor pico de cualquier hijo ya terminado del proceso
+        ('process_children_maxrss_mb', de 'RUSAGE_CHILDREN': incluye hijos ajenos al bloque
+        y anteriores a él).
+        """
+        def to_mb(value):
+
+            return round(value / (1024 * 1024), 1) if value is not None else None
+
+        return {
+            "baseline_rss_mb": to_mb(self.baseline),
+            "peak_rss_mb": to_mb(self.peak),
+            "peak_increase_mb": to_mb(self.peak - self.baseline) if self.peak is not None and self.baseline is not None else None,
+            "pool_peak_rss_mb": to_mb(self.pool_peak),
+            "total_peak_rss_mb": to_mb(self.total_peak),
+            "process_children_maxrss_mb": to_mb(self.process_children_maxrss),
+        }
@@ -0,0 +1,177 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class FrameBroadcaster:
+    """
+    Difunde un stream MJPEG a varios clientes codificando cada fotograma una sola vez.
+
+    El hilo de procesamiento publica los fotogramas con 'publish' y cada cliente se
+    suscribe con 'stream', que se bloquea en una condicion hasta que hay un fotograma
+    nuevo. Asi se evita la espera activa y los reenvios del mismo fotograma, y el coste
+    de codificacion no crece con el numero de clientes (TV del gimnasio, tablet del
+    entrenador, pantalla del atleta...).
+    """
+
+    def __init__(self, jpeg_quality=80):
+
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+
+        self._condition = threading.Condition()
+        self._frame = None # Ultimo fotograma codificado (bytes JPEG)
+        self._seq = 0 # Se incrementa con cada fotograma nuevo publicado
+        self._closed = False
+
+        # Estadisticas
+        self.published_frames = 0
+        self.duplicate_frames = 0
+        self.subscribers = 0
+
+    def publish(self, image):
+        """
+        Codifica un fotograma a JPEG y despierta a todos los suscriptores.
+
+        Los fotogramas cuyo JPEG es identico al ultimo publicado se descartan.
+
+        Retorna:
+            bool: True si se publico un fotograma nuevo.
+        """
+        ret, jpeg = cv2.imencode('.jpg', image, self.encode_params)
+        if not ret:
+
+            return False
+
+        return self.publish_encoded(jpeg.tobytes())
+
+    def publish_encoded(self, jpeg_bytes):
+        """
+        Publica un fotograma ya codificado en JPEG.
+        """
+        with self._condition:
+
+            if self._frame is not None and jpeg_bytes == self._frame:
+
+                self.duplicate_frames += 1
+                return False
+
+            self._frame = jpeg_bytes
+            self._seq += 1
+            self.published_frames += 1
+            self._condition.notify_all()
+            return True
+
+    def reset(self):
+        """
+        Limpia el ultimo fotograma y reabre el difusor para un nuevo stream.
+        """
+        with self._condition:
+
+            self._frame = None
+            self._closed = False
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Cierra el difusor: todos los suscriptores terminan su stream.
+        """
+        with self._condition:
+
+            self._closed = True
+            self._frame = None
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+
+        return self._closed
+
+    def wait_for_frame(self, last_seq, timeout=None, stop_on_close=True):
+        """
+        Espera a que haya un fotograma con numero de secuencia mayor que 'last_seq'.
+
+        Con 'stop_on_close=False' la espera continua aunque el difusor este cerrado,
+        lo que permite a un cliente suscribirse mientras el stream se (re)inicia.
+
+        Retorna:
+            tuple: (seq, jpeg_bytes), o (last_seq, None) si el difusor se cerro o se agoto el tiempo.
+        """
+        with self._condition:
+
+            self._condition.wait_for(
+                lambda: (stop_on_close and self._closed) or (self._frame is not None and self._seq > last_seq),
+                timeout=timeout
+            )
+            if self._frame is None or self._seq <= last_seq or (stop_on_close and self._closed):
+
+                return last_seq, None
+
+            return self._seq, self._frame
+
+    def stream(self, first_frame_timeout=15, error_message='ERROR: Camara no disponible'):
+        """
+        Generador de partes 'multipart/x-mixed-replace' para un cliente.
+
+        Si no llega ningun fotograma en 'first_frame_timeout' segundos se envia un
+        fotograma de error y el stream termina.
+        """
+        with self._condition:
+
+            self.subscribers += 1
+
+        try:
+            # El primer fotograma se espera aunque el difusor este cerrado: el procesamiento
+            # puede estar arrancando todavia
+            last_seq, jpeg = self.wait_for_frame(0, timeout=first_frame_timeout, stop_on_close=False)
+            if jpeg is None:
+
+                print(f"Tiempo de espera agotado: El procesamiento de video no produjo un fotograma en {first_frame_timeout} segundos.")
+                yield self._multipart(self._error_frame(error_message))
+                return
+
+            yield self._multipart(jpeg)
+
+            while True:
+
+                # Espera pasiva hasta el siguiente fotograma; el timeout solo sirve para revisar el cierre
+                seq, jpeg = self.wait_for_frame(last_seq, timeout=1.0)
+                if self._closed:
+
+                    break
+
+                if jpeg is None:
+
+                    continue
+
+                last_seq = seq
+                yield self._multipart(jpeg)
+        finally:
+
+            with self._condition:
+
+                self.subscribers -= 1
+
+    def stats(self):
+
+        with self._condition:
+
+            return {
+                "published_frames": self.published_frames,
+                "duplicate_frames": self.duplicate_frames,
+                "subscribers": self.subscribers,
+            }
+
+    @staticmethod
+    def _multipart(jpeg_bytes):
+
+        return (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+    @staticmethod
+    def _error_frame(message):
+
+        error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        cv2.putText(error_frame, message, (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+        ret, jpeg = cv2.imencode('.jpg', error_frame)
+        return jpeg.tobytes() if ret else b''
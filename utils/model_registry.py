@@ -0,0 +1,360 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.compiled_model import COMPILED_EXTENSION, CompiledModel
+
+
+DEFAULT_CHECK_INTERVAL = 1.0 # Segundos entre comprobaciones de una versión nueva en disco
+DEFAULT_KEEP_VERSIONS = 5 # Versiones que se conservan por modelo
+
+_VERSION_PATTERN = re.compile(r'\.v(\d+)\.(pkl|npz)$')
+
+
+def _fsync_write(path, data):
+
+    with open(path, 'wb') as f:
+
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _atomic_write(path, data):
+
+    # Se escribe un temporal completo y se renombra: el archivo final nunca queda a medias
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _fsync_write(tmp_path, data)
+        os.replace(tmp_path, path)
+    finally:
+
+        if os.path.exists(tmp_path):
+
+            os.remove(tmp_path)
+
+
+def _serialize(model, path):
+
+    # Los modelos compilados ('.npz') se guardan como arrays de NumPy; el resto, con pickle
+    if path.endswith(COMPILED_EXTENSION):
+
+        return model.to_bytes()
+    return pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _deserialize(data, path):
+
+    if path.endswith(COMPILED_EXTENSION):
+
+        return CompiledModel.from_bytes(data)
+    return pickle.loads(data)
+
+
+def warm_up_model(model):
+    """
+    Hace una predicción de prueba con un vector de ceros.
+
+    Comprueba que el modelo cargado es utilizable antes de ponerlo en servicio y evita que
+    la primera predicción real pague la inicialización perezosa de scikit-learn.
+    """
+    n_features = getattr(model, 'n_features_in_', None)
+    if n_features is None:
+
+        return
+    X = np.zeros((1, n_features), dtype=np.float32)
+    feature_names = getattr(model, 'feature_names_in_', None)
+    if feature_names is not None:
+
+        X = pd.DataFrame(X, columns=list(feature_names))
+    model.predict(X)
+
+
+class _Entry:
+
+    def __init__(self):
+
+        self.model = None
+        self.signature = None # (archivo, mtime_ns, tamaño) de la versión cargada
+        self.failed_signature = None # Versión que no se pudo cargar (no se reintenta)
+        self.info = {}
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Registro de los modelos entrenados de cada ejercicio, cacheados en memoria.
+
+    Cada modelo se identifica por su ruta lógica (p. ej. 'models/sentadilla_model.pkl').
+    Las rutas '.npz' contienen modelos compilados ('CompiledModel') y se versionan igual.
+    'save' escribe una versión nueva con nombre versionado ('sentadilla_model.v0003.pkl')
+    mediante un temporal y un renombrado atómico, junto con sus metadatos (incluido el
+    SHA-256 del pickle), y actualiza también la ruta lógica de la misma forma.
+
+    'get' devuelve el modelo en memoria y, como mucho cada 'check_interval' segundos,
+    comprueba si hay en disco una versión más reciente (nombre, mtime y tamaño). Si la
+    hay, la carga, verifica su hash, hace una predicción de prueba y solo entonces la
+    pone en servicio, sustituyendo la referencia: las predicciones en curso terminan con
+    el modelo anterior y un stream en vivo no se interrumpe. Si la versión nueva no se
+    puede cargar, se sigue sirviendo la anterior.
+    """
+
+    def __init__(self, check_interval=DEFAULT_CHECK_INTERVAL, keep_versions=DEFAULT_KEEP_VERSIONS):
+
+        self.check_interval = float(check_interval)
+        self.keep_versions = max(1, int(keep_versions))
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self.loads = 0
+        self.reloads = 0
+        self.failed_loads = 0
+
+    # VERSIONES EN DISCO
+    @staticmethod
+    def _base(path):
+
+        return os.path.splitext(os.path.abspath(path))[0]
+
+    @staticmethod
+    def _extension(path):
+
+        return os.path.splitext(path)[1] or '.pkl'
+
+    def versions(self, path):
+        """
+        Versiones guardadas de un modelo, de la más antigua a la más reciente.
+
+        :return: Lista de (número de versión, ruta del archivo).
+        """
+        base = self._base(path)
+        found = []
+        for candidate in glob.glob(f"{glob.escape(base)}.v*{self._extension(path)}"):
+
+            match = _VERSION_PATTERN.search(candidate)
+            if match and os.path.dirname(candidate) == os.path.dirname(base):
+
+                found.append((int(match.group(1)), candidate))
+        return sorted(found)
+
+    def _resolve(self, path):
+
+        # La versión más reciente; los modelos anteriores al registro solo tienen la ruta lógica
+        versions = self.versions(path)
+        return versions[-1][1] if versions else os.path.abspath(path)
+
+    @staticmethod
+    def _metadata_path(version_path):
+
+        return f"{os.path.splitext(version_path)[0]}.json"
+
+    # GUARDADO
+    def save(self, model, path, metadata=None):
+        """
+        Guarda una versión nueva del modelo de forma atómica.
+
+        :param model: Modelo entrenado.
+        :param path: Ruta lógica del modelo ('models/<nombre>.pkl' o '.npz'), que también se actualiza.
+        :param metadata: Diccionario opcional de metadatos (algoritmo, métricas, ...).
+        :return: Ruta del archivo versionado.
+        """
+        data = _serialize(model, path)
+        base = self._base(path)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+
+        with self._lock:
+
+            versions = self.versions(path)
+            version = versions[-1][0] + 1 if versions else 1
+            version_path = f"{base}.v{version:04d}{self._extension(path)}"
+            info = dict(metadata or {}, version=version, sha256=hashlib.sha256(data).hexdigest(),
+                        size=len(data), created=time.time())
+
+            # Primero los metadatos y después el pickle: una versión visible siempre tiene su hash
+            _atomic_write(self._metadata_path(version_path), json.dumps(info, ensure_ascii=False, indent=2).encode('utf-8'))
+            _atomic_write(version_path, data)
+            _atomic_write(os.path.abspath(path), data)
+
+            for _, old_path in versions[:max(0, len(versions) + 1 - self.keep_versions)]:
+
+                for candidate in (old_path, self._metadata_path(old_path)):
+
+                    if os.path.exists(candidate):
+
+                        os.remove(candidate)
+
+        print(f"Modelo guardado como versión {version}: '{version_path}'.")
+        return version_path
+
+    def remove(self, path):
+        """
+        Borra el modelo: la ruta lógica, todas sus versiones y sus metadatos.
+
+        :return: Número de archivos borrados.
+        """
+        with self._lock:
+
+            removed = 0
+            for _, version_path in self.versions(path):
+
+                for candidate in (version_path, self._metadata_path(version_path)):
+
+                    if os.path.exists(candidate):
+
+                        os.remove(candidate)
+                        removed += 1
+            if os.path.exists(os.path.abspath(path)):
+
+                os.remove(os.path.abspath(path))
+                removed += 1
+            self._entries.pop(os.path.abspath(path), None)
+
+        if removed:
+
+            print(f"Modelo borrado: '{path}' ({removed} archivos).")
+        return removed
+
+    # CARGA
+    def _load(self, version_path, entry, signature):
+
+        with open(version_path, 'rb') as f:
+
+            data = f.read()
+
+        info = {}
+        metadata_path = self._metadata_path(version_path)
+        if _VERSION_PATTERN.search(version_path) and os.path.exists(metadata_path):
+
+            with open(metadata_path, encoding='utf-8') as f:
+
+                info = json.load(f)
+            digest = hashlib.sha256(data).hexdigest()
+            if info.get('sha256') not in (None, digest):
+
+                raise ValueError(f"el hash de '{version_path}' no coincide con sus metadatos")
+
+        model = _deserialize(data, version_path)
+        warm_up_model(model)
+
+        info = dict(info, path=version_path, loaded_at=time.time())
+        is_reload = entry.model is not None
+        entry.model, entry.signature, entry.info = model, signature, info
+        self.loads += 1
+        if is_reload:
+
+            self.reloads += 1
+            print(f"Modelo actualizado en caliente: '{version_path}'.")
+
+    def get(self, path):
+        """
+        Devuelve el modelo en memoria, cargando la versión más reciente si ha cambiado.
+
+        :return: El modelo, o None si no existe ninguna versión utilizable.
+        """
+        key = os.path.abspath(path)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry.model is not None and now - entry.checked_at < self.check_interval:
+
+            return entry.model
+
+        with self._lock:
+
+            entry = self._entries.setdefault(key, _Entry())
+
+        with entry.lock:
+
+            if entry.model is not None and time.monotonic() - entry.checked_at < self.check_interval:
+
+                return entry.model
+
+            version_path = self._resolve(key)
+            try:
+                stat = os.stat(version_path)
+            except OSError:
+
+                entry.checked_at = time.monotonic()
+                return entry.model
+
+            signature = (version_path, stat.st_mtime_ns, stat.st_size)
+            if signature != entry.signature and signature != entry.failed_signature:
+
+                try:
+                    self._load(version_path, entry, signature)
+                except Exception as e:
+
+                    entry.failed_signature = signature
+                    self.failed_loads += 1
+                    print(f"No se pudo cargar el modelo '{version_path}': {e}")
+            entry.checked_at = time.monotonic()
+            return entry.model
+
+    def info(self, path):
+        """
+        Metadatos de la versión en memoria de un modelo (versión, hash, métricas, ...).
+        """
+        entry = self._entries.get(os.path.abspath(path))
+        return dict(entry.info) if entry is not None else {}
+
+    def stats(self):
+
+        return {
+            "cached_models": sum(1 for entry in self._entries.values() if entry.model is not None),
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "failed_loads": self.failed_loads,
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """
+    Devuelve el registro de modelos compartido por todo el proceso.
+    """
+    global _registry
+
+    if _registry is None:
+
+        with _registry_lock:
+
+            if _registry is None:
+
+                _registry = ModelRegistry(
+                    check_interval=float(os.environ.get('TFM_MODEL_CHECK_S', DEFAULT_CHECK_INTERVAL)),
+                    keep_versions=int(os.environ.get('TFM_MODEL_KEEP_VERSIONS', DEFAULT_KEEP_VERSIONS)),
+                )
+    return _registry
+
+
+def save_model(model, path, metadata=None):
+    """
+    Guarda una versión nueva del modelo en el registro compartido (ver 'ModelRegistry.save').
+    """
+    return get_model_registry().save(model, path, metadata)
+
+
+def remove_model(path):
+    """
+    Borra un modelo y sus versiones del registro compartido (ver 'ModelRegistry.remove').
+    """
+    return get_model_registry().remove(path)
+
+
+def load_model(path):
+    """
+    Modelo en memoria del registro compartido (ver 'ModelRegistry.get').
+    """
+    return get_model_registry().get(path)
@@ -1,67 +1,27 @@
 import cv2
 import mediapipe as mp
-import numpy as np
 import os
-import csv
+
+from utils.exercise_rules import DEADLIFT_RULES
+from utils.landmark_writer import create_landmark_file, get_landmark_writer
+from utils.pose_landmarks import LandmarkBuffer, LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE
+from utils.rule_engine import RuleEngine
 
 mp_pose = mp.solutions.pose
 mp_drawing = mp.solutions.drawing_utils
 
-def calculate_angle(a, b, c):
-
-    """Calcula el angulo entre tres puntos."""
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.degrees(radians)
-
-    # Convertir el ángulo para que siempre esté entre 0 y 180 grados
-    if angle < 0:
-
-        angle += 360 # Convertir ángulos negativos a su equivalente positivo
-
-    if angle > 180.0:
-
-        angle = 360 - angle # Asegurarse de que es el ángulo más pequeño
-
-    return angle
-
 class DeadliftDetector:
 
-    def __init__(self, csv_file_name='coords_peso_muerto.csv'):
+    def __init__(self, csv_file_name='coords_peso_muerto.csv', reset_csv=False, pose_model=None, thresholds=None):
 
-        self.pose_model = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-        
-        # Variables de estado para el peso muerto
-        self.correct_reps = 0 # Contador de repeticiones correctas
-        self.incorrect_reps = 0 # Contador de repeticiones incorrectas
-        self.stage = "initial"  # Estado actual: "initial", "down", "transition", "up"
-        self.current_action_for_export = None # Para exportar al CSV
-        self.rep_status = "unknown" # Estado de la repetición actual ("correct", "incorrect", "unknown")
-        
-        # Para detectar el inicio de la subida desde el punto más bajo
-        self.min_hip_angle_in_down = 180 # Registra el ángulo de cadera más bajo alcanzado durante el descenso
-
-        # Umbrales para el angulo de la cadera
-        # hip_angle_threshold_up: Ángulo de cadera flexionado (90-100 grados), indica el punto más bajo.
-        # hip_angle_threshold_down: Ángulo de cadera extendido (150-170 grados), indica la posición de pie.
-        self.hip_angle_threshold_down = 150  # Ángulo de cadera para posición de "arriba" (casi extendido)
-        self.hip_angle_threshold_up = 90     # Ángulo de cadera para posición de "abajo" (flexionado)
-
-        # Umbrales para detectar postura incorrecta
-        # Rodilla
-        self.knee_angle_threshold_min_down = 100 # Angulo mínimo de rodilla al bajar (evitar rodillas bloqueadas o excesivamente estiradas)
-        self.knee_angle_threshold_max_down = 160 # Angulo máximo de rodilla al bajar (evitar excesiva flexión)
-        self.knee_lock_threshold = 170 # Ángulo para considerar que la rodilla está "bloqueada" o casi recta (usado en "transition")
-
-        # Torso (espalda)
-        # torso_straight_threshold_up: Ángulo del torso cuando la espalda está recta en la parte superior del movimiento.
-        self.torso_straight_threshold_up = 170 # Ángulo del torso para considerarse "recto" en la parte superior del movimiento
-        # torso_rounded_threshold: Ángulo por debajo del cual el torso se considera "redondeado" (incorrecto).
-        self.torso_rounded_threshold = 120 # Ángulo por debajo del cual el torso se considera "redondeado" (incorrecto)
+        # Se puede inyectar un objeto con la interfaz de mp_pose.Pose (p. ej. un cliente del pool de inferencia)
+        self.pose_model = pose_model if pose_model is not None else mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+        # Array (33, 4) preasignado donde se extraen los landmarks de cada fotograma
+        self.landmarks = LandmarkBuffer()
         
+        # Angulos, umbrales y fases del peso muerto (especificacion declarativa): "initial", "down", "transition", "up"
+        self.rules = RuleEngine(DEADLIFT_RULES, thresholds=thresholds)
+
         # Configuracion CSV
         self.csv_file_name = csv_file_name
         self.csv_headers = ['class']
@@ -69,20 +29,23 @@ class DeadliftDetector:
 
             self.csv_headers += ['x{}'.format(val), 'y{}'.format(val), 'z{}'.format(val), 'v{}'.format(val)]
 
-        self._initialize_csv()
+        self._initialize_csv(reset=reset_csv)
 
-    def _initialize_csv(self):
+    def _initialize_csv(self, reset=True):
 
         # Borrar el archivo CSV si ya existe y crear con encabezado
+        # Si no se reinicia el dataset y el archivo ya existe, se conserva para seguir añadiendo filas
+        if not reset and os.path.exists(self.csv_file_name):
+
+            return
+
         if os.path.exists(self.csv_file_name):
 
             os.remove(self.csv_file_name)
             print(f"Archivo CSV '{self.csv_file_name}' existente ha sido borrado.")
 
-        with open(self.csv_file_name, mode='w', newline='') as f:
-
-            csv_writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            csv_writer.writerow(self.csv_headers)
+        # CSV con encabezado, o almacén binario si la ruta termina en '.lmk'
+        create_landmark_file(self.csv_file_name, self.csv_headers)
 
         print(f"Archivo CSV '{self.csv_file_name}' creado con el encabezado.")
 
@@ -95,14 +58,11 @@ class DeadliftDetector:
         try:
             if results.pose_landmarks and action:
 
-                keypoints = np.array([[res.x, res.y, res.z, res.visibility] for res in results.pose_landmarks.landmark]).flatten()
-                keypoints_list = keypoints.tolist() 
-                keypoints_list.insert(0, action)
+                # La fila sale del array de landmarks ya extraído en este fotograma
+                keypoints_list = self.landmarks.export_row(action)
 
-                with open(self.csv_file_name, mode='a', newline='') as f:
-
-                    csv_writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                    csv_writer.writerow(keypoints_list)
+                # La fila se encola y el escritor compartido la añade al CSV por lotes en segundo plano
+                get_landmark_writer().write_row(self.csv_file_name, keypoints_list)
 
         except Exception as e:
             # print(f"Error al exportar landmark: {e}") # Descomentar para depuración
@@ -128,176 +88,47 @@ class DeadliftDetector:
         image.flags.writeable = True
         image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
 
-        # Inicializar ángulos a 0 para asegurar que siempre estén definidos,
-        # en caso de que no se detecten landmarks.
-        left_hip_angle = 0 
-        right_hip_angle = 0
-        left_knee_angle = 0 
-        right_knee_angle = 0 
-        torso_angle = 0 
-
-        try:
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-
-                # Obtener coordenadas de los landmarks relevantes
-                left_shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-                right_shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-                left_hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-                right_hip = [landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].x, landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-                left_knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-                right_knee = [landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y]
-                left_ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-                right_ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x, landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-                
-                # Para el ángulo del torso: hombro, cadera y punto vertical
-                # Unimos los puntos de cadera y hombro de ambos lados para un punto central
-                mid_hip = [(left_hip[0] + right_hip[0]) / 2, (left_hip[1] + right_hip[1]) / 2]
-                mid_shoulder = [(left_shoulder[0] + right_shoulder[0]) / 2, (left_shoulder[1] + right_shoulder[1]) / 2]
-
-                # Punto vertical hacia abajo desde la cadera para medir el ángulo del torso con la vertical
-                vertical_from_hip = [mid_hip[0], mid_hip[1] + 0.1] 
-                torso_angle = calculate_angle(mid_shoulder, mid_hip, vertical_from_hip)
-
-                # Calcular los angulos
-                left_hip_angle = calculate_angle(left_shoulder, left_hip, left_knee)
-                right_hip_angle = calculate_angle(right_shoulder, right_hip, right_knee)
-                avg_hip_angle = (left_hip_angle + right_hip_angle) / 2
-
-                left_knee_angle = calculate_angle(left_hip, left_knee, left_ankle) 
-                right_knee_angle = calculate_angle(right_hip, right_knee, right_ankle) 
-                avg_knee_angle = (left_knee_angle + right_knee_angle) / 2 
-
-
-
-                # Logica para el contador de repeticiones de peso muerto y exportacion de landmarks
-                
-                # Estado INITIAL: Persona de pie, lista para empezar la bajada
-                if self.stage == "initial":
-
-                    # Si la cadera empieza a flexionarse por debajo del umbral de "arriba"
-                    if avg_hip_angle < self.hip_angle_threshold_down: 
-
-                        self.stage = "down"
-                        self.rep_status = "none" # Asumimos none al inicio, se puede invalidar más tarde
-                        self.min_hip_angle_in_down = avg_hip_angle # Inicializamos el ángulo más bajo de cadera
-                        print("Transición a DOWN desde INITIAL.") # Debug
-
-                # Estado DOWN: Persona bajando el peso
-                elif self.stage == "down":
-
-                    # Actualizar el ángulo de cadera más bajo alcanzado durante el descenso
-                    if avg_hip_angle < self.min_hip_angle_in_down:
-
-                        self.min_hip_angle_in_down = avg_hip_angle
-                    
-                    # Chequeos de postura durante la bajada (si la rep es marcada incorrecta, se mantiene)
-                    # Rodillas demasiado dobladas o rectas al inicio de la bajada
-                    if not (self.knee_angle_threshold_min_down < avg_knee_angle < self.knee_angle_threshold_max_down):
-
-                        self.rep_status = "incorrect"
-                        print("DOWN: Rodillas fuera de rango ideal.") # Debug
-                    
-                    # Espalda redondeada durante la bajada
-                    if torso_angle < self.torso_rounded_threshold:
-
-                        self.rep_status = "incorrect"
-                        print("DOWN: Torso redondeado.") # Debug
-
-                    # Transición de DOWN a TRANSITION: cuando el ángulo de cadera empieza a aumentar 
-                    # significativamente desde su punto más bajo (indicando el inicio de la subida)
-                    # Se usa un pequeño buffer (5 grados) para evitar fluctuaciones
-                    if avg_hip_angle > self.min_hip_angle_in_down + 5: 
-
-                        self.stage = "transition"
-                        print("Transición a TRANSITION desde DOWN.") # Debug
-
-                # Estado TRANSITION: Persona subiendo el peso, desde abajo hasta casi arriba
-                elif self.stage == "transition":
-
-                    # Chequeos de postura CONTINUOS durante la subida
-                    
-                    # FALLO: Rodillas bloqueadas ANTES que la espalda esté recta
-                    # Esto ocurre si el ángulo de la rodilla es casi recto (> knee_lock_threshold)
-                    # Y el torso aún NO está recto (torso_angle < torso_straight_threshold_up - un margen)
-                    if avg_knee_angle > self.knee_lock_threshold and \
-                       torso_angle < self.torso_straight_threshold_up - 10: 
-                        
-                        if self.rep_status == "correct": # Solo marcar como incorrecta si no lo estaba ya
-
-                            self.rep_status = "incorrect"
-                            print("TRANSITION: Rodillas bloqueadas prematuramente (antes que la espalda).") # Debug
+        # Extraer una sola vez los landmarks del fotograma al array (33, 4) preasignado (None si no hay pose)
+        landmarks = self.landmarks.update(results)
 
-                    # FALLO: Espalda redondeada durante la subida
-                    if torso_angle < self.torso_rounded_threshold:
+        # Angulos (torso, caderas y rodillas), fases de la repeticion y contadores segun las reglas del ejercicio
+        metrics, export_labels, logs = self.rules.step(landmarks)
+        for message in logs:
 
-                        if self.rep_status == "correct":
+            print(message) # Debug
 
-                            self.rep_status = "incorrect"
-                            print("TRANSITION: Torso redondeado durante la subida.") # Debug
-    
-
-                    # Transición de TRANSITION a UP: La cadera ha alcanzado la extensión completa
-                    if avg_hip_angle > self.hip_angle_threshold_down: 
-
-                        self.stage = "up"
-                        print(f"Transición a UP desde TRANSITION") # Debug
-
-                        # Evaluación final de la repetición al llegar a la cima
-                        # Si la rep_status es 'correct' hasta ahora Y la postura final es buena
-                        if self.rep_status == "correct":
-                            
-                            self.correct_reps += 1
-                            self.state = "correct_rep"
-                            print(f"¡Repetición CORRECTA! Total correctas: {self.correct_reps}")
-                        else:
-
-                            self.incorrect_reps += 1
-                            self.state = "incorrect_rep"
-                            print(f"¡Repetición INCORRECTA! Total incorrectas: {self.incorrect_reps}")
-                            
-                        self.rep_status = "unknown" # Resetear el estado para la siguiente repetición
-
-                # Estado UP: Persona ha completado la repetición y está de pie
-                elif self.stage == "up":
-
-                    # Permanecemos en "up" un momento y luego volvemos a "initial" si la persona se mantiene erguida.
-                    # Esto permite un pequeño margen para estabilizarse antes de la siguiente repetición.
-                    # Si el ángulo de cadera permanece extendido (por encima del umbral de "arriba" - un pequeño buffer)
-                    # Y no hay ninguna señal de volver a bajar (no queremos transicionar a "initial" si está empezando a bajar de nuevo)
-                    if avg_hip_angle > self.hip_angle_threshold_down - 5: 
-
-                        self.stage = "initial"
-                        print("Volviendo a INITIAL desde UP.") # Debug
-
-
-                # Exportamos landmarks para los estados relevantes de la repetición
-                if self.stage in ["down", "transition", "up", "correct_rep","incorrect_rep"]:
+        try:
+            if landmarks is not None:
 
-                    self._export_landmark(results, self.stage) 
-                    
-                else:
+                # Exportamos landmarks para las fases activas de la repetición
+                for label in export_labels:
 
-                    self.current_action_for_export = None # No exportar si no estamos en una fase de repetición activa
+                    self._export_landmark(results, label)
 
+                # Coordenadas (x, y) para situar los textos de los angulos
+                left_hip = landmarks[LEFT_HIP, :2]
+                right_hip = landmarks[RIGHT_HIP, :2]
+                left_knee = landmarks[LEFT_KNEE, :2]
+                right_knee = landmarks[RIGHT_KNEE, :2]
+                mid_hip = (left_hip + right_hip) / 2
 
                 # Visualizar los angulos en la imagen
-                cv2.putText(image, f"L-Hip: {int(left_hip_angle)}",
-                                tuple(np.multiply(left_hip, [image.shape[1], image.shape[0]]).astype(int)),
+                cv2.putText(image, f"L-Hip: {metrics['left_hip_angle']}",
+                                self.landmarks.pixel(left_hip, image.shape[1], image.shape[0]),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-                cv2.putText(image, f"R-Hip: {int(right_hip_angle)}",
-                                tuple(np.multiply(right_hip, [image.shape[1], image.shape[0]]).astype(int)),
+                cv2.putText(image, f"R-Hip: {metrics['right_hip_angle']}",
+                                self.landmarks.pixel(right_hip, image.shape[1], image.shape[0]),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
                 
-                cv2.putText(image, f"L-Knee: {int(left_knee_angle)}",
-                                tuple(np.multiply(left_knee, [image.shape[1], image.shape[0]]).astype(int)),
+                cv2.putText(image, f"L-Knee: {metrics['left_knee_angle']}",
+                                self.landmarks.pixel(left_knee, image.shape[1], image.shape[0]),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-                cv2.putText(image, f"R-Knee: {int(right_knee_angle)}",
-                                tuple(np.multiply(right_knee, [image.shape[1], image.shape[0]]).astype(int)),
+                cv2.putText(image, f"R-Knee: {metrics['right_knee_angle']}",
+                                self.landmarks.pixel(right_knee, image.shape[1], image.shape[0]),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
                 
-                cv2.putText(image, f"Torso: {int(torso_angle)}",
-                                tuple(np.multiply(mid_hip, [image.shape[1], image.shape[0]]).astype(int)),
+                cv2.putText(image, f"Torso: {metrics['torso_angle']}",
+                                self.landmarks.pixel(mid_hip, image.shape[1], image.shape[0]),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
 
 
@@ -314,31 +145,23 @@ class DeadliftDetector:
 
 
 
-        # Retorna el fotograma procesado y los datos del ejercicio para ser enviados por Flask 
-        return image, { 
-            'correct_reps': self.correct_reps, 
-            'incorrect_reps': self.incorrect_reps, 
-            'stage': self.stage, 
-            'csv_stage': self.stage, # Ahora current_action_for_export se basa directamente en self.stage
-            'left_hip_angle': int(left_hip_angle), 
-            'right_hip_angle': int(right_hip_angle),
-            'left_knee_angle': int(left_knee_angle), 
-            'right_knee_angle': int(right_knee_angle), 
-            'torso_angle': int(torso_angle) 
-        }
+        # Retorna el fotograma procesado y los datos del ejercicio para ser enviados por Flask
+        return image, metrics
 
     def reset_counters(self):
         """
         Reinicia los contadores y el estado del detector de peso muerto.
         """
-        self.correct_reps = 0 
-        self.incorrect_reps = 0 
-        self.stage = "initial" 
-        self.current_action_for_export = None
-        self.rep_status = "unknown" 
-        self.min_hip_angle_in_down = 180 # Reiniciar también el ángulo mínimo de cadera
+        self.rules.reset()
         print("Contadores del detector de Peso Muerto reseteados.")
 
+    def close(self):
+        """
+        Libera el grafo de MediaPipe Pose del detector de peso muerto.
+        """
+        if getattr(self, 'pose_model', None) is not None:
+            self.pose_model.close()
+            self.pose_model = None
+
     def __del__(self):
-        if hasattr(self, 'pose_model'):
-            self.pose_model.close()
\ No newline at end of file
+        self.close()
\ No newline at end of file
@@ -0,0 +1,443 @@
+import threading
+import time
+
+import cv2
+
+from utils.detector_factory import DETECTOR_CLASSES, DetectorPool, create_detector, close_detector, detector_pose_model, set_detector_output
+from utils.inference_scheduler import AdaptiveInferenceScheduler, LandmarkInterpolator, LandmarkRecorder, draw_cached_pose
+from utils.landmark_dataset import get_dataset
+from utils.landmark_writer import flush_landmarks
+from utils.live_classifier import LiveFormClassifier
+from utils.mjpeg_broadcaster import FrameBroadcaster
+from utils.video_capture import LatestFrameCapture
+
+
+DEFAULT_SESSION_ID = "default"
+
+
+class PipelineSession:
+    """
+    Pipeline de deteccion en vivo de una estacion (una camara y un atleta).
+
+    Cada sesion tiene su propia fuente de captura, su propia instancia de detector,
+    su ranura de fotograma/difusor MJPEG y sus metricas, de modo que un mismo
+    servidor puede atender varias estaciones a la vez.
+
+    Si se indica un 'inference_pool', la inferencia de pose del detector se delega en
+    los procesos del pool en lugar de ejecutarse en el proceso de Flask.
+
+    Con 'inference_hz' > 0 la deteccion de pose se ejecuta a esa frecuencia objetivo
+    (adaptada al tiempo de inferencia medido) y los fotogramas intermedios reutilizan
+    los landmarks interpolados de las ultimas inferencias para el dibujo.
+
+    Si se indica un 'detector_pool', el detector se toma de el al arrancar y se
+    devuelve al terminar, en lugar de crearse y cerrarse en cada sesion.
+
+    Los landmarks exportados durante la sesion se escriben en un segmento propio del
+    dataset del ejercicio (ver 'LandmarkDataset'), que se cierra al terminar.
+
+    Con 'model_path' los landmarks de cada fotograma se clasifican ademas con el modelo
+    entrenado del ejercicio (ver 'LiveFormClassifier') y su prediccion suavizada se
+    añade a las metricas.
+    """
+
+    def __init__(self, session_id, exercise_type, camera_id=0, inference_pool=None, inference_hz=0, detector_pool=None,
+                 model_path=None):
+
+        self.session_id = session_id
+        self.exercise_type = exercise_type
+        self.camera_id = camera_id
+        self.inference_pool = inference_pool
+        self.inference_hz = inference_hz
+        self.detector_pool = detector_pool
+        self.scheduler = None
+        self._pose_recorder = None
+        self.dataset = None
+        self.segment_path = None
+        self.model_path = model_path
+        self.classifier = None
+
+        self.capture = None
+        self.detector = None
+        self.broadcaster = FrameBroadcaster()
+
+        self.processing_active = False
+        self.paused = False
+        self._thread = None
+
+        self._data_lock = threading.Lock()
+        self._exercise_data = {
+            "reps": 0,
+            "incorrect_reps": 0,
+            "stage": "Inicializando..." # Estado inicial mientras la cámara se abre
+        }
+
+    # CICLO DE VIDA
+    def start(self):
+        """
+        Arranca el procesamiento de la sesion en un hilo daemon.
+        """
+        self.processing_active = True
+        self._thread = threading.Thread(target=self._run, name=f"session-{self.session_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """
+        Detiene el procesamiento, libera la camara y termina los streams de los clientes.
+        """
+        was_active = self.processing_active
+        self.processing_active = False
+        self.paused = False
+
+        # Liberar la captura desbloquea al hilo de procesamiento si está esperando un fotograma
+        if self.capture is not None:
+
+            self.capture.release()
+        self.broadcaster.close()
+
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+
+            thread.join(timeout=timeout)
+
+        # Si el hilo sigue dentro de process_frame, es él quien libera el detector al salir
+        if thread is None or not thread.is_alive():
+
+            self._release_resources()
+        self.set_exercise_data({
+            "reps": 0,
+            "incorrect_reps": 0,
+            "stage": "Detenido" # Estado al detener
+        })
+        return was_active
+
+    def _release_resources(self):
+
+        if self.capture is not None:
+
+            print(f"[{self.session_id}] Liberando recursos de la cámara...")
+            self.capture.release()
+        self.capture = None
+
+        if self.segment_path is not None:
+
+            # Escribir las filas pendientes del segmento antes de cerrarlo
+            flush_landmarks()
+            self.dataset.close_segment(self.segment_path)
+        self.segment_path = None
+
+        if self.classifier is not None:
+
+            self.classifier.close()
+        self.classifier = None
+
+        if self.detector is not None:
+
+            if self.detector_pool is not None:
+
+                self.detector_pool.release(self.detector)
+            else:
+
+                close_detector(self.detector)
+        self.detector = None
+
+    def _run(self):
+
+        if self.exercise_type not in DETECTOR_CLASSES:
+
+            print(f"[{self.session_id}] Error: Detector '{self.exercise_type}' no encontrado. No se iniciará la detección de pose para este tipo de ejercicio.")
+            self.processing_active = False
+            self.set_exercise_data({"reps": 0, "incorrect_reps": 0, "stage": "ERROR: Ejercicio no válido"})
+            return
+
+        if self.detector_pool is not None:
+
+            # El pool crea los objetos de pose con 'build_pose_model' (con LandmarkRecorder si inference_hz > 0)
+            self.detector = self.detector_pool.acquire(self.exercise_type)
+        else:
+
+            self.detector = create_detector(self.exercise_type, pose_model=build_pose_model(self.inference_pool, self.inference_hz))
+
+        # Cada sesión añade sus landmarks a un segmento nuevo del dataset, sin tocar los anteriores
+        self.dataset = get_dataset(self.exercise_type)
+        self.segment_path = self.dataset.new_segment(self.session_id)
+        set_detector_output(self.detector, self.segment_path)
+
+        if self.inference_hz > 0:
+
+            # Se guarda el resultado de cada inferencia para redibujarlo en los fotogramas intermedios
+            self._pose_recorder = detector_pose_model(self.detector)
+            self.scheduler = AdaptiveInferenceScheduler(target_hz=self.inference_hz, min_hz=min(10.0, self.inference_hz))
+
+        if self.model_path is not None:
+
+            # El registro carga el modelo una sola vez por proceso y lo comparte entre sesiones del mismo ejercicio
+            try:
+                self.classifier = LiveFormClassifier(self.model_path)
+                print(f"[{self.session_id}] Clasificación en vivo con el modelo '{self.model_path}'.")
+            except ValueError as e:
+
+                print(f"[{self.session_id}] {e}. Se usa solo la evaluación por reglas.")
+        print(f"[{self.session_id}] Iniciando detección para: {self.exercise_type}")
+
+        # La captura se realiza en su propio hilo y solo conserva el fotograma más reciente,
+        # así la latencia queda acotada aunque la detección de pose sea lenta
+        self.capture = LatestFrameCapture(self.camera_id)
+        if not self.capture.start():
+
+            print(f"[{self.session_id}] Error: No se pudo abrir la cámara. Asegúrate de que esté conectada y no esté en uso.")
+            self.processing_active = False
+            self._release_resources()
+            with self._data_lock:
+
+                self._exercise_data["stage"] = "ERROR: Cámara no disponible"
+            return
+
+        print(f"[{self.session_id}] Cámara abierta y procesamiento iniciado.")
+
+        try:
+            self._process_loop()
+        finally:
+
+            print(f"[{self.session_id}] Bucle de procesamiento de video finalizado.")
+            self.broadcaster.close()
+            self._release_resources()
+
+    def _process_loop(self):
+
+        capture = self.capture
+        detector = self.detector
+        scheduler = self.scheduler
+        interpolator = LandmarkInterpolator() if scheduler is not None else None
+        pose_recorder = self._pose_recorder
+        classifier = self.classifier
+
+        while self.processing_active:
+
+            ret, frame = capture.read(timeout=1.0)
+
+            if not ret and not capture.failed:
+
+                # Todavía no hay un fotograma nuevo: volver a comprobar si el procesamiento sigue activo
+                continue
+
+            if not ret:
+
+                if self.processing_active:
+
+                    print(f"[{self.session_id}] Error: No se pudo leer el fotograma. Deteniendo procesamiento.")
+                    with self._data_lock:
+
+                        self._exercise_data["stage"] = "ERROR: Stream de cámara falló"
+                self.processing_active = False
+                break
+
+            paused = self.paused
+            inferred = True
+            if not paused and scheduler is None:
+
+                processed_img, current_exercise_data = detector.process_frame(frame)
+
+            elif not paused:
+
+                now = time.monotonic()
+                if scheduler.should_infer(now):
+
+                    processed_img, current_exercise_data = detector.process_frame(frame)
+                    scheduler.record_inference(time.monotonic() - now, now)
+                    interpolator.update(pose_recorder.last_landmarks, now)
+                    current_exercise_data = dict(current_exercise_data, **scheduler.stats())
+
+                else:
+                    # Fotograma intermedio: se reutilizan los landmarks interpolados y las últimas métricas
+                    inferred = False
+                    processed_img = draw_cached_pose(frame, interpolator.predict(now))
+
+            else:
+                # Si está pausado, se muestra un mensaje sobre el frame original
+                processed_img = frame.copy()
+                cv2.putText(processed_img, 'PAUSADO', (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3, cv2.LINE_AA)
+
+            if classifier is not None and not paused and inferred:
+
+                # El modelo recibe el array de landmarks que el detector ya extrajo en este fotograma
+                landmarks = detector.landmarks
+                classifier.submit(landmarks.array if landmarks.valid else None)
+                current_exercise_data = dict(current_exercise_data, **classifier.metrics())
+                if current_exercise_data["model_label"] is not None:
+
+                    cv2.putText(processed_img, f"Modelo: {current_exercise_data['model_label']} ({current_exercise_data['model_confidence']:.2f})",
+                                (10, processed_img.shape[0] - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2, cv2.LINE_AA)
+
+            # Codificar el fotograma una sola vez y despertar a todos los clientes del stream
+            self.broadcaster.publish(processed_img)
+
+            # Solo actualizar los datos de ejercicio si la detección NO está pausada y hubo inferencia
+            if not paused and inferred:
+
+                current_exercise_data = dict(current_exercise_data)
+                current_exercise_data["dropped_frames"] = capture.dropped_frames
+                self.set_exercise_data(current_exercise_data)
+
+    # ESTADO Y METRICAS
+    def toggle_pause(self):
+        """
+        Alterna la pausa de la deteccion de pose.
+
+        Retorna:
+            bool: El nuevo estado de pausa.
+        """
+        self.paused = not self.paused
+        return self.paused
+
+    def get_exercise_data(self):
+
+        with self._data_lock:
+
+            return dict(self._exercise_data)
+
+    def set_exercise_data(self, data):
+
+        with self._data_lock:
+
+            self._exercise_data = data
+
+    def describe(self):
+        """
+        Resumen de la sesion para listados y depuracion.
+        """
+        description = {
+            "session_id": self.session_id,
+            "exercise_type": self.exercise_type,
+            "camera_id": self.camera_id,
+            "processing_active": self.processing_active,
+            "paused": self.paused,
+        }
+        description.update(self.broadcaster.stats())
+        if self.scheduler is not None:
+
+            description.update(self.scheduler.stats())
+        if self.capture is not None:
+
+            description.update(self.capture.stats())
+        if self.classifier is not None:
+
+            description.update(self.classifier.stats())
+        return description
+
+
+def build_pose_model(inference_pool=None, inference_hz=0):
+    """
+    Crea el objeto de pose de un detector de sesion.
+
+    Retorna None (el detector crea su propio grafo) salvo que haya pool de inferencia
+    o inferencia a frecuencia objetivo, en cuyo caso se envuelve en 'LandmarkRecorder'.
+    """
+    pose_model = inference_pool.create_client() if inference_pool is not None else None
+    if inference_hz > 0:
+
+        pose_model = LandmarkRecorder(pose_model)
+    return pose_model
+
+
+class SessionRegistry:
+    """
+    Registro de sesiones de deteccion activas, indexadas por identificador de sesion.
+
+    Los detectores se crean bajo demanda y se reutilizan entre sesiones mediante un
+    'DetectorPool'; los que quedan inactivos mas de 'detector_idle_timeout' segundos se cierran.
+
+    Con 'model_paths' ({ejercicio: ruta del modelo .pkl}) las sesiones clasifican ademas
+    cada fotograma con el modelo entrenado del ejercicio.
+    """
+
+    def __init__(self, inference_pool=None, inference_hz=0, detector_pool_size=2, detector_idle_timeout=300.0,
+                 model_paths=None):
+
+        self.inference_pool = inference_pool
+        self.inference_hz = inference_hz
+        self.model_paths = model_paths or {}
+        self.detector_pool = DetectorPool(
+            max_idle_per_exercise=detector_pool_size,
+            idle_timeout=detector_idle_timeout,
+            pose_factory=lambda: build_pose_model(inference_pool, inference_hz)
+        )
+        self._sessions = {}
+        self._session_locks = {} # session_id -> lock que serializa arrancar y detener esa sesion
+        self._lock = threading.Lock()
+
+    def _session_lock(self, session_id):
+
+        with self._lock:
+
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    def start(self, session_id, exercise_type, camera_id=0):
+        """
+        Inicia (o reinicia) la sesion indicada con un nuevo ejercicio y camara.
+
+        Arrancar y detener una misma sesion se serializa: dos llamadas simultaneas con el
+        mismo id no pueden dejar arrancada una sesion que ya no esta en el registro.
+        """
+        with self._session_lock(session_id):
+
+            with self._lock:
+
+                previous = self._sessions.get(session_id)
+                session = PipelineSession(session_id, exercise_type, camera_id, self.inference_pool, self.inference_hz,
+                                          detector_pool=self.detector_pool, model_path=self.model_paths.get(exercise_type))
+                self._sessions[session_id] = session
+
+            # Detener la sesion anterior con el mismo id antes de arrancar la nueva
+            if previous is not None and previous.processing_active:
+
+                print(f"[{session_id}] Ya hay un procesamiento activo. Deteniéndolo primero.")
+                previous.stop()
+
+            session.start()
+        return session
+
+    def get(self, session_id):
+
+        with self._lock:
+
+            return self._sessions.get(session_id)
+
+    def stop(self, session_id):
+        """
+        Detiene la sesion indicada.
+
+        Retorna:
+            bool: True si la sesion estaba procesando video.
+        """
+        with self._session_lock(session_id):
+
+            session = self.get(session_id)
+            if session is None:
+
+                return False
+            return session.stop()
+
+    def stop_all(self):
+
+        with self._lock:
+
+            session_ids = list(self._sessions)
+
+        for session_id in session_ids:
+
+            self.stop(session_id)
+
+        # Los detectores en reposo usan clientes del pool de inferencia: cerrarlos antes que el pool
+        self.detector_pool.close()
+        if self.inference_pool is not None:
+
+            self.inference_pool.close()
+
+    def describe(self):
+
+        with self._lock:
+
+            sessions = list(self._sessions.values())
+
+        return [session.describe() for session in sessions]
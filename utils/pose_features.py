@@ -0,0 +1,222 @@
+import argparse
+import time
+
+import numpy as np
+
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from utils.angles import AngleKernel
+from utils.landmark_store import NUM_COORDS
+from utils.pose_landmarks import (
+    LANDMARK_VALUES,
+    LEFT_ANKLE,
+    LEFT_ELBOW,
+    LEFT_HIP,
+    LEFT_KNEE,
+    LEFT_SHOULDER,
+    LEFT_WRIST,
+    NUM_LANDMARKS,
+    RIGHT_ANKLE,
+    RIGHT_ELBOW,
+    RIGHT_HIP,
+    RIGHT_KNEE,
+    RIGHT_SHOULDER,
+    RIGHT_WRIST,
+)
+
+
+# Puntos virtuales (índices 33, 34 y 35): punto medio de los hombros, punto medio de las
+# caderas y un punto por debajo de la cadera para medir el torso con la vertical
+MID_SHOULDER, MID_HIP, HIP_VERTICAL = 33, 34, 35
+VIRTUAL_POINTS = [
+    ({LEFT_SHOULDER: 0.5, RIGHT_SHOULDER: 0.5}, (0.0, 0.0)),
+    ({LEFT_HIP: 0.5, RIGHT_HIP: 0.5}, (0.0, 0.0)),
+    ({LEFT_HIP: 0.5, RIGHT_HIP: 0.5}, (0.0, 0.1)),
+]
+
+# Ángulos articulares (en grados, en 'b'): los mismos que miden los detectores por reglas
+JOINT_ANGLES = {
+    "left_elbow_angle": (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+    "right_elbow_angle": (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+    "left_shoulder_angle": (LEFT_HIP, LEFT_SHOULDER, LEFT_ELBOW),
+    "right_shoulder_angle": (RIGHT_HIP, RIGHT_SHOULDER, RIGHT_ELBOW),
+    "left_hip_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+    "right_hip_angle": (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+    "left_knee_angle": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+    "right_knee_angle": (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+    "left_back_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_ANKLE),
+    "right_back_angle": (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_ANKLE),
+    "torso_angle": (MID_SHOULDER, MID_HIP, HIP_VERTICAL),
+}
+
+# Longitudes de segmentos y anchuras, divididas por la longitud del torso (independientes
+# de la distancia a la cámara)
+LIMB_RATIOS = {
+    "left_upper_arm_ratio": (LEFT_SHOULDER, LEFT_ELBOW),
+    "right_upper_arm_ratio": (RIGHT_SHOULDER, RIGHT_ELBOW),
+    "left_forearm_ratio": (LEFT_ELBOW, LEFT_WRIST),
+    "right_forearm_ratio": (RIGHT_ELBOW, RIGHT_WRIST),
+    "left_thigh_ratio": (LEFT_HIP, LEFT_KNEE),
+    "right_thigh_ratio": (RIGHT_HIP, RIGHT_KNEE),
+    "left_shin_ratio": (LEFT_KNEE, LEFT_ANKLE),
+    "right_shin_ratio": (RIGHT_KNEE, RIGHT_ANKLE),
+    "shoulder_width_ratio": (LEFT_SHOULDER, RIGHT_SHOULDER),
+    "hip_width_ratio": (LEFT_HIP, RIGHT_HIP),
+    "stance_width_ratio": (LEFT_ANKLE, RIGHT_ANKLE),
+    "grip_width_ratio": (LEFT_WRIST, RIGHT_WRIST),
+}
+
+# Alturas relativas (y de 'b' menos y de 'a', positiva si 'a' está por encima), también
+# divididas por la longitud del torso: muñecas sobre los hombros y caderas sobre las rodillas
+RELATIVE_HEIGHTS = {
+    "left_wrist_height": (LEFT_WRIST, LEFT_SHOULDER),
+    "right_wrist_height": (RIGHT_WRIST, RIGHT_SHOULDER),
+    "left_hip_height": (LEFT_HIP, LEFT_KNEE),
+    "right_hip_height": (RIGHT_HIP, RIGHT_KNEE),
+}
+
+# Profundidades relativas (z de 'a' menos z de 'b'): codos adelantados respecto a los
+# hombros (como en el press de hombro) y giro de los hombros respecto a la cámara
+DEPTH_OFFSETS = {
+    "left_elbow_depth": (LEFT_ELBOW, LEFT_SHOULDER),
+    "right_elbow_depth": (RIGHT_ELBOW, RIGHT_SHOULDER),
+    "shoulder_rotation_depth": (LEFT_SHOULDER, RIGHT_SHOULDER),
+}
+
+# Orientación del torso: inclinación con signo respecto a la vertical, inclinación de la
+# línea de hombros y profundidad de los hombros respecto a las caderas
+TORSO_ORIENTATION = ["torso_lean_deg", "shoulder_tilt_deg", "torso_depth"]
+
+FEATURE_NAMES = (list(JOINT_ANGLES) + list(LIMB_RATIOS) + list(RELATIVE_HEIGHTS)
+                 + list(DEPTH_OFFSETS) + TORSO_ORIENTATION)
+NUM_FEATURES = len(FEATURE_NAMES)
+
+_MIN_TORSO = 1e-6 # Evita dividir por cero en filas sin pose (todo ceros)
+
+_kernel = AngleKernel(list(JOINT_ANGLES.values()), VIRTUAL_POINTS)
+_ratio_pairs = np.array(list(LIMB_RATIOS.values()), dtype=np.intp)
+_height_pairs = np.array(list(RELATIVE_HEIGHTS.values()), dtype=np.intp)
+_depth_pairs = np.array(list(DEPTH_OFFSETS.values()), dtype=np.intp)
+
+
+def pose_features(landmarks):
+    """
+    Características de pose invariantes a la posición del atleta en la imagen.
+
+    Acepta un fotograma ((132,) o (33, 4)) o un lote ((n, 132) o (n, 33, 4)) con las
+    columnas [x, y, z, v] de cada landmark, y calcula todo con operaciones vectorizadas
+    sobre el lote: ángulos articulares, longitudes de segmentos normalizadas por el torso,
+    alturas y profundidades relativas y la orientación del torso (ver FEATURE_NAMES).
+
+    :return: Array float64 (NUM_FEATURES,) para un fotograma o (n, NUM_FEATURES) para un lote.
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    if landmarks.shape[-1] == NUM_COORDS:
+
+        landmarks = landmarks.reshape(landmarks.shape[:-1] + (NUM_LANDMARKS, LANDMARK_VALUES))
+    if landmarks.shape[-2:] != (NUM_LANDMARKS, LANDMARK_VALUES):
+
+        raise ValueError(f"Se esperaban landmarks (..., {NUM_COORDS}) o (..., {NUM_LANDMARKS}, {LANDMARK_VALUES}); "
+                         f"forma recibida: {landmarks.shape}")
+
+    xy = _kernel.points(landmarks)
+    z = landmarks[..., 2]
+
+    torso = xy[..., MID_SHOULDER, :] - xy[..., MID_HIP, :]
+    torso_length = np.maximum(np.hypot(torso[..., 0], torso[..., 1]), _MIN_TORSO)[..., None]
+
+    segments = xy[..., _ratio_pairs[:, 0], :] - xy[..., _ratio_pairs[:, 1], :]
+    ratios = np.hypot(segments[..., 0], segments[..., 1]) / torso_length
+    heights = (xy[..., _height_pairs[:, 1], 1] - xy[..., _height_pairs[:, 0], 1]) / torso_length
+    depths = z[..., _depth_pairs[:, 0]] - z[..., _depth_pairs[:, 1]]
+
+    # En la imagen la y crece hacia abajo: el torso vertical es (0, -1)
+    shoulders = xy[..., LEFT_SHOULDER, :] - xy[..., RIGHT_SHOULDER, :]
+    orientation = np.stack([
+        np.degrees(np.arctan2(torso[..., 0], -torso[..., 1])),
+        np.degrees(np.arctan2(shoulders[..., 1], shoulders[..., 0])),
+        (z[..., LEFT_SHOULDER] + z[..., RIGHT_SHOULDER] - z[..., LEFT_HIP] - z[..., RIGHT_HIP]) / 2.0,
+    ], axis=-1)
+
+    return np.concatenate([_kernel(landmarks), ratios, heights, depths, orientation], axis=-1)
+
+
+class PoseFeatures(TransformerMixin, BaseEstimator):
+    """
+    Paso de pipeline de scikit-learn que sustituye las 132 columnas de landmarks por las
+    características de 'pose_features'.
+
+    Va delante del StandardScaler: el pipeline sigue recibiendo las filas del dataset (o
+    de la clasificación en vivo) tal cual, y el clasificador aprende sobre medidas que no
+    dependen de dónde está el atleta, con muchas menos entradas. No tiene parámetros que
+    aprender.
+    """
+
+    def fit(self, X, y=None):
+
+        if hasattr(X, 'columns'):
+
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = NUM_COORDS
+        return self
+
+    def transform(self, X):
+
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != NUM_COORDS:
+
+            raise ValueError(f"Se esperaban {NUM_COORDS} columnas de landmarks y hay {X.shape[-1]}")
+        return pose_features(X)
+
+    def get_feature_names_out(self, input_features=None):
+
+        return np.asarray(FEATURE_NAMES, dtype=object)
+
+
+def benchmark(frames=1000, repeats=5, seed=1234):
+    """
+    Tiempo de extracción por fotograma, fotograma a fotograma y en un solo lote.
+
+    :return: Diccionario con los microsegundos por fotograma de cada modo.
+    """
+    rng = np.random.default_rng(seed)
+    sequence = rng.random((frames, NUM_COORDS), dtype=np.float32)
+
+    def best_of(function):
+
+        timings = []
+        for _ in range(repeats):
+
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    frame_s = best_of(lambda: [pose_features(frame) for frame in sequence])
+    batch_s = best_of(lambda: pose_features(sequence))
+    return {
+        "features": NUM_FEATURES,
+        "frames": frames,
+        "frame_us": round(frame_s / frames * 1e6, 2),
+        "batch_us_per_frame": round(batch_s / frames * 1e6, 3),
+    }
+
+
+def main(argv=None):
+    """
+    Micro-benchmark de la extracción de características.
+
+    Ejemplo:
+        python -m utils.pose_features --frames 2000
+    """
+    parser = argparse.ArgumentParser(description="Benchmark de la extracción vectorizada de características de pose.")
+    parser.add_argument("--frames", type=int, default=1000, help="Fotogramas del lote.")
+    args = parser.parse_args(argv)
+
+    for key, value in benchmark(frames=args.frames).items():
+
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+
+# Numero de landmarks de MediaPipe Pose y valores por landmark (x, y, z, visibility)
+NUM_LANDMARKS = 33
+LANDMARK_VALUES = 4
+
+# Indices de los landmarks que usan los detectores (mismos valores que mp_pose.PoseLandmark),
+# como enteros simples para indexar el array de landmarks sin buscar atributos del enum
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+
+
+class PoseResult:
+    """
+    Resultado de pose con la misma interfaz que el de 'mp_pose.Pose.process'.
+
+    Los detectores solo usan el atributo 'pose_landmarks', por lo que este objeto
+    permite entregarles landmarks calculados fuera de su propio grafo (por ejemplo,
+    en un proceso de inferencia).
+    """
+
+    def __init__(self, pose_landmarks=None, landmarks_array=None):
+
+        self.pose_landmarks = pose_landmarks
+        # Array (33, 4) del que se construyeron los landmarks, para no volver a recorrerlos
+        self.landmarks_array = landmarks_array
+
+
+def landmarks_to_array(pose_landmarks, out=None):
+    """
+    Copia los landmarks de MediaPipe a un array (33, 4) float32 [x, y, z, visibility].
+
+    :param pose_landmarks: 'results.pose_landmarks' de MediaPipe.
+    :param out: Array (33, 4) float32 opcional donde escribir el resultado.
+    :return: El array con los landmarks.
+    """
+    if out is None:
+
+        out = np.empty((NUM_LANDMARKS, LANDMARK_VALUES), dtype=np.float32)
+
+    # Una sola asignación desde una lista de tuplas es más rápida que escribir elemento a elemento
+    out[:] = [(landmark.x, landmark.y, landmark.z, landmark.visibility) for landmark in pose_landmarks.landmark]
+    return out
+
+
+def array_to_landmarks(array):
+    """
+    Construye un 'NormalizedLandmarkList' de MediaPipe a partir de un array (33, 4).
+
+    Es la operacion inversa de 'landmarks_to_array' y permite reutilizar
+    'mp_drawing.draw_landmarks' con landmarks que no vienen de un grafo local.
+    """
+    pose_landmarks = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, visibility in np.asarray(array, dtype=np.float32).tolist():
+
+        pose_landmarks.landmark.add(x=x, y=y, z=z, visibility=visibility)
+    return pose_landmarks
+
+
+class LandmarkBuffer:
+    """
+    Array (33, 4) float32 preasignado con los landmarks del fotograma actual.
+
+    Cada detector llama a 'update' una vez por fotograma; a partir de ahí los angulos,
+    la exportacion al dataset y las posiciones de los textos leen del array, sin volver
+    a recorrer los objetos de MediaPipe ni crear listas nuevas por fotograma.
+    """
+
+    def __init__(self):
+
+        self.array = np.zeros((NUM_LANDMARKS, LANDMARK_VALUES), dtype=np.float32)
+        self.valid = False
+
+    def update(self, results):
+        """
+        Copia al array los landmarks de 'results' (resultado de 'Pose.process').
+
+        Retorna:
+            np.ndarray | None: El array (33, 4), o None si no se detecto pose.
+        """
+        if not results.pose_landmarks:
+
+            self.valid = False
+            return None
+
+        landmarks_array = getattr(results, 'landmarks_array', None)
+        if landmarks_array is not None:
+
+            # Resultado del pool de inferencia: los landmarks ya llegan como array
+            np.copyto(self.array, landmarks_array)
+        else:
+
+            landmarks_to_array(results.pose_landmarks, out=self.array)
+        self.valid = True
+        return self.array
+
+    def export_row(self, label):
+        """
+        Fila del dataset de landmarks: [etiqueta, x1, y1, z1, v1, ...].
+        """
+        row = self.array.ravel().tolist()
+        row.insert(0, label)
+        return row
+
+    def pixel(self, point, width, height):
+        """
+        Convierte un punto normalizado (x, y) en coordenadas de pixel para 'cv2.putText'.
+        """
+        return int(float(point[0]) * width), int(float(point[1]) * height)
@@ -0,0 +1,77 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Listas de pools que registra cada hilo (ver 'track_executors')
+_tracking = threading.local()
+
+
+def spawn_executor(workers, initializer=None, initargs=()):
+    """
+    Pool de procesos para entrenar en paralelo.
+
+    'spawn' evita heredar los hilos del proceso de Flask. Los datos comunes a todas las
+    tareas se envían una sola vez a cada proceso con 'initializer' e 'initargs'.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=initializer, initargs=initargs)
+    for executors in getattr(_tracking, "lists", ()):
+
+        executors.append(executor)
+    return executor
+
+
+def track_executors():
+    """
+    Empieza a registrar los pools que crea este hilo con 'spawn_executor'.
+
+    :return: Lista que se va llenando con los pools creados, hasta 'untrack_executors'.
+    """
+    executors = []
+    _tracking.lists = getattr(_tracking, "lists", ()) + (executors,)
+    return executors
+
+
+def untrack_executors(executors):
+
+    _tracking.lists = tuple(tracked for tracked in getattr(_tracking, "lists", ()) if tracked is not executors)
+
+
+def executor_pids(executors):
+    """
+    PIDs de los procesos de los pools que siguen abiertos.
+    """
+    pids = set()
+    for executor in list(executors):
+
+        try:
+            pids.update(executor._processes or ())
+        except RuntimeError:
+
+            # El pool está arrancando o retirando un proceso en este momento
+            continue
+    return pids
+
+
+def stop_executor(executor, abandon):
+    """
+    Cierra un pool. Con 'abandon', no espera: cancela las tareas en cola y termina los
+    procesos que siguen con una tarea en marcha (un entrenamiento no se puede cancelar).
+    """
+    if executor is None:
+
+        return
+    if not abandon:
+
+        executor.shutdown(wait=True)
+        return
+
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+
+        process.terminate()
+    for process in processes:
+
+        process.join(timeout=1.0)
@@ -0,0 +1,637 @@
+import ast
+import operator
+
+import numpy as np
+
+from utils import pose_landmarks
+from utils.angles import AngleKernel
+
+
+# Clave del entorno con el array (33, k) de landmarks del fotograma en curso
+LANDMARKS_KEY = '_landmarks'
+# Clave del entorno con el indice del fotograma durante la evaluacion por lotes
+FRAME_KEY = '_t'
+
+# Constantes disponibles en todas las reglas: indices de landmarks (LEFT_HIP, ...)
+LANDMARK_CONSTANTS = {
+    name: value for name, value in vars(pose_landmarks).items()
+    if name.isupper() and isinstance(value, int)
+}
+
+_COMPARE_OPS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+}
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+# Coordenada de cada función de acceso a landmarks: x(LEFT_HIP), z(RIGHT_ELBOW), ...
+_COORDINATE_FUNCTIONS = {'x': 0, 'y': 1, 'z': 2, 'v': 3}
+
+
+def slug(text):
+    """
+    Convierte un texto de feedback en etiqueta de dataset ('Caderas se doblan' -> 'caderas_se_doblan').
+    """
+    return str(text).replace(" ", "_").lower()
+
+
+_SCALAR_FUNCTIONS = {
+    'min': min,
+    'max': max,
+    'abs': abs,
+    'int': int,
+    'float': float,
+    'slug': slug,
+}
+
+_VECTOR_FUNCTIONS = {
+    'min': lambda *args: np.minimum.reduce(np.broadcast_arrays(*args)),
+    'max': lambda *args: np.maximum.reduce(np.broadcast_arrays(*args)),
+    'abs': np.abs,
+    'int': lambda value: np.trunc(value).astype(np.int64),
+    'float': lambda value: np.asarray(value, dtype=np.float64),
+}
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+class _Scope:
+    """
+    Nombres que puede usar una regla y su origen (constante, entrada del fotograma o estado).
+    """
+
+    def __init__(self, constants, inputs, state_names, arrays=None):
+
+        self.constants = constants
+        self.inputs = set(inputs)
+        self.names = set(inputs) | set(state_names) | {f"start_{name}" for name in state_names}
+        # Entradas de toda la secuencia (evaluacion por lotes): nombre -> array (T,)
+        self.arrays = arrays
+        self.uses_scalar_inputs = False
+
+
+def _referenced_names(node):
+
+    names = set()
+    functions = set()
+    uses_landmarks = False
+    for child in ast.walk(node):
+
+        if isinstance(child, ast.Call):
+
+            functions.add(id(child.func))
+            if isinstance(child.func, ast.Name) and child.func.id in _COORDINATE_FUNCTIONS:
+
+                uses_landmarks = True
+        elif isinstance(child, ast.Name) and id(child) not in functions:
+
+            names.add(child.id)
+    return names, uses_landmarks
+
+
+def _check_call(node):
+
+    if not isinstance(node.func, ast.Name) or node.keywords:
+
+        raise ValueError("Solo se permiten llamadas simples a funciones conocidas")
+    name = node.func.id
+    if name in _COORDINATE_FUNCTIONS:
+
+        if len(node.args) != 1:
+
+            raise ValueError(f"'{name}()' recibe un único indice de landmark")
+    elif name not in _SCALAR_FUNCTIONS:
+
+        raise ValueError(f"Función desconocida '{name}'")
+    return name
+
+
+def _landmark_index(node, scope):
+
+    value = _vectorize(node, scope) if scope.arrays is not None else _constant_value(node, scope)
+    if not isinstance(value, (int, np.integer)):
+
+        raise ValueError("El indice de landmark debe ser una constante entera")
+    return int(value)
+
+
+def _constant_value(node, scope):
+
+    if isinstance(node, ast.Constant):
+
+        return node.value
+    if isinstance(node, ast.Name) and node.id in scope.constants:
+
+        return scope.constants[node.id]
+    raise ValueError("El indice de landmark debe ser una constante entera")
+
+
+def _vectorize(node, scope):
+    """
+    Evalúa una subexpresión que solo depende de las entradas sobre toda la secuencia, con NumPy.
+    """
+    if isinstance(node, ast.Constant):
+
+        return node.value
+    if isinstance(node, ast.Name):
+
+        if node.id in scope.constants:
+
+            return scope.constants[node.id]
+        return scope.arrays[node.id]
+    if isinstance(node, ast.Tuple):
+
+        return tuple(_vectorize(element, scope) for element in node.elts)
+    if isinstance(node, ast.BoolOp):
+
+        values = [np.asarray(_vectorize(value, scope), dtype=bool) for value in node.values]
+        reduce = np.logical_and.reduce if isinstance(node.op, ast.And) else np.logical_or.reduce
+        return reduce(np.broadcast_arrays(*values))
+    if isinstance(node, ast.UnaryOp):
+
+        operand = _vectorize(node.operand, scope)
+        if isinstance(node.op, ast.Not):
+
+            return np.logical_not(operand)
+        if isinstance(node.op, ast.USub):
+
+            return -np.asarray(operand)
+        raise _NotVectorizable()
+    if isinstance(node, ast.BinOp):
+
+        if type(node.op) not in _BINARY_OPS:
+
+            raise _NotVectorizable()
+        return _BINARY_OPS[type(node.op)](np.asarray(_vectorize(node.left, scope)), _vectorize(node.right, scope))
+    if isinstance(node, ast.Compare):
+
+        result = None
+        left = _vectorize(node.left, scope)
+        for op, comparator in zip(node.ops, node.comparators):
+
+            right = _vectorize(comparator, scope)
+            if isinstance(op, (ast.In, ast.NotIn)):
+
+                value = np.isin(left, list(right), invert=isinstance(op, ast.NotIn))
+            elif type(op) in (ast.Is, ast.IsNot):
+
+                raise _NotVectorizable()
+            else:
+
+                value = _COMPARE_OPS[type(op)](np.asarray(left), right)
+            result = value if result is None else np.logical_and(result, value)
+            left = right
+        return result
+    if isinstance(node, ast.IfExp):
+
+        return np.where(_vectorize(node.test, scope), _vectorize(node.body, scope), _vectorize(node.orelse, scope))
+    if isinstance(node, ast.Call):
+
+        name = _check_call(node)
+        if name in _COORDINATE_FUNCTIONS:
+
+            return scope.arrays[LANDMARKS_KEY][:, _landmark_index(node.args[0], scope), _COORDINATE_FUNCTIONS[name]]
+        if name not in _VECTOR_FUNCTIONS:
+
+            raise _NotVectorizable()
+        return _VECTOR_FUNCTIONS[name](*[_vectorize(arg, scope) for arg in node.args])
+    raise ValueError(f"Construcción no permitida en una regla: {type(node).__name__}")
+
+
+def _compile_node(node, scope):
+    """
+    Compila un nodo del AST a una función f(env) que evalúa la expresión en un fotograma.
+
+    En la evaluación por lotes las subexpresiones que solo dependen de las entradas
+    (angulos, valores derivados, coordenadas) se calculan de una vez para toda la
+    secuencia y la función resultante solo consulta el valor del fotograma en curso.
+    """
+    if scope.arrays is not None and not isinstance(node, ast.Constant):
+
+        names, uses_landmarks = _referenced_names(node)
+        if (names or uses_landmarks) and names <= (scope.inputs | set(scope.constants)):
+
+            try:
+                value = _vectorize(node, scope)
+            except _NotVectorizable:
+
+                value = None
+            else:
+
+                if isinstance(value, np.ndarray) and value.ndim == 1:
+
+                    values = value.tolist()
+                    return lambda env: values[env[FRAME_KEY]]
+                constant = value.item() if isinstance(value, np.generic) else value
+                return lambda env: constant
+
+    if isinstance(node, ast.Constant):
+
+        constant = node.value
+        return lambda env: constant
+
+    if isinstance(node, ast.Name):
+
+        if node.id in scope.constants:
+
+            constant = scope.constants[node.id]
+            return lambda env: constant
+        if node.id not in scope.names:
+
+            raise ValueError(f"Nombre desconocido '{node.id}'")
+        if node.id in scope.inputs:
+
+            scope.uses_scalar_inputs = True
+        return operator.itemgetter(node.id)
+
+    if isinstance(node, ast.Tuple):
+
+        elements = [_compile_node(element, scope) for element in node.elts]
+        return lambda env: tuple(element(env) for element in elements)
+
+    if isinstance(node, ast.BoolOp):
+
+        values = [_compile_node(value, scope) for value in node.values]
+        if isinstance(node.op, ast.And):
+
+            def evaluate_and(env):
+
+                result = True
+                for value in values:
+
+                    result = value(env)
+                    if not result:
+
+                        return result
+                return result
+            return evaluate_and
+
+        def evaluate_or(env):
+
+            result = False
+            for value in values:
+
+                result = value(env)
+                if result:
+
+                    return result
+            return result
+        return evaluate_or
+
+    if isinstance(node, ast.UnaryOp):
+
+        operand = _compile_node(node.operand, scope)
+        if isinstance(node.op, ast.Not):
+
+            return lambda env: not operand(env)
+        if isinstance(node.op, ast.USub):
+
+            return lambda env: -operand(env)
+        raise ValueError(f"Operador no permitido en una regla: {type(node.op).__name__}")
+
+    if isinstance(node, ast.BinOp):
+
+        if type(node.op) not in _BINARY_OPS:
+
+            raise ValueError(f"Operador no permitido en una regla: {type(node.op).__name__}")
+        op = _BINARY_OPS[type(node.op)]
+        left = _compile_node(node.left, scope)
+        right = _compile_node(node.right, scope)
+        return lambda env: op(left(env), right(env))
+
+    if isinstance(node, ast.Compare):
+
+        operands = [_compile_node(node.left, scope)] + [_compile_node(comparator, scope) for comparator in node.comparators]
+        ops = [_COMPARE_OPS[type(op)] for op in node.ops]
+        if len(ops) == 1:
+
+            op, left, right = ops[0], operands[0], operands[1]
+            return lambda env: op(left(env), right(env))
+
+        def evaluate_chain(env):
+
+            left = operands[0](env)
+            for op, operand in zip(ops, operands[1:]):
+
+                right = operand(env)
+                if not op(left, right):
+
+                    return False
+                left = right
+            return True
+        return evaluate_chain
+
+    if isinstance(node, ast.IfExp):
+
+        test = _compile_node(node.test, scope)
+        body = _compile_node(node.body, scope)
+        orelse = _compile_node(node.orelse, scope)
+        return lambda env: body(env) if test(env) else orelse(env)
+
+    if isinstance(node, ast.Call):
+
+        name = _check_call(node)
+        if name in _COORDINATE_FUNCTIONS:
+
+            index = _landmark_index(node.args[0], _Scope(scope.constants, (), ()))
+            coordinate = _COORDINATE_FUNCTIONS[name]
+            scope.uses_scalar_inputs = True
+            return lambda env: env[LANDMARKS_KEY][index, coordinate]
+
+        function = _SCALAR_FUNCTIONS[name]
+        args = [_compile_node(arg, scope) for arg in node.args]
+        return lambda env: function(*[arg(env) for arg in args])
+
+    raise ValueError(f"Construcción no permitida en una regla: {type(node).__name__}")
+
+
+def compile_expression(source, scope):
+    """
+    Compila una expresión de regla (sintaxis de Python restringida) a una función f(env).
+    """
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+
+        raise ValueError(f"Expresión de regla no válida '{source}': {e.msg}") from e
+    try:
+        return _compile_node(tree.body, scope)
+    except ValueError as e:
+
+        raise ValueError(f"{e} (en la regla '{source}')") from None
+
+
+class RuleEngine:
+    """
+    Motor que evalúa la especificación declarativa de un ejercicio (ver 'utils.exercise_rules').
+
+    La especificación define como datos los angulos, los valores derivados, los umbrales,
+    las variables de estado y una lista de pasos: cada paso es una cadena if/elif de ramas
+    con una condición ('when'), asignaciones ('set'), la etiqueta a exportar al dataset
+    ('export') y mensajes de depuración ('log'). Las condiciones son expresiones de Python
+    restringidas que se compilan una sola vez a funciones.
+
+    El mismo motor se usa en vivo, fotograma a fotograma ('step'), y por lotes sobre una
+    secuencia de landmarks completa ('evaluate'): en ese caso los angulos y todas las
+    subexpresiones que solo dependen del fotograma se calculan vectorizadas con NumPy
+    y solo la máquina de estados recorre la secuencia.
+    """
+
+    def __init__(self, spec, thresholds=None):
+        """
+        :param spec: Especificación del ejercicio.
+        :param thresholds: Diccionario opcional {umbral: valor} que sustituye a los de la especificación.
+        """
+        self.spec = spec
+        self.name = spec['name']
+
+        unknown = set(thresholds or {}) - set(spec['thresholds'])
+        if unknown:
+
+            raise ValueError(f"Umbrales desconocidos para '{self.name}': {', '.join(sorted(unknown))}")
+        self.thresholds = dict(spec['thresholds'], **(thresholds or {}))
+
+        self.angle_names = list(spec['angles'])
+        self.kernel = AngleKernel([spec['angles'][name] for name in self.angle_names], spec.get('virtual_points', ()))
+        self.derived_names = list(spec.get('derived', {}))
+        self.input_names = self.angle_names + self.derived_names
+        self.state_names = list(spec['state'])
+        self.counters = spec['counters']
+        self.labels = list(spec.get('labels', ()))
+
+        self._constants = dict(LANDMARK_CONSTANTS, **self.thresholds)
+        self._live = self._compile(_Scope(self._constants, self.input_names, self.state_names))
+        self.reset()
+
+    # COMPILACION
+    def _compile(self, scope):
+
+        def compile_branches(steps):
+
+            program = []
+            for branches in steps:
+
+                compiled = []
+                for branch in branches:
+
+                    when = branch.get('when')
+                    compiled.append((
+                        None if when is None else compile_expression(when, scope),
+                        [(name, compile_expression(source, scope)) for name, source in branch.get('set', {}).items()],
+                        None if branch.get('export') is None else compile_expression(branch['export'], scope),
+                        list(branch.get('log', ())),
+                    ))
+                program.append(compiled)
+            return program
+
+        def compile_metrics(metrics):
+
+            return [(name, compile_expression(source, scope)) for name, source in metrics.items()]
+
+        no_pose = self.spec.get('no_pose', {})
+        program = {
+            'steps': compile_branches(self.spec['steps']),
+            'metrics': compile_metrics(self.spec['metrics']),
+            'no_pose_steps': compile_branches(no_pose.get('steps', ())),
+            'no_pose_metrics': compile_metrics(no_pose.get('metrics', self.spec['metrics'])),
+        }
+        if scope.arrays is None:
+
+            # En vivo los valores derivados se calculan fotograma a fotograma, en orden
+            program['derived'] = [(name, compile_expression(self.spec['derived'][name], scope)) for name in self.derived_names]
+        program['uses_scalar_inputs'] = scope.uses_scalar_inputs
+        return program
+
+    # ESTADO
+    def reset(self):
+        """
+        Devuelve las variables de estado a sus valores iniciales.
+        """
+        self._env = dict(self.spec['state'])
+
+    @property
+    def state(self):
+
+        return {name: self._env[name] for name in self.state_names}
+
+    def _snapshot(self, env):
+
+        for name in self.state_names:
+
+            env[f"start_{name}"] = env[name]
+
+    @staticmethod
+    def _run(program, env, exports, logs):
+
+        for branches in program:
+
+            for when, assignments, export, messages in branches:
+
+                if when is not None and not when(env):
+
+                    continue
+
+                # Todas las expresiones de la rama ven el estado previo a sus asignaciones
+                if export is not None:
+
+                    exports.append(export(env))
+                values = [(name, expression(env)) for name, expression in assignments]
+                for name, value in values:
+
+                    env[name] = value
+                for message in messages:
+
+                    logs.append(message.format_map(env))
+                break
+
+    # EVALUACION EN VIVO
+    def step(self, landmarks):
+        """
+        Evalúa un fotograma.
+
+        :param landmarks: Array (33, k) de landmarks, o None si no se detectó pose.
+        :return: (metricas, etiquetas a exportar en orden, mensajes de depuración)
+        """
+        env = self._env
+        self._snapshot(env)
+        exports = []
+        logs = []
+
+        if landmarks is None:
+
+            self._run(self._live['no_pose_steps'], env, exports, logs)
+            metrics = {name: expression(env) for name, expression in self._live['no_pose_metrics']}
+            return metrics, exports, logs
+
+        env[LANDMARKS_KEY] = landmarks
+        for name, value in zip(self.angle_names, self.kernel(landmarks)):
+
+            env[name] = value
+        for name, expression in self._live['derived']:
+
+            env[name] = expression(env)
+
+        self._run(self._live['steps'], env, exports, logs)
+        metrics = {name: expression(env) for name, expression in self._live['metrics']}
+        return metrics, exports, logs
+
+    # EVALUACION POR LOTES
+    def inputs(self, sequence):
+        """
+        Angulos y valores derivados de toda una secuencia (T, 33, k), vectorizados.
+
+        :return: Diccionario {nombre: array (T,)}.
+        """
+        sequence = np.asarray(sequence)
+        arrays = {LANDMARKS_KEY: sequence}
+        angles = self.kernel(sequence).reshape(len(sequence), len(self.angle_names))
+        for i, name in enumerate(self.angle_names):
+
+            arrays[name] = angles[:, i]
+
+        scope = _Scope(self._constants, self.input_names, (), arrays)
+        for name in self.derived_names:
+
+            try:
+                arrays[name] = np.broadcast_to(_vectorize(ast.parse(self.spec['derived'][name], mode='eval').body, scope), len(sequence))
+            except _NotVectorizable:
+
+                raise ValueError(f"El valor derivado '{name}' de '{self.name}' no se puede vectorizar") from None
+            scope.inputs.add(name)
+        return arrays
+
+    def evaluate(self, sequence, valid=None, collect_metrics=False):
+        """
+        Re-evalúa una secuencia completa de landmarks sin reproducir el video.
+
+        Empieza desde el estado inicial y no modifica el estado del motor en vivo.
+
+        :param sequence: Array (T, 33, k) de landmarks.
+        :param valid: Array booleano (T,) con los fotogramas en que hubo pose (por defecto todos).
+        :param collect_metrics: Si es True, incluye las metricas de cada fotograma.
+        :return: Diccionario con las repeticiones contadas, las etiquetas exportadas por fotograma y el estado final.
+        """
+        sequence = np.asarray(sequence)
+        frames = len(sequence)
+        valid = np.ones(frames, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+        if frames and not valid.all():
+
+            # Los fotogramas sin pose no deben contaminar los angulos vectorizados
+            sequence = np.where(valid[:, None, None], sequence, 0.0)
+
+        arrays = self.inputs(sequence)
+        program = self._compile(_Scope(self._constants, self.input_names, self.state_names, arrays))
+        scalar_inputs = [(name, arrays[name].tolist()) for name in self.input_names] if program['uses_scalar_inputs'] else []
+
+        correct_name, incorrect_name = self.counters
+        env = dict(self.spec['state'])
+        exports = []
+        reps = []
+        per_frame_metrics = []
+        valid_list = valid.tolist()
+
+        for t in range(frames):
+
+            env[FRAME_KEY] = t
+            self._snapshot(env)
+            frame_exports = []
+            logs = []
+            if valid_list[t]:
+
+                for name, values in scalar_inputs:
+
+                    env[name] = values[t]
+                env[LANDMARKS_KEY] = sequence[t]
+                self._run(program['steps'], env, frame_exports, logs)
+                metrics = program['metrics']
+            else:
+
+                self._run(program['no_pose_steps'], env, frame_exports, logs)
+                metrics = program['no_pose_metrics']
+
+            exports.extend((t, label) for label in frame_exports)
+            if env[correct_name] != env[f"start_{correct_name}"]:
+
+                reps.append((t, 'correct'))
+            if env[incorrect_name] != env[f"start_{incorrect_name}"]:
+
+                reps.append((t, 'incorrect'))
+            if collect_metrics:
+
+                per_frame_metrics.append({name: expression(env) for name, expression in metrics})
+
+        label_counts = {}
+        for _, label in exports:
+
+            label_counts[label] = label_counts.get(label, 0) + 1
+
+        results = {
+            "exercise": self.name,
+            "frames": frames,
+            "correct_reps": env[correct_name],
+            "incorrect_reps": env[incorrect_name],
+            "reps": reps,
+            "exports": exports,
+            "label_counts": label_counts,
+            "final_state": {name: env[name] for name in self.state_names},
+        }
+        if collect_metrics:
+
+            results["metrics"] = per_frame_metrics
+        return results
@@ -0,0 +1,195 @@
+import collections
+import queue
+import threading
+import time
+import uuid
+
+
+DEFAULT_MAX_FINISHED = 32 # Trabajos terminados que se conservan para consultar su estado
+
+
+class TrainingJob:
+    """
+    Trabajo de entrenamiento en segundo plano y su progreso.
+
+    Estados: 'queued' -> 'running' -> 'success' | 'failed'. La función de entrenamiento
+    informa del progreso llamando a 'progress' con la etapa actual y con el estado de
+    cada modelo candidato.
+    """
+
+    def __init__(self, key):
+
+        self.job_id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.candidates = {}
+        self.results = None
+        self.error = None
+        self.requests = 1 # Peticiones atendidas por este trabajo (las repetidas se unen a él)
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def progress(self, event, **details):
+
+        with self._lock:
+
+            if event == "stage":
+
+                self.stage = details.get("name", self.stage)
+                for algo in details.get("candidates", ()):
+
+                    self.candidates.setdefault(algo, {"status": "pending"})
+            elif event == "candidate":
+
+                algo = details.pop("algo")
+                self.candidates.setdefault(algo, {}).update(details)
+
+    @property
+    def active(self):
+
+        return self.status in ('queued', 'running')
+
+    def snapshot(self):
+        """
+        Estado del trabajo para la API (con los resultados cuando ha terminado).
+        """
+        with self._lock:
+
+            elapsed_end = self.finished or time.time()
+            return {
+                "job_id": self.job_id,
+                "key": self.key,
+                "status": self.status,
+                "stage": self.stage,
+                "candidates": {algo: dict(info) for algo, info in self.candidates.items()},
+                "requests": self.requests,
+                "elapsed_s": round(elapsed_end - (self.started or elapsed_end), 3),
+                "results": self.results,
+                "error": self.error,
+            }
+
+
+class TrainingJobQueue:
+    """
+    Cola de trabajos de entrenamiento atendida por hilos en segundo plano.
+
+    'submit' devuelve el trabajo al momento; la función se ejecuta en un hilo de la cola.
+    Si ya hay un trabajo en cola o en curso con la misma clave (el mismo ejercicio), la
+    petición se une a él en lugar de crear otro: dos clics seguidos entrenan una sola vez.
+    """
+
+    def __init__(self, workers=1, max_finished=DEFAULT_MAX_FINISHED):
+
+        self._queue = queue.Queue()
+        self._jobs = collections.OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+        self.max_finished = max(1, int(max_finished))
+
+        # Estadísticas
+        self.submitted = 0
+        self.coalesced = 0
+
+        self._threads = []
+        for index in range(max(1, int(workers))):
+
+            thread = threading.Thread(target=self._run, name=f"training-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, function, *args, **kwargs):
+        """
+        Encola 'function(*args, progress=job.progress, **kwargs)'.
+
+        :param key: Clave de unión de peticiones (p. ej. el tipo de ejercicio).
+        :return: (trabajo, True si la petición se unió a un trabajo ya activo).
+        """
+        with self._lock:
+
+            job = self._active.get(key)
+            if job is not None and job.active:
+
+                job.requests += 1
+                self.coalesced += 1
+                return job, True
+
+            job = TrainingJob(key)
+            self._jobs[job.job_id] = job
+            self._active[key] = job
+            self.submitted += 1
+            self._trim()
+
+        self._queue.put((job, function, args, kwargs))
+        return job, False
+
+    def _trim(self):
+
+        # Se olvidan los trabajos terminados más antiguos (los activos nunca)
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+
+        with self._lock:
+
+            return self._jobs.get(job_id)
+
+    def _run(self):
+
+        while True:
+
+            item = self._queue.get()
+            if item is None:
+
+                return
+
+            job, function, args, kwargs = item
+            with job._lock:
+
+                job.status = 'running'
+                job.stage = 'starting'
+                job.started = time.time()
+            try:
+                results = function(*args, progress=job.progress, **kwargs)
+                status, error = 'success', None
+            except Exception as e:
+
+                print(f"Error en el trabajo de entrenamiento '{job.key}': {e}")
+                results, status, error = None, 'failed', str(e)
+
+            with self._lock:
+
+                with job._lock:
+
+                    job.results = results
+                    job.error = error
+                    job.status = status
+                    job.stage = 'finished'
+                    job.finished = time.time()
+                if self._active.get(job.key) is job:
+
+                    del self._active[job.key]
+
+    def stats(self):
+
+        with self._lock:
+
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "active": sum(1 for job in self._jobs.values() if job.active),
+            }
+
+    def close(self, timeout=1.0):
+
+        for _ in self._threads:
+
+            self._queue.put(None)
+        for thread in self._threads:
+
+            thread.join(timeout=timeout)
@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+
+from utils.detector_factory import DETECTOR_CLASSES, create_detector, close_detector, detector_has_pose, reset_detector
+
+
+# Claves del diccionario de metricas con los contadores de repeticiones de cada detector
+REP_COUNTER_KEYS = {
+    "squats": ("reps", "incorrect_reps"),
+    "pushups": ("reps", "incorrect_reps"),
+    "shoulder_press": ("reps", "incorrect_reps"),
+    "deadlift": ("correct_reps", "incorrect_reps"),
+}
+
+# Claves de metricas que describen el estado/feedback de la repeticion
+VERDICT_KEYS = ("feedback", "stage", "csv_stage", "current_export_label")
+
+
+def _numeric_metrics(metrics, excluded):
+
+    return {
+        key: value for key, value in metrics.items()
+        if key not in excluded and isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+def analyze_video(video_path, exercise_type, detector=None, max_frames=None):
+    """
+    Analiza un video grabado con el detector del ejercicio, tan rapido como permita la CPU.
+
+    No hay pausas ni codificacion MJPEG: cada fotograma se lee del archivo y pasa por
+    'process_frame'. Cada vez que un contador de repeticiones aumenta se registra una
+    repeticion con su marca de tiempo, los angulos en ese instante, el rango de angulos
+    recorrido durante la repeticion y el veredicto.
+
+    :param video_path: Ruta del video.
+    :param exercise_type: Clave del ejercicio ('squats', 'pushups', 'deadlift', 'shoulder_press').
+    :param detector: Detector a reutilizar (sus contadores se reinician). Si es None se crea uno
+                     temporal cuyos landmarks se exportan a un CSV desechable.
+    :param max_frames: Numero maximo de fotogramas a procesar (None para todo el video).
+    :return: Diccionario con la linea temporal de repeticiones y estadisticas de rendimiento.
+    :raises ValueError: Si el ejercicio no existe o el video no se puede abrir.
+    """
+    if exercise_type not in DETECTOR_CLASSES:
+
+        raise ValueError(f"Tipo de ejercicio no válido: '{exercise_type}'")
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+
+        raise ValueError(f"No se pudo abrir el video '{video_path}'")
+
+    temp_dir = None
+    own_detector = detector is None
+    if own_detector:
+
+        # Los landmarks del analisis offline no se mezclan con los datasets de entrenamiento
+        temp_dir = tempfile.mkdtemp(prefix="video_analysis_")
+        detector = create_detector(exercise_type, csv_path=os.path.join(temp_dir, "landmarks.csv"))
+    else:
+
+        # Reiniciar también el seguimiento del grafo de pose para no arrastrarlo del video anterior
+        reset_detector(detector)
+
+    correct_key, incorrect_key = REP_COUNTER_KEYS[exercise_type]
+    excluded_keys = {correct_key, incorrect_key}
+
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    reps = []
+    angle_ranges = {} # Rango (min, max) de cada angulo durante la repeticion en curso
+    rep_start_s = 0.0
+    last_correct = 0
+    last_incorrect = 0
+    frame_index = 0
+
+    start = time.perf_counter()
+    try:
+        while max_frames is None or frame_index < max_frames:
+
+            ret, frame = cap.read()
+            if not ret:
+
+                break
+
+            if video_fps > 0:
+
+                timestamp_s = frame_index / video_fps
+            else:
+
+                timestamp_s = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+            _, metrics = detector.process_frame(frame)
+            frame_index += 1
+
+            angles = _numeric_metrics(metrics, excluded_keys)
+            # Sin pose, cada ejercicio rellena los angulos con su propio valor (-1 o 0): no cuentan para el rango
+            if detector_has_pose(detector):
+
+                for key, value in angles.items():
+
+                    low, high = angle_ranges.get(key, (value, value))
+                    angle_ranges[key] = (min(low, value), max(high, value))
+
+            correct = metrics.get(correct_key, 0) or 0
+            incorrect = metrics.get(incorrect_key, 0) or 0
+            if correct > last_correct or incorrect > last_incorrect:
+
+                reps.append({
+                    "rep": len(reps) + 1,
+                    "verdict": "correct" if correct > last_correct else "incorrect",
+                    "start_s": round(rep_start_s, 3),
+                    "timestamp_s": round(timestamp_s, 3),
+                    "frame": frame_index - 1,
+                    "feedback": {key: metrics[key] for key in VERDICT_KEYS if key in metrics},
+                    "angles": angles,
+                    "angle_ranges": {key: [low, high] for key, (low, high) in angle_ranges.items()},
+                })
+                angle_ranges = {}
+                rep_start_s = timestamp_s
+                last_correct, last_incorrect = correct, incorrect
+    finally:
+
+        cap.release()
+        if own_detector:
+
+            close_detector(detector)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    processing_s = time.perf_counter() - start
+    return {
+        "video": os.path.basename(video_path),
+        "exercise_type": exercise_type,
+        "correct_reps": last_correct,
+        "incorrect_reps": last_incorrect,
+        "reps": reps,
+        "stats": {
+            "frames": frame_index,
+            "video_fps": round(video_fps, 2),
+            "duration_s": round(frame_index / video_fps, 3) if video_fps > 0 else None,
+            "processing_s": round(processing_s, 3),
+            "processing_fps": round(frame_index / processing_s, 2) if processing_s > 0 else None,
+        },
+    }
+
+
+def main(argv=None):
+    """
+    CLI: analiza un video grabado y escribe la linea temporal de repeticiones en JSON.
+
+    Ejemplo:
+        python -m utils.video_analysis serie.mp4 --exercise squats --output serie.json
+    """
+    parser = argparse.ArgumentParser(description="Análisis offline de una serie grabada.")
+    parser.add_argument("video", help="Ruta del video a analizar.")
+    parser.add_argument("--exercise", required=True, choices=sorted(DETECTOR_CLASSES), help="Tipo de ejercicio.")
+    parser.add_argument("--output", help="Archivo JSON de salida (por defecto se imprime por pantalla).")
+    parser.add_argument("--max-frames", type=int, default=None, help="Procesar como máximo este número de fotogramas.")
+    args = parser.parse_args(argv)
+
+    results = analyze_video(args.video, args.exercise, max_frames=args.max_frames)
+
+    if args.output:
+
+        with open(args.output, "w", encoding="utf-8") as f:
+
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en '{args.output}'.")
+    else:
+
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    stats = results["stats"]
+    print(f"{results['correct_reps']} correctas, {results['incorrect_reps']} incorrectas. "
+          f"{stats['frames']} fotogramas en {stats['processing_s']} s ({stats['processing_fps']} FPS).")
+
+
+if __name__ == "__main__":
+    main()
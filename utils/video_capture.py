@@ -0,0 +1,146 @@
+import threading
+import time
+
+import cv2
+
+
+class LatestFrameCapture:
+    """
+    Captura fotogramas de una fuente de video en un hilo dedicado y guarda solo el mas reciente.
+
+    El hilo de lectura vacia continuamente el buffer interno de OpenCV, de modo que el
+    hilo de procesamiento siempre recibe el ultimo fotograma disponible aunque la
+    deteccion de pose sea lenta. Los fotogramas que se sobrescriben sin haber sido
+    leidos se descartan y se contabilizan en 'dropped_frames'.
+    """
+
+    def __init__(self, source=0):
+
+        self.source = source
+        self.cap = None
+
+        # Ranura del ultimo fotograma capturado
+        self._frame = None
+        self._frame_seq = 0 # Numero de secuencia del ultimo fotograma capturado
+        self._consumed_seq = 0 # Numero de secuencia del ultimo fotograma entregado
+        self._condition = threading.Condition()
+
+        self._running = False
+        self._failed = False
+        self._thread = None
+
+        # Estadisticas
+        self.captured_frames = 0
+        self.dropped_frames = 0
+
+    def start(self):
+        """
+        Abre la fuente de video y arranca el hilo de captura.
+
+        Retorna:
+            bool: True si la fuente se abrio correctamente, False en caso contrario.
+        """
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+
+            self.cap.release()
+            self.cap = None
+            return False
+
+        # Reducir el buffer interno cuando el backend lo permite, para no acumular retraso
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self._running = True
+        self._failed = False
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+        return True
+
+    def _capture_loop(self):
+
+        while self._running:
+
+            ret, frame = self.cap.read()
+
+            with self._condition:
+
+                if not ret:
+
+                    # La camara dejo de entregar fotogramas: despertar al consumidor para que termine
+                    self._failed = True
+                    self._running = False
+                    self._condition.notify_all()
+                    break
+
+                # Si el fotograma anterior no llego a consumirse, se descarta
+                if self._frame_seq > self._consumed_seq:
+
+                    self.dropped_frames += 1
+
+                self._frame = frame
+                self._frame_seq += 1
+                self.captured_frames += 1
+                self._condition.notify_all()
+
+    def read(self, timeout=1.0):
+        """
+        Devuelve el fotograma mas reciente que aun no se haya entregado.
+
+        Bloquea hasta que llegue un fotograma nuevo o se agote el tiempo de espera.
+
+        Retorna:
+            tuple: (ret, frame). ret es False si la captura fallo o se agoto el tiempo.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+
+            while self._frame_seq == self._consumed_seq:
+
+                if self._failed or not self._running:
+
+                    return False, None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+
+                    return False, None
+
+                self._condition.wait(remaining)
+
+            self._consumed_seq = self._frame_seq
+            return True, self._frame
+
+    @property
+    def failed(self):
+
+        return self._failed
+
+    def stats(self):
+        """
+        Devuelve las estadisticas de captura (fotogramas capturados y descartados).
+        """
+        with self._condition:
+
+            return {
+                "captured_frames": self.captured_frames,
+                "dropped_frames": self.dropped_frames,
+            }
+
+    def release(self):
+        """
+        Detiene el hilo de captura y libera la fuente de video.
+        """
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+        if self.cap is not None:
+
+            self.cap.release()
+        self.cap = None
+
+        with self._condition:
+
+            self._condition.notify_all()